@@ -1,78 +1,185 @@
 """
 Script to add sample blog posts and tags to the database.
 Run this after initializing the database to populate it with example content.
-"""
-import database
-
-print("Adding sample blog posts...")
-
-# Create sample posts
-post1_id = database.create_post(
-    "Welcome to My Blog",
-    "This is my first blog post! I'm excited to share my journey learning web development with Flask and Python. Stay tuned for more posts about coding, tutorials, and my projects."
-)
-
-post2_id = database.create_post(
-    "Getting Started with Python",
-    "Python is an amazing programming language for beginners. It has simple syntax and is very powerful. In this post, I'll share some tips for getting started with Python and resources that helped me learn."
-)
-
-post3_id = database.create_post(
-    "Building Web Apps with Flask",
-    "Flask is a lightweight web framework for Python. It's perfect for building small to medium-sized web applications. Today I learned how to set up routes, templates, and connect to a database. It's easier than I thought!"
-)
-
-post4_id = database.create_post(
-    "Understanding Databases",
-    "Databases are essential for storing data in web applications. I've been learning about SQLite, which is great for small projects. It's file-based and doesn't require a separate server. Pretty convenient for development!"
-)
-
-post5_id = database.create_post(
-    "Testing Your Code",
-    "Writing tests is important to make sure your code works correctly. I learned about pytest and how to write unit tests, integration tests, and end-to-end tests. It takes time but it's worth it to catch bugs early."
-)
 
-print("Posts created successfully!")
+With --posts it instead generates a synthetic dataset of that size, with
+Zipf-distributed tags and comments, for load testing:
 
-# Get all posts to add tags
-posts = database.get_all_posts()
-
-# Add tags to posts
-print("Adding tags to posts...")
-
-# Post 1 tags
-database.add_tag_to_post(posts[4]['id'], "introduction")
-database.add_tag_to_post(posts[4]['id'], "personal")
-
-# Post 2 tags
-database.add_tag_to_post(posts[3]['id'], "python")
-database.add_tag_to_post(posts[3]['id'], "tutorial")
-database.add_tag_to_post(posts[3]['id'], "beginner")
-
-# Post 3 tags
-database.add_tag_to_post(posts[2]['id'], "flask")
-database.add_tag_to_post(posts[2]['id'], "python")
-database.add_tag_to_post(posts[2]['id'], "web-development")
-
-# Post 4 tags
-database.add_tag_to_post(posts[1]['id'], "database")
-database.add_tag_to_post(posts[1]['id'], "sqlite")
-database.add_tag_to_post(posts[1]['id'], "tutorial")
+    python add_sample_data.py --posts 10000
+"""
+import argparse
+import itertools
+import random
+from datetime import datetime, timedelta
 
-# Post 5 tags
-database.add_tag_to_post(posts[0]['id'], "testing")
-database.add_tag_to_post(posts[0]['id'], "pytest")
-database.add_tag_to_post(posts[0]['id'], "python")
+import database
+import markup
 
-print("Tags added successfully!")
+WORDS = (
+    "python flask sqlite database web server request response template query "
+    "index cache page post comment tag blog code test deploy worker thread "
+    "performance latency memory disk network api json html route model data "
+    "learning tutorial project release feature bug fix review design simple"
+).split()
 
-# Add some sample comments
-print("Adding sample comments...")
 
-database.create_comment(posts[4]['id'], "John", "Great start!", "Welcome to the blogging world! Looking forward to more posts.")
-database.create_comment(posts[3]['id'], "Sarah", "Very helpful", "Thanks for sharing these Python tips. Really helpful for beginners like me!")
-database.create_comment(posts[2]['id'], "Mike", "Flask is awesome", "I agree, Flask makes web development so much easier. Great post!")
+def add_sample_posts():
+    """Add the five hand-written example posts with tags and comments."""
+    print("Adding sample blog posts...")
 
-print("Comments added successfully!")
-print("\nSample data has been added to the database!")
-print("You can now run the app with: python app.py")
+    # Create sample posts
+    post1_id = database.create_post(
+        "Welcome to My Blog",
+        "This is my first blog post! I'm excited to share my journey learning web development with Flask and Python. Stay tuned for more posts about coding, tutorials, and my projects."
+    )
+
+    post2_id = database.create_post(
+        "Getting Started with Python",
+        "Python is an amazing programming language for beginners. It has simple syntax and is very powerful. In this post, I'll share some tips for getting started with Python and resources that helped me learn."
+    )
+
+    post3_id = database.create_post(
+        "Building Web Apps with Flask",
+        "Flask is a lightweight web framework for Python. It's perfect for building small to medium-sized web applications. Today I learned how to set up routes, templates, and connect to a database. It's easier than I thought!"
+    )
+
+    post4_id = database.create_post(
+        "Understanding Databases",
+        "Databases are essential for storing data in web applications. I've been learning about SQLite, which is great for small projects. It's file-based and doesn't require a separate server. Pretty convenient for development!"
+    )
+
+    post5_id = database.create_post(
+        "Testing Your Code",
+        "Writing tests is important to make sure your code works correctly. I learned about pytest and how to write unit tests, integration tests, and end-to-end tests. It takes time but it's worth it to catch bugs early."
+    )
+
+    print("Posts created successfully!")
+
+    # Add tags to posts
+    print("Adding tags to posts...")
+
+    # Post 1 tags
+    database.add_tag_to_post(post1_id, "introduction")
+    database.add_tag_to_post(post1_id, "personal")
+
+    # Post 2 tags
+    database.add_tag_to_post(post2_id, "python")
+    database.add_tag_to_post(post2_id, "tutorial")
+    database.add_tag_to_post(post2_id, "beginner")
+
+    # Post 3 tags
+    database.add_tag_to_post(post3_id, "flask")
+    database.add_tag_to_post(post3_id, "python")
+    database.add_tag_to_post(post3_id, "web-development")
+
+    # Post 4 tags
+    database.add_tag_to_post(post4_id, "database")
+    database.add_tag_to_post(post4_id, "sqlite")
+    database.add_tag_to_post(post4_id, "tutorial")
+
+    # Post 5 tags
+    database.add_tag_to_post(post5_id, "testing")
+    database.add_tag_to_post(post5_id, "pytest")
+    database.add_tag_to_post(post5_id, "python")
+
+    print("Tags added successfully!")
+
+    # Add some sample comments
+    print("Adding sample comments...")
+
+    database.create_comment(post1_id, "John", "Great start!", "Welcome to the blogging world! Looking forward to more posts.")
+    database.create_comment(post2_id, "Sarah", "Very helpful", "Thanks for sharing these Python tips. Really helpful for beginners like me!")
+    database.create_comment(post3_id, "Mike", "Flask is awesome", "I agree, Flask makes web development so much easier. Great post!")
+
+    print("Comments added successfully!")
+
+
+def zipf_weights(n, s=1.1):
+    """Weights for ranks 1..n of a Zipf distribution with exponent s."""
+    return [1 / rank ** s for rank in range(1, n + 1)]
+
+
+def sentence(rng, words):
+    """A random sentence of the given number of words."""
+    return ' '.join(rng.choices(WORDS, k=words)).capitalize() + '.'
+
+
+def add_synthetic_data(posts, tags=200, comments_per_post=3, max_tags_per_post=5,
+                       seed=0, batch_size=5000):
+    """Insert a synthetic dataset for load testing.
+
+    Tag popularity and the number of comments per post both follow a Zipf
+    distribution, so a few tags and posts are much hotter than the rest.
+    Rows are inserted in large batches, one transaction per batch.
+    Returns the tag names, most popular first.
+    """
+    rng = random.Random(seed)
+    tag_names = [f"tag-{rank}" for rank in range(1, tags + 1)]
+    tag_weights = zipf_weights(tags)
+    start = datetime(2020, 1, 1)
+
+    conn = database.get_db_connection()
+    try:
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO tags (name) VALUES (?)',
+                             [(name,) for name in tag_names])
+        tag_ids = {row['name']: row['id'] for row in conn.execute('SELECT id, name FROM tags')}
+        first_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM posts').fetchone()[0]
+
+        for batch_start in range(0, posts, batch_size):
+            post_rows, tag_rows = [], []
+            for offset in range(batch_start, min(batch_start + batch_size, posts)):
+                post_id = first_id + offset
+                created_at = (start + timedelta(minutes=offset)).strftime('%Y-%m-%d %H:%M:%S')
+                title = sentence(rng, rng.randint(3, 8))[:-1]
+                content = ' '.join(sentence(rng, rng.randint(8, 20))
+                                   for _ in range(rng.randint(3, 12)))
+                excerpt, word_count = database.summarize_content(content)
+                post_rows.append((post_id, title, content, markup.render_markdown(content),
+                                  excerpt, word_count, created_at, created_at))
+                chosen = set(rng.choices(tag_names, tag_weights, k=rng.randint(1, max_tags_per_post)))
+                tag_rows.extend((post_id, tag_ids[name]) for name in chosen)
+            with conn:
+                conn.executemany('INSERT INTO posts (id, title, content, content_html, excerpt, '
+                                 'word_count, created_at, updated_at) '
+                                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', post_rows)
+                conn.executemany('INSERT INTO post_tags (post_id, tag_id) VALUES (?, ?)', tag_rows)
+
+        # Spread comments so a few posts get most of them
+        post_weights = zipf_weights(posts)
+        rng.shuffle(post_weights)
+        cum_weights = list(itertools.accumulate(post_weights))
+        comment_count = posts * comments_per_post
+        for batch_start in range(0, comment_count, batch_size):
+            size = min(batch_size, comment_count - batch_start)
+            targets = rng.choices(range(first_id, first_id + posts), cum_weights=cum_weights, k=size)
+            comment_rows = [(post_id, f"Reader {rng.randint(1, 1000)}", sentence(rng, 3)[:-1],
+                             sentence(rng, rng.randint(5, 25))) for post_id in targets]
+            with conn:
+                conn.executemany('INSERT INTO comments (post_id, author, title, content) '
+                                 'VALUES (?, ?, ?, ?)', comment_rows)
+    finally:
+        conn.close()
+    return tag_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add sample data to the blog database.")
+    parser.add_argument('--posts', type=int, help="generate this many synthetic posts instead")
+    parser.add_argument('--tags', type=int, default=200)
+    parser.add_argument('--comments-per-post', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.posts:
+        print(f"Adding {args.posts} synthetic posts...")
+        add_synthetic_data(args.posts, tags=args.tags,
+                           comments_per_post=args.comments_per_post, seed=args.seed)
+    else:
+        add_sample_posts()
+    print("\nSample data has been added to the database!")
+    print("You can now run the app with: python app.py")
+
+
+if __name__ == '__main__':
+    main()
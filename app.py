@@ -1,58 +1,579 @@
-from flask import Flask, jsonify, request, render_template, redirect, url_for
+import asyncio
+import atexit
+import base64
+import binascii
+import functools
+import hashlib
+import itertools
+import math
+import os
+import time
+from datetime import datetime, timezone
+from flask import Blueprint, Flask, current_app, jsonify, request, render_template, redirect, url_for, g, has_request_context, abort, make_response, stream_with_context, get_template_attribute
+from markupsafe import Markup, escape
+import async_database
 import database
+import markup
+import metrics
+from cache import PageCache
+from feeds import FeedStore
+from ratelimit import AdmissionQueue, RateLimiter, SQLiteBackend
+from related import RelatedIndex
+from tag_index import TagIndex, page_ids
+from views import ViewCounter, decayed_views
 
-app = Flask(__name__)
+# Every route and request hook; create_app() registers them on an app
+bp = Blueprint('blog', __name__)
 
-# Initialize database on first run
-try:
-    database.init_db()
-except:
-    pass
+# Cookie recording when a session last wrote, for READ_YOUR_WRITES
+LAST_WRITE_COOKIE = 'last_write'
 
-@app.route('/')
-def home():
-    """Home page with all blog posts."""
-    posts = database.get_all_posts()
-    # Add tags to each post
+# Pagination settings for listings
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Rows serialized per chunk when streaming JSON responses
+STREAM_CHUNK_ROWS = 200
+
+# Rendered pages for the read routes, dropped when their content changes
+page_cache = PageCache(max_bytes=16 * 1024 * 1024, ttl=60.0)
+
+# Rendered post cards and bodies, keyed by post id and version
+fragment_cache = PageCache(max_bytes=8 * 1024 * 1024, ttl=3600.0)
+
+# Post views, counted in memory and written to post_stats every few seconds
+view_counter = ViewCounter(on_flush=lambda counts: page_cache.invalidate('popular'))
+atexit.register(view_counter.stop)
+
+# Atom feeds and the sitemap, updated by the write routes
+feeds = FeedStore()
+
+# Comment writes: a token bucket per client IP and post, and a bound on
+# writes in flight. Set BLOG_RATE_LIMIT_DB to a file path to share the
+# buckets between worker processes.
+COMMENT_RATE = 5 / 60  # tokens per second
+COMMENT_BURST = 5
+comment_limiter = RateLimiter(
+    COMMENT_RATE, COMMENT_BURST,
+    SQLiteBackend(os.environ['BLOG_RATE_LIMIT_DB']) if os.environ.get('BLOG_RATE_LIMIT_DB') else None)
+comment_admission = AdmissionQueue(max_active=4, max_waiting=32, timeout=2.0)
+
+# Tag -> posts bitmaps for multi-tag pages, updated by the write routes
+tag_index = TagIndex(database.iter_tag_postings)
+
+# Related posts by tag overlap, updated by the write routes along with tag_index
+related_index = RelatedIndex(database.iter_tag_postings)
+
+request_duration = metrics.Histogram(
+    'blog_request_duration_seconds', 'Time to serve a request, by route.',
+    [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5])
+request_db_duration = metrics.Histogram(
+    'blog_request_db_seconds', 'Time spent in SQL per request, by route.',
+    [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1])
+request_queries = metrics.Histogram(
+    'blog_request_queries', 'SQL statements run per request, by route.',
+    [0, 1, 2, 3, 5, 10, 20, 50, 100])
+slow_queries = metrics.Counter(
+    'blog_slow_queries_total', 'Statements slower than SLOW_QUERY_MS, by route.')
+shed_writes = metrics.Counter(
+    'blog_shed_writes_total', 'Writes refused with 429, by route and reason.')
+
+def get_request_connection(read=False):
+    """Return the connection bound to the current request, checking one out if needed.
+
+    With read routing on, reads get a read-only connection of their own,
+    unless this session wrote something the read copy doesn't have yet.
+    """
+    if not has_request_context():
+        return None
+    if read and database.reads_include(request_last_write()):
+        key, pool = 'read_db', database.get_read_pool
+    else:
+        key, pool = 'db', database.get_pool
+    conn = g.get(key)
+    if conn is None:
+        conn = pool().acquire()
+        conn.scoped = True
+        conn.queries = g.get('queries')
+        setattr(g, key, conn)
+    return conn
+
+database.scoped_connection = get_request_connection
+
+def request_last_write():
+    """When this session last wrote, for read-your-writes; None outside a request."""
+    return g.get('last_write') if has_request_context() else None
+
+database.session_last_write = request_last_write
+
+@bp.teardown_app_request
+def release_request_connection(exception):
+    """Give the request's connections back to their pools."""
+    for key in ('db', 'read_db'):
+        conn = g.pop(key, None)
+        if conn is not None:
+            conn.scoped = False
+            conn.close()
+
+@bp.before_app_request
+def bootstrap_schema():
+    """Bring the schema up to date before the first request; later calls cost a set lookup."""
+    database.ensure_schema()
+
+@bp.before_app_request
+def load_last_write():
+    """Remember when this session last wrote, for read-your-writes."""
+    if current_app.config['READ_YOUR_WRITES']:
+        try:
+            g.last_write = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+        except ValueError:
+            g.last_write = None
+
+@bp.after_app_request
+def save_last_write(response):
+    """Stamp sessions that wrote while reads come from a snapshot."""
+    if (current_app.config['READ_YOUR_WRITES'] and database.READ_ROUTING_ENABLED
+            and database.READ_SNAPSHOT_INTERVAL is not None
+            and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400):
+        response.set_cookie(LAST_WRITE_COOKIE, repr(time.time()), httponly=True, samesite='Lax')
+    return response
+
+@bp.before_app_request
+def start_query_profile():
+    """Start recording the request's SQL statements when profiling is on."""
+    if current_app.config['QUERY_PROFILING']:
+        g.queries = []
+        g.request_start = time.perf_counter()
+
+@bp.after_app_request
+def finish_query_profile(response):
+    """Report the request's SQL statements via Server-Timing, logs and /metrics."""
+    queries = g.get('queries')
+    if queries is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    total = time.perf_counter() - g.request_start
+    db_time = sum(query['duration'] for query in queries)
+    
+    request_duration.observe(total, route=route)
+    request_db_duration.observe(db_time, route=route)
+    request_queries.observe(len(queries), route=route)
+    threshold = current_app.config['SLOW_QUERY_MS'] / 1000
+    for query in queries:
+        if query['duration'] >= threshold:
+            slow_queries.inc(route=route)
+            current_app.logger.warning('Slow query (%.1f ms, %d rows) on %s: %s',
+                               query['duration'] * 1000, query['rows'], route,
+                               ' '.join(query['sql'].split()))
+    
+    response.headers.add('Server-Timing', f'db;dur={db_time * 1000:.2f};desc="{len(queries)} queries"')
+    response.headers.add('Server-Timing', f'app;dur={total * 1000:.2f}')
+    if (current_app.config['QUERY_DEBUG_FOOTER'] and response.mimetype == 'text/html'
+            and not response.is_streamed):
+        footer = render_template('query_log.html', queries=queries, db_time=db_time)
+        body = response.get_data(as_text=True)
+        response.set_data(body.replace('</body>', footer + '</body>', 1))
+    return response
+
+def cached_page(group, mimetype='text/html'):
+    """Serve a view from the page cache, keyed by group, path and query string.
+
+    group is a format string filled in with the view arguments, e.g.
+    'post:{post_id}', or a function of them. Under conditional, the key
+    also holds the version it computed, so a page rendered for an older
+    version (e.g. before another worker's write) is never served with a
+    newer ETag. Only successful responses are cached.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            name = group(**kwargs) if callable(group) else group.format(**kwargs)
+            if not database.reads_include(g.get('last_write')):
+                # Pages cached from the read copy may predate this session's write
+                return current_app.ensure_sync(view)(**kwargs)
+            key = (name, (request.path, request.query_string, g.get('page_etag')))
+            body = page_cache.get(key)
+            if body is not None:
+                return current_app.response_class(body, mimetype=mimetype)
+            response = make_response(current_app.ensure_sync(view)(**kwargs))
+            if response.status_code == 200:
+                page_cache.set(key, response.get_data())
+            return response
+        return wrapper
+    return decorator
+
+def too_many_requests(retry_after):
+    """A 429 response asking the client to come back in retry_after seconds."""
+    headers = {'Retry-After': str(max(1, math.ceil(retry_after)))}
+    if request.is_json:
+        return jsonify({"error": "Too many requests"}), 429, headers
+    return "Error: Too many requests, please try again later", 429, headers
+
+def admit_write(limiter, admission):
+    """Refuse a write view's requests with 429 when over the rate limit or the queue is full.
+
+    The limiter is keyed by client IP and the view's post_id.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(post_id):
+            route = request.url_rule.rule
+            retry_after = limiter.hit(f'{request.remote_addr}:{post_id}')
+            if retry_after:
+                shed_writes.inc(route=route, reason='rate_limited')
+                return too_many_requests(retry_after)
+            if not admission.acquire():
+                shed_writes.inc(route=route, reason='overloaded')
+                return too_many_requests(admission.retry_after())
+            try:
+                return view(post_id)
+            finally:
+                admission.release()
+        return wrapper
+    return decorator
+
+def parse_timestamp(value):
+    """Parse a SQLite timestamp, which is stored in UTC."""
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+def conditional(get_version):
+    """Answer conditional GETs with 304 Not Modified before running the view.
+
+    get_version(**view_args) returns a cheap version row with updated_at
+    and last_comment_at fields, or None to skip validation (e.g. a missing
+    post). The strong ETag covers the whole row plus the URL.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            version = get_version(**kwargs)
+            if version is None:
+                return current_app.ensure_sync(view)(**kwargs)
+            tag_source = repr((request.path, request.query_string, request.headers.get('Accept'),
+                               tuple(version[key] for key in version.keys())))
+            etag = hashlib.sha1(tag_source.encode()).hexdigest()
+            g.page_etag = etag  # For cached_page's key
+            timestamps = [parse_timestamp(value) for value in
+                          (version['updated_at'], version['last_comment_at']) if value]
+            last_modified = max(timestamps).replace(microsecond=0) if timestamps else None
+            
+            # If-None-Match takes precedence over If-Modified-Since
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = (last_modified is not None and request.if_modified_since is not None
+                                and last_modified <= request.if_modified_since)
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(current_app.ensure_sync(view)(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
+
+def wants_stream():
+    """Whether the client asked for a streamed response (NDJSON or ?stream=1)."""
+    return wants_ndjson() or request.args.get('stream') == '1'
+
+def wants_ndjson():
+    """Whether the client prefers newline-delimited JSON."""
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+def stream_json(rows, prefix='[', suffix=']'):
+    """Stream dicts as NDJSON or as a JSON array without building the whole list.
+
+    prefix/suffix wrap the array, e.g. to nest it in an object.
+    """
+    dumps = current_app.json.dumps
+    chunks = iter(lambda: list(itertools.islice(rows, STREAM_CHUNK_ROWS)), [])
+    if wants_ndjson():
+        def generate():
+            for chunk in chunks:
+                yield ''.join(dumps(row) + '\n' for row in chunk)
+        mimetype = 'application/x-ndjson'
+    else:
+        def generate():
+            yield prefix
+            separator = ''
+            for chunk in chunks:
+                yield separator + ','.join(dumps(row) for row in chunk)
+                separator = ','
+            yield suffix
+        mimetype = 'application/json'
+    response = current_app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def site_version(**kwargs):
+    """Version for pages listing many posts."""
+    return database.get_site_version()
+
+def post_version(post_id):
+    """Version for pages showing one post and its comments."""
+    return database.get_post_version(post_id)
+
+def post_page_version(post_id):
+    """Version for the post page, which also lists related posts."""
+    version = database.get_post_version(post_id)
+    if version is None:
+        return None
+    return dict(version, related=related_index.version(post_id))
+
+def invalidate_post_pages(post_id, tag_names=()):
+    """Drop cached pages showing a post: the post page, its tag pages and home."""
+    groups = ['home', f'post:{post_id}']
+    groups.extend(f'tag:{name}' for name in tag_names)
+    if tag_names:
+        groups.append('tag-query')
+    page_cache.invalidate(*groups)
+    fragment_cache.invalidate(f'post:{post_id}')
+
+def cached_fragment(macro, post_id, version, *args):
+    """Render a macro from fragments.html, reusing the HTML cached for this post version."""
+    key = (f'post:{post_id}', (macro, version))
+    html = fragment_cache.get(key)
+    if html is None:
+        html = str(get_template_attribute('fragments.html', macro)(*args))
+        fragment_cache.set(key, html)
+    return Markup(html)
+
+@bp.app_template_global()
+def post_card(post):
+    """A post's card in listings; it changes with edits and new comments."""
+    return cached_fragment('post_card', post['id'], (post['updated_at'], post['comment_count']), post)
+
+@bp.app_template_global()
+def post_body(post):
+    """A post's body as HTML, rendered when it was written."""
+    # Posts stored before content_html was backfilled are rendered here
+    html = post['content_html'] or markup.render_markdown(post['content'])
+    return cached_fragment('post_body', post['id'], post['updated_at'], html)
+
+def invalidate_comment_pages(post_id):
+    """Drop cached pages showing a post's comments or its comment count."""
+    tags = database.get_tags_for_post(post_id)
+    invalidate_post_pages(post_id, [tag['name'] for tag in tags])
+
+def tag_cloud(tags):
+    """Return tags as dicts with a 1-5 display size, scaled by log post count."""
+    scale = math.log(max((tag['post_count'] for tag in tags), default=1))
+    cloud = []
+    for tag in tags:
+        tag_dict = dict(tag)
+        tag_dict['size'] = 1 + round(4 * math.log(tag['post_count']) / scale) if scale else 1
+        cloud.append(tag_dict)
+    return cloud
+
+def parse_tag_query(tag_name):
+    """Split a /tag/ path into tag names and a matcher for combining them.
+
+    a+b matches posts with all of the tags and a,b posts with any of them.
+    The matcher is None for a single tag, including names that contain a
+    separator but are tags themselves (like c++).
+    """
+    for separator, match in (('+', tag_index.match_all), (',', tag_index.match_any)):
+        if separator in tag_name and not tag_index.has_tag(tag_name):
+            names = [name.strip() for name in tag_name.split(separator) if name.strip()]
+            return names, match
+    return [tag_name], None
+
+def tag_page_group(tag_name):
+    """Page cache group for a /tag/ page; multi-tag pages share one group."""
+    return 'tag-query' if '+' in tag_name or ',' in tag_name else f'tag:{tag_name}'
+
+def parse_tags(tags):
+    """Split a comma-separated tags field into valid tag names."""
+    tag_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
+    return [tag for tag in tag_list[:10] if len(tag) <= 50]  # Limit count and length
+
+def with_tags(posts):
+    """Return posts as dicts with their tags attached, using one tag query."""
+    tags_by_post = database.get_tags_for_posts([post['id'] for post in posts])
     posts_with_tags = []
     for post in posts:
         post_dict = dict(post)
-        post_dict['tags'] = database.get_tags_for_post(post['id'])
+        post_dict['tags'] = tags_by_post[post['id']]
         posts_with_tags.append(post_dict)
-    return render_template('home.html', posts=posts_with_tags)
+    return posts_with_tags
+
+def encode_cursor(post, key='created_at'):
+    """Encode a post's (created_at, id), or (key, id), as an opaque pagination cursor."""
+    raw = f"{post[key]}|{post['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor back into (created_at, id)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, post_id = raw.rsplit('|', 1)
+        return created_at, int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(400, "Invalid cursor")
+
+def page_args():
+    """Read the limit/cursor query args as (limit, decoded cursor or None)."""
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
 
-@app.route('/api')
+def paginate(fetch, key='created_at'):
+    """Fetch one page using the limit/cursor query args.
+
+    fetch(limit, before) must return rows ordered by (key, id) descending.
+    Returns the page and the cursor for the next one.
+    """
+    limit, before = page_args()
+    # Fetch one extra row to find out whether there is a next page
+    rows = fetch(limit + 1, before)
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1], key) if len(rows) > limit else None
+    return page, next_cursor
+
+def popular_posts(columns=database.SUMMARY_COLUMNS):
+    """Fetch one page of posts by decayed popularity, and the next page's cursor."""
+    def fetch(limit, before):
+        if before is not None:
+            try:
+                before = (float(before[0]), before[1])
+            except ValueError:
+                abort(400, "Invalid cursor")
+        return database.get_popular_posts(limit, before, columns)
+    return paginate(fetch, key='score')
+
+def count_views(view):
+    """Count successful views of a post, including cached and 304 responses."""
+    @functools.wraps(view)
+    def wrapper(post_id):
+        response = make_response(current_app.ensure_sync(view)(post_id=post_id))
+        if response.status_code in (200, 304):
+            view_counter.hit(post_id)
+        return response
+    return wrapper
+
+def comment_threads(roots, replies, limit):
+    """Nest replies under their top-level comments.
+
+    roots holds up to limit + 1 top-level comments, the extra one only
+    showing that there is a next page. Returns the threads and the cursor
+    for the next page.
+    """
+    page = roots[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(roots) > limit else None
+    threads = {root['path']: dict(root, depth=0, replies=[]) for root in page}
+    for reply in replies:
+        thread = threads.get(reply['path'][:database.COMMENT_PATH_WIDTH])
+        if thread is not None:
+            thread['replies'].append(dict(reply, depth=reply['path'].count('/')))
+    return list(threads.values()), next_cursor
+
+@bp.route('/')
+@conditional(site_version)
+@cached_page('home')
+def home():
+    """Home page with all blog posts."""
+    posts, next_cursor = paginate(database.get_all_posts)
+    return render_template('home.html', posts=with_tags(posts), next_cursor=next_cursor)
+
+@bp.route('/api')
 def api_home():
     """API endpoint."""
     return jsonify({"message": "Personal Blog API"})
 
-@app.route('/post/<int:post_id>')
+@bp.route('/popular')
+@cached_page('popular')
+def popular():
+    """Posts with the most recent views, as a decayed view count."""
+    posts, next_cursor = popular_posts()
+    return render_template('popular.html', posts=with_tags(posts), next_cursor=next_cursor)
+
+@bp.route('/api/views')
+def view_stats():
+    """View counter statistics: views written, flushes and views still buffered."""
+    return jsonify(view_counter.stats())
+
+@bp.route('/api/pool')
+def pool_stats():
+    """Connection pool statistics for sizing the pool under load."""
+    return jsonify(database.get_pool().stats())
+
+@bp.route('/metrics')
+def metrics_page():
+    """Per-route request and query histograms in Prometheus text format."""
+    body = metrics.render(request_duration, request_db_duration, request_queries, slow_queries,
+                          shed_writes)
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/cache')
+def cache_stats():
+    """Page cache statistics."""
+    return jsonify(page_cache.stats())
+
+@bp.route('/api/ratelimit')
+def ratelimit_stats():
+    """Comment rate limiter and admission queue counters."""
+    return jsonify({"limiter": comment_limiter.stats(), "admission": comment_admission.stats()})
+
+async def fetch_post_page(post_id, limit, after, related_ids):
+    """Fetch the post page's rows concurrently on the async database workers."""
+    return await asyncio.gather(
+        async_database.get_post_by_id(post_id),
+        async_database.get_tags_for_post(post_id),
+        async_database.get_comment_threads(post_id, limit + 1, after),
+        async_database.get_posts_by_ids(related_ids))
+
+@bp.route('/post/<int:post_id>')
+@count_views
+@conditional(post_page_version)
+@cached_page('post:{post_id}')
 def view_post(post_id):
-    """View a single blog post with comments."""
-    post = database.get_post_by_id(post_id)
+    """View a single blog post with a page of comment threads."""
+    limit, after = page_args()
+    related_ids = [other for other, _ in related_index.related(post_id)]
+    if current_app.config['ASYNC_POST_PAGE']:
+        post, tags, (roots, replies), related = current_app.ensure_sync(fetch_post_page)(
+            post_id, limit, after, related_ids)
+    else:
+        post = database.get_post_by_id(post_id)
+        if post is not None:
+            tags = database.get_tags_for_post(post_id)
+            roots, replies = database.get_comment_threads(post_id, limit + 1, after)
+            related = database.get_posts_by_ids(related_ids)
     if post is None:
         return "Post not found", 404
-    tags = database.get_tags_for_post(post_id)
-    comments = database.get_comments_by_post(post_id)
-    return render_template('post.html', post=post, tags=tags, comments=comments)
+    threads, next_cursor = comment_threads(roots, replies, limit)
+    return render_template('post.html', post=post, tags=tags, threads=threads, related=related,
+                           next_cursor=next_cursor, reply_to=request.args.get('reply_to', type=int))
 
-@app.route('/post/<int:post_id>/comment', methods=['POST'])
+@bp.route('/post/<int:post_id>/comment', methods=['POST'])
+@admit_write(comment_limiter, comment_admission)
 def add_comment(post_id):
     """Add a comment to a post."""
     author = request.form.get('author', '').strip()
     title = request.form.get('title', '').strip()
     content = request.form.get('content', '').strip()
+    parent_id = request.form.get('parent_id', type=int)
     
     # Basic validation
     if author and title and content:
         if len(author) >= 2 and len(author) <= 100:
             if len(title) >= 3 and len(title) <= 200:
                 if len(content) >= 5 and len(content) <= 1000:
-                    database.create_comment(post_id, author, title, content)
+                    try:
+                        database.create_comment(post_id, author, title, content, parent_id)
+                    except ValueError:
+                        return "Error: The comment you replied to was not found", 400
+                    invalidate_comment_pages(post_id)
     
-    return redirect(url_for('view_post', post_id=post_id))
+    return redirect(url_for('blog.view_post', post_id=post_id))
 
-@app.route('/create', methods=['GET', 'POST'])
+@bp.route('/create', methods=['GET', 'POST'])
 def create_post_page():
     """Create a new blog post."""
     if request.method == 'POST':
@@ -68,22 +589,19 @@ def create_post_page():
         if len(title) > 200:
             return "Error: Title is too long (max 200 characters)", 400
         
-        database.create_post(title, content)
-        # Get the last inserted post
-        posts = database.get_all_posts()
-        if posts:
-            post_id = posts[0]['id']
-            # Add tags
-            if tags:
-                tag_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
-                for tag in tag_list[:10]:  # Limit to 10 tags
-                    if len(tag) <= 50:  # Limit tag length
-                        database.add_tag_to_post(post_id, tag)
-            return redirect(url_for('view_post', post_id=post_id))
+        tag_list = parse_tags(tags)
+        post_id = database.create_post_with_tags(title, content, tag_list)
+        tag_index.add(post_id, tag_list)
+        related_index.add(post_id, tag_list)
+        feeds.post_changed(post_id, tag_list)
+        invalidate_post_pages(post_id, tag_list)
+        if tag_list:
+            page_cache.invalidate('tags')
+        return redirect(url_for('blog.view_post', post_id=post_id))
         
     return render_template('post_form.html')
 
-@app.route('/edit/<int:post_id>', methods=['GET', 'POST'])
+@bp.route('/edit/<int:post_id>', methods=['GET', 'POST'])
 def edit_post_page(post_id):
     """Edit an existing blog post."""
     post = database.get_post_by_id(post_id)
@@ -106,16 +624,20 @@ def edit_post_page(post_id):
         # Update post using database function
         database.update_post(post_id, title, content)
         
-        # Remove old tags and add new ones
-        database.remove_post_tags(post_id)
-        
-        if tags:
-            tag_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
-            for tag in tag_list[:10]:  # Limit to 10 tags
-                if len(tag) <= 50:  # Limit tag length
-                    database.add_tag_to_post(post_id, tag)
+        # Swap in the new tags, keeping the ones that didn't change
+        tag_list = parse_tags(tags)
+        old_tags = database.replace_post_tags(post_id, tag_list)
+        tag_index.remove(post_id, set(old_tags) - set(tag_list))
+        tag_index.add(post_id, set(tag_list) - set(old_tags))
+        related_index.remove(post_id, set(old_tags) - set(tag_list))
+        related_index.add(post_id, set(tag_list) - set(old_tags))
+        related_index.touch(post_id)
+        feeds.post_changed(post_id, tag_list, set(old_tags) - set(tag_list))
+        invalidate_post_pages(post_id, set(old_tags) | set(tag_list))
+        if set(old_tags) != set(tag_list):
+            page_cache.invalidate('tags')
         
-        return redirect(url_for('view_post', post_id=post_id))
+        return redirect(url_for('blog.view_post', post_id=post_id))
     
     # Get current tags
     current_tags = database.get_tags_for_post(post_id)
@@ -123,25 +645,186 @@ def edit_post_page(post_id):
     
     return render_template('post_form.html', post=post, tags=tags_string)
 
-@app.route('/tag/<tag_name>')
+@bp.route('/tag/<tag_name>')
+@conditional(site_version)
+@cached_page(tag_page_group)
 def view_tag(tag_name):
-    """View all posts with a specific tag."""
-    posts = database.get_posts_by_tag(tag_name)
-    # Add tags to each post
-    posts_with_tags = []
-    for post in posts:
-        post_dict = dict(post)
-        post_dict['tags'] = database.get_tags_for_post(post['id'])
-        posts_with_tags.append(post_dict)
-    return render_template('tag.html', tag_name=tag_name, posts=posts_with_tags)
+    """View all posts with a specific tag, or with all (a+b) or any (a,b) of several."""
+    names, match = parse_tag_query(tag_name)
+    if match is None:
+        fetch = lambda limit, before: database.get_posts_by_tag(tag_name, limit, before)
+    else:
+        # The index finds the matching ids; SQL only fetches the page,
+        # which is ordered by id rather than created_at
+        bits = match(names)
+        fetch = lambda limit, before: database.get_posts_by_ids(
+            page_ids(bits, limit, before[1] if before else None))
+    posts, next_cursor = paginate(fetch)
+    return render_template('tag.html', tag_name=tag_name, posts=with_tags(posts),
+                           next_cursor=next_cursor)
+
+@bp.route('/tags')
+@conditional(site_version)
+@cached_page('tags')
+def view_tags():
+    """Tag cloud of every tag in use."""
+    return render_template('tags.html', tags=tag_cloud(database.get_tag_stats()))
+
+@bp.route('/api/tags')
+@conditional(site_version)
+@cached_page('tags', mimetype='application/json')
+def tags_api():
+    """Tags in use with their post counts and when they were last used."""
+    return jsonify({
+        "tags": [{
+            "name": tag['name'],
+            "post_count": tag['post_count'],
+            "last_used_at": tag['last_used_at'],
+        } for tag in database.get_tag_stats()],
+    })
+
+@bp.app_template_filter('highlight')
+def highlight(text):
+    """Escape a search snippet and mark up its highlighted terms."""
+    marked = str(escape(text))
+    marked = marked.replace(database.HIGHLIGHT_START, '<mark>').replace(database.HIGHLIGHT_END, '</mark>')
+    return Markup(marked)
 
-@app.route('/posts', methods=['GET'])
+def search_results():
+    """Run the search for the q/limit query args."""
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    return query, database.search(query, limit) if query else []
+
+@bp.route('/search')
+def search_page():
+    """Search posts and comments."""
+    query, results = search_results()
+    return render_template('search.html', query=query, results=results)
+
+def feed_response(document, mimetype):
+    """Serve a pre-serialized feed, answering conditional GETs with 304."""
+    response = current_app.response_class(document.body, mimetype=mimetype)
+    response.set_etag(document.etag)
+    response.last_modified = document.last_modified
+    return response.make_conditional(request)
+
+@bp.app_template_global()
+def site_url():
+    """The base URL feeds link to: SITE_URL, else SERVER_NAME; None if neither is set.
+
+    Never the request's Host header, which clients choose: documents are
+    cached per base URL, so varying it would rebuild them on every request.
+    """
+    config = current_app.config
+    if config['SITE_URL']:
+        return config['SITE_URL']
+    if config['SERVER_NAME']:
+        root = (config['APPLICATION_ROOT'] or '').rstrip('/')
+        return f"{config['PREFERRED_URL_SCHEME']}://{config['SERVER_NAME']}{root}"
+    return None
+
+def requires_site_url(view):
+    """Serve a feed only once the site's own URL is configured."""
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        base_url = site_url()
+        if base_url is None:
+            return "Feeds are off: set SITE_URL (BLOG_SITE_URL) or SERVER_NAME", 404
+        return view(base_url, **kwargs)
+    return wrapper
+
+@bp.route('/feed.xml')
+@requires_site_url
+def feed(base_url):
+    """Atom feed of the newest posts."""
+    return feed_response(feeds.atom(base_url), 'application/atom+xml')
+
+@bp.route('/tag/<tag_name>/feed.xml')
+@requires_site_url
+def tag_feed(base_url, tag_name):
+    """Atom feed of the newest posts with a tag."""
+    document = feeds.atom(base_url, tag_name)
+    if document is None:
+        return "Tag not found", 404
+    return feed_response(document, 'application/atom+xml')
+
+@bp.route('/sitemap.xml')
+@requires_site_url
+def sitemap(base_url):
+    """Sitemap of the home page and the newest posts."""
+    return feed_response(feeds.sitemap(base_url), 'application/xml')
+
+@bp.route('/api/search')
+def search_api():
+    """Search posts and comments, returning highlighted HTML snippets."""
+    query, results = search_results()
+    return jsonify({
+        "query": query,
+        "results": [{
+            "post_id": result['post_id'],
+            "post_title": result['post_title'],
+            "kind": result['kind'],
+            "title": highlight(result['title']),
+            "snippet": highlight(result['snippet']),
+            "rank": result['rank'],
+        } for result in results],
+    })
+
+def listing_version(**kwargs):
+    """Version for /posts; popularity changes with views, which it can't see."""
+    if request.args.get('sort') == 'popular':
+        return None
+    return site_version()
+
+@bp.route('/posts', methods=['GET'])
+@conditional(listing_version)
 def get_posts():
-    """Get all posts."""
-    posts = database.get_all_posts()
-    return jsonify([dict(post) for post in posts])
+    """Get a page of posts, newest first, or most popular first with sort=popular.
+
+    fields=id,title,... limits the columns returned, e.g. to skip content.
+    With Accept: application/x-ndjson or ?stream=1 every post after the
+    cursor is streamed instead of one page.
+    """
+    sort = request.args.get('sort', 'newest')
+    if sort not in ('newest', 'popular'):
+        return jsonify({"error": "sort must be newest or popular"}), 400
+    fields = request.args.get('fields')
+    if fields:
+        columns = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = set(columns) - set(database.POST_COLUMNS)
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+    else:
+        columns = list(database.POST_COLUMNS)
+    # The cursor needs id and created_at even if they aren't returned
+    query_columns = list(dict.fromkeys(columns + ['id', 'created_at']))
+    
+    if sort == 'popular':
+        if wants_stream():
+            return jsonify({"error": "Streaming is only available newest first"}), 400
+        posts, next_cursor = popular_posts(query_columns)
+        return jsonify({
+            "posts": [dict({column: post[column] for column in columns}, views=post['views'],
+                           popularity=round(decayed_views(post['score']), 3)) for post in posts],
+            "next_cursor": next_cursor,
+        })
+    if wants_stream():
+        # Export everything after the cursor, row by row
+        cursor = request.args.get('cursor')
+        before = decode_cursor(cursor) if cursor else None
+        rows = database.iter_posts(before, query_columns)
+        return stream_json(({column: post[column] for column in columns} for post in rows),
+                           prefix='{"posts":[', suffix='],"next_cursor":null}')
+    posts, next_cursor = paginate(
+        lambda limit, before: database.get_all_posts(limit, before, query_columns))
+    return jsonify({
+        "posts": [{column: post[column] for column in columns} for post in posts],
+        "next_cursor": next_cursor,
+    })
 
-@app.route('/posts/<int:post_id>', methods=['GET'])
+@bp.route('/posts/<int:post_id>', methods=['GET'])
+@conditional(post_version)
 def get_post(post_id):
     """Get a single post by ID."""
     post = database.get_post_by_id(post_id)
@@ -149,7 +832,7 @@ def get_post(post_id):
         return jsonify({"error": "Post not found"}), 404
     return jsonify(dict(post))
 
-@app.route('/posts', methods=['POST'])
+@bp.route('/posts', methods=['POST'])
 def create_post():
     """Create a new post."""
     data = request.get_json()
@@ -159,27 +842,106 @@ def create_post():
     if not title or not content:
         return jsonify({"error": "Title and content are required"}), 400
     
-    database.create_post(title, content)
-    return jsonify({"message": "Post created successfully"}), 201
+    post_id = database.create_post(title, content)
+    feeds.post_changed(post_id)
+    page_cache.invalidate('home')
+    return jsonify({"message": "Post created successfully", "id": post_id}), 201
 
-@app.route('/posts/<int:post_id>/comments', methods=['GET'])
+@bp.route('/posts/<int:post_id>/comments', methods=['GET'])
+@conditional(post_version)
 def get_comments(post_id):
     """Get all comments for a post."""
+    if wants_stream():
+        return stream_json(dict(comment) for comment in database.iter_comments_by_post(post_id))
     comments = database.get_comments_by_post(post_id)
     return jsonify([dict(comment) for comment in comments])
 
-@app.route('/posts/<int:post_id>/comments', methods=['POST'])
+@bp.route('/posts/<int:post_id>/comments', methods=['POST'])
+@admit_write(comment_limiter, comment_admission)
 def create_comment(post_id):
     """Create a new comment for a post."""
     data = request.get_json()
     author = data.get('author')
+    title = data.get('title', '')
     content = data.get('content')
+    parent_id = data.get('parent_id')
     
     if not author or not content:
         return jsonify({"error": "Author and content are required"}), 400
+    if parent_id is not None and (not isinstance(parent_id, int) or isinstance(parent_id, bool)):
+        return jsonify({"error": "parent_id must be a comment id or null"}), 400
     
-    database.create_comment(post_id, author, content)
-    return jsonify({"message": "Comment created successfully"}), 201
+    try:
+        comment_id = database.create_comment(post_id, author, title, content, parent_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    invalidate_comment_pages(post_id)
+    return jsonify({"message": "Comment created successfully", "id": comment_id}), 201
+
+@bp.route('/posts/<int:post_id>/threads', methods=['GET'])
+@conditional(post_version)
+def get_comment_threads(post_id):
+    """Get a page of top-level comments, oldest first, each with all of its replies."""
+    limit, after = page_args()
+    roots, replies = database.get_comment_threads(post_id, limit + 1, after)
+    threads, next_cursor = comment_threads(roots, replies, limit)
+    return jsonify({"comments": threads, "next_cursor": next_cursor})
+
+@bp.route('/posts/<int:post_id>/related', methods=['GET'])
+def get_related_posts(post_id):
+    """Get the posts sharing the most tags with a post, by Jaccard similarity."""
+    ranking = related_index.related(post_id)
+    if not ranking and database.get_post_version(post_id) is None:
+        return jsonify({"error": "Post not found"}), 404
+    scores = dict(ranking)
+    posts = database.get_posts_by_ids(list(scores))
+    return jsonify({"related": [dict(post, score=scores[post['id']]) for post in posts]})
+
+@bp.route('/comments/<int:comment_id>/thread', methods=['GET'])
+def get_thread(comment_id):
+    """Get a comment and every reply under it, in thread order."""
+    comments = database.get_thread(comment_id)
+    if not comments:
+        return jsonify({"error": "Comment not found"}), 404
+    return jsonify([dict(comment) for comment in comments])
+
+def create_app(config=None):
+    """Create the blog app.
+
+    Nothing here touches the database, so importing and booting a worker
+    stay fast. The first request brings the schema up to date (see
+    bootstrap_schema). config overrides the defaults below; DATABASE sets
+    the SQLite file.
+    """
+    app = Flask(__name__)
+    app.config['DATABASE'] = database.DATABASE_NAME
+    
+    # Query profiling: records every statement per request for Server-Timing,
+    # the slow query log and /metrics. Off by default; it costs one attribute
+    # check per statement when disabled.
+    app.config['QUERY_PROFILING'] = os.environ.get('BLOG_QUERY_PROFILING') == '1'
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('BLOG_SLOW_QUERY_MS', 100))
+    app.config['QUERY_DEBUG_FOOTER'] = False  # Append the query log to HTML pages
+    
+    # With reads routed to a snapshot (database.READ_SNAPSHOT_INTERVAL), send a
+    # session's reads to the primary until the snapshot includes its last write
+    app.config['READ_YOUR_WRITES'] = True
+    
+    # Fetch the post page's queries concurrently on the async database workers.
+    # Off by default: under load it serves about half the requests per second
+    # of the sync view (see benchmarks/async_views.py)
+    app.config['ASYNC_POST_PAGE'] = os.environ.get('BLOG_ASYNC_POST_PAGE') == '1'
+    
+    # Absolute URL feeds and the sitemap link to. Without it (or SERVER_NAME)
+    # they are off, rather than trusting the Host header clients send
+    app.config['SITE_URL'] = os.environ.get('BLOG_SITE_URL')
+    
+    app.config.from_mapping(config or {})
+    database.DATABASE_NAME = app.config['DATABASE']
+    app.register_blueprint(bp)
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)
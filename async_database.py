@@ -0,0 +1,152 @@
+"""
+Async counterparts of the database module's functions.
+
+Each call runs the blocking function on a bounded thread pool reserved for
+database work, so awaiting several calls at once (e.g. with asyncio.gather)
+runs their queries concurrently. Worker threads draw connections from
+their own pools, sized to the number of workers. They never wait on
+connections held by request threads, which may themselves be waiting on
+the workers. With read routing on, read functions use a read-only pool
+that follows database.get_read_pool(), snapshot included, and are routed
+by the same read-your-writes rule as sync reads.
+
+The iter_* generators hold a connection while they are consumed and have
+no async counterpart.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+MAX_WORKERS = 8
+
+_executor = None
+_pool = None
+_pool_owner = None
+_read_pool = None
+_read_pool_owner = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the thread pool database calls run on, creating it if needed."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix='db-async')
+        return _executor
+
+
+def get_pool():
+    """Return the workers' connection pool, replaced along with database.get_pool()."""
+    global _pool, _pool_owner
+    owner = database.get_pool()
+    with _lock:
+        if _pool is None or _pool_owner is not owner:
+            if _pool is not None:
+                _pool.close()
+            _pool = database.ConnectionPool(owner.database, MAX_WORKERS, database.POOL_TIMEOUT)
+            _pool_owner = owner
+        return _pool
+
+
+def get_read_pool():
+    """Return the workers' read-only pool, replaced along with database.get_read_pool()."""
+    global _read_pool, _read_pool_owner
+    owner = database.get_read_pool()
+    with _lock:
+        if _read_pool is None or _read_pool_owner is not owner:
+            if _read_pool is not None:
+                _read_pool.close()
+            _read_pool = database.ConnectionPool(owner.database, MAX_WORKERS, database.POOL_TIMEOUT,
+                                                 owner.profile, read_only=True)
+            _read_pool_owner = owner
+        return _read_pool
+
+
+def shutdown():
+    """Stop the worker threads and close their connections."""
+    global _executor, _pool, _read_pool
+    with _lock:
+        executor, _executor = _executor, None
+        pools = (_pool, _read_pool)
+        _pool = _read_pool = None
+    if executor is not None:
+        executor.shutdown()
+    for pool in pools:
+        if pool is not None:
+            pool.close()
+
+
+def _call(pool, fn, queries, args, kwargs):
+    conn = pool.acquire()
+    conn.scoped = True
+    conn.queries = queries
+    database.bind_connection(conn)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        database.bind_connection(None)
+        conn.scoped = False
+        conn.close()
+
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking database function on the database thread pool."""
+    return await _run(fn, False, args, kwargs)
+
+
+async def _run(fn, read, args, kwargs):
+    # Routed here, in the caller's thread, where the session's last write is known
+    pool = get_read_pool() if read and database.routes_reads() else get_pool()
+    # Record statements into the current request's query log, if profiling
+    scoped = database.scoped_connection() if database.scoped_connection else None
+    queries = scoped.queries if scoped is not None else None
+    loop = asyncio.get_running_loop()
+    # run_in_executor doesn't carry context variables over, so run in a copy
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), context.run, _call, pool, fn, queries,
+                                      args, kwargs)
+
+
+def _async(fn, read=False):
+    # read marks functions that only use get_read_connection()
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await _run(fn, read, args, kwargs)
+    return wrapper
+
+
+# Posts
+create_post = _async(database.create_post)
+create_post_with_tags = _async(database.create_post_with_tags)
+get_all_posts = _async(database.get_all_posts, read=True)
+get_post_by_id = _async(database.get_post_by_id, read=True)
+get_posts_by_ids = _async(database.get_posts_by_ids, read=True)
+update_post = _async(database.update_post)
+get_site_version = _async(database.get_site_version, read=True)
+get_post_version = _async(database.get_post_version, read=True)
+
+# Comments
+create_comment = _async(database.create_comment)
+get_comments_by_post = _async(database.get_comments_by_post, read=True)
+get_comment_threads = _async(database.get_comment_threads, read=True)
+get_thread = _async(database.get_thread, read=True)
+
+# Tags
+create_tag = _async(database.create_tag)
+get_or_create_tag = _async(database.get_or_create_tag)
+add_tag_to_post = _async(database.add_tag_to_post)
+replace_post_tags = _async(database.replace_post_tags)
+get_tags_for_post = _async(database.get_tags_for_post, read=True)
+get_tags_for_posts = _async(database.get_tags_for_posts, read=True)
+get_posts_by_tag = _async(database.get_posts_by_tag, read=True)
+get_all_tags = _async(database.get_all_tags, read=True)
+get_tag_stats = _async(database.get_tag_stats, read=True)
+remove_post_tags = _async(database.remove_post_tags)
+
+# Search
+search = _async(database.search, read=True)
@@ -0,0 +1,118 @@
+"""
+Benchmark the async post page against the sync one.
+
+Serves /post/<id> from a threaded WSGI server to many concurrent clients
+(200 by default) and reports throughput and latency with ASYNC_POST_PAGE
+off, where the view runs its queries one after another, and on, where it
+fetches the post, tags, comments and related posts concurrently on the
+async database workers. The page cache is off so every request runs its
+queries.
+
+Run with: python -m benchmarks.async_views --posts 10000 --clients 200
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from werkzeug.serving import make_server
+
+import add_sample_data
+import async_database
+import database
+from benchmarks.harness import percentile
+
+
+def drive(base_url, path_for, clients, requests_per_client, seed):
+    """Hit the server from concurrent client threads; return latencies, errors, seconds."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(clients + 1)
+
+    def client(client_seed):
+        rng = random.Random(client_seed)
+        start_gate.wait()
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path_for(rng), timeout=60) as response:
+                    response.read()
+                    failed = response.status >= 500
+            except (urllib.error.URLError, OSError):
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors.append(failed)
+
+    threads = [threading.Thread(target=client, args=(seed + i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    start_gate.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), sum(errors), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=20, help='requests per client')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database.DATABASE_NAME = path
+    database.init_db()
+    blog = None
+    try:
+        add_sample_data.add_synthetic_data(args.posts, seed=args.seed)
+
+        import app as blog
+        blog.page_cache.max_bytes = 0
+
+        server = make_server('127.0.0.1', 0, blog.app.wsgi_app, threaded=True)
+        server.socket.listen(max(args.clients, 128))  # Don't drop connects in a burst
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+        print(f'{args.posts} posts, {args.clients} concurrent clients, '
+              f'{args.requests} requests each, pool size {database.POOL_SIZE}, '
+              f'{async_database.MAX_WORKERS} async workers')
+        print(f'{"view":<6} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+        try:
+            for name, async_page in (('sync', False), ('async', True)):
+                blog.app.config['ASYNC_POST_PAGE'] = async_page
+                latencies, errors, elapsed = drive(
+                    base_url, lambda rng: f'/post/{rng.randint(1, args.posts)}',
+                    args.clients, args.requests, args.seed)
+                print(f'{name:<6} {len(latencies) / elapsed:>8.1f} '
+                      f'{percentile(latencies, 50) * 1000:>8.1f} '
+                      f'{percentile(latencies, 95) * 1000:>8.1f} '
+                      f'{percentile(latencies, 99) * 1000:>8.1f} {errors:>7}')
+        finally:
+            server.shutdown()
+            server_thread.join()
+    finally:
+        if blog is not None:
+            # Write buffered views before the database goes away
+            blog.view_counter.stop()
+        async_database.shutdown()
+        database.close_pool()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark SQL statements, connection checkouts and time per post creation.
+
+Compares the old create flow (create_post, a full get_all_posts() to find
+the new id, then add_tag_to_post() per tag) with create_post_with_tags().
+Each get_db_connection() call used to open a brand new SQLite connection,
+so checkouts equal the connections the old code opened.
+
+Run with: python -m benchmarks.create_post
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import database
+
+TAGS = ['python', 'flask', 'sqlite', 'testing', 'web']
+
+
+def legacy_create(title, content, tags):
+    """The create flow create_post_page() used before."""
+    database.create_post(title, content)
+    post_id = database.get_all_posts()[0]['id']
+    for tag in tags:
+        database.add_tag_to_post(post_id, tag)
+    return post_id
+
+
+def atomic_create(title, content, tags):
+    """The single-transaction create flow."""
+    return database.create_post_with_tags(title, content, tags)
+
+
+def measure(create, creates, existing_posts):
+    """Run creates against a fresh database and return per-create averages."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database.DATABASE_NAME = path
+    database.init_db()
+    conn = database.get_db_connection()
+    with conn:
+        conn.executemany('INSERT INTO posts (title, content) VALUES (?, ?)',
+                         [(f'Existing {i}', 'Existing content') for i in range(existing_posts)])
+    conn.close()
+
+    statements = []
+    original_connect = database.ConnectionPool._connect
+
+    def traced_connect(pool):
+        conn = original_connect(pool)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    database.ConnectionPool._connect = traced_connect
+    try:
+        database.close_pool()
+        pool = database.get_pool()
+        start = time.perf_counter()
+        for i in range(creates):
+            create(f'Post {i}', 'Benchmark content for a new post.', TAGS)
+        elapsed = time.perf_counter() - start
+        checkouts = pool.stats()['checkouts']
+    finally:
+        database.ConnectionPool._connect = original_connect
+        database.close_pool()
+        os.remove(path)
+
+    return {
+        'statements': len(statements) / creates,
+        'connections': checkouts / creates,
+        'ms': elapsed * 1000 / creates,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--creates', type=int, default=200)
+    parser.add_argument('--existing-posts', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f'{args.creates} creates with {len(TAGS)} tags each, '
+          f'{args.existing_posts} existing posts')
+    print(f'{"flow":<10} {"statements":>11} {"connections":>12} {"ms/create":>10}')
+    for name, create in (('before', legacy_create), ('after', atomic_create)):
+        result = measure(create, args.creates, args.existing_posts)
+        print(f'{name:<10} {result["statements"]:>11.1f} {result["connections"]:>12.1f} '
+              f'{result["ms"]:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+"""
+Load-testing harness for the Flask routes and the database layer.
+
+Seeds a synthetic dataset per scale (see add_sample_data.add_synthetic_data),
+then drives every route through the Flask test client and through a
+multi-threaded WSGI server, reporting p50/p95/p99 latency, throughput and
+SQL statements per request as JSON.
+
+Run with:
+    python -m benchmarks.harness --scales 1000,10000 --output results.json
+    python -m benchmarks.harness --compare results.json   # flag regressions
+"""
+import argparse
+import contextvars
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from werkzeug.serving import make_server
+
+import add_sample_data
+import database
+
+SEARCH_WORDS = ['python', 'flask', 'cache', 'latency', 'tutorial']
+
+# (name, method, builder) where builder(ctx, rng) returns (url, form, json)
+ROUTES = [
+    ('home', 'GET', lambda ctx, rng: ('/', None, None)),
+    ('home_page_2', 'GET', lambda ctx, rng: ('/?cursor=' + ctx['second_page_cursor'], None, None)),
+    ('view_post', 'GET', lambda ctx, rng: (f'/post/{ctx["post_id"](rng)}', None, None)),
+    ('view_tag', 'GET', lambda ctx, rng: (f'/tag/{ctx["tag"](rng)}', None, None)),
+    ('search', 'GET', lambda ctx, rng: (f'/search?q={rng.choice(SEARCH_WORDS)}', None, None)),
+    ('api_search', 'GET', lambda ctx, rng: (f'/api/search?q={rng.choice(SEARCH_WORDS)}', None, None)),
+    ('get_posts', 'GET', lambda ctx, rng: ('/posts', None, None)),
+    ('get_post', 'GET', lambda ctx, rng: (f'/posts/{ctx["post_id"](rng)}', None, None)),
+    ('get_comments', 'GET', lambda ctx, rng: (f'/posts/{ctx["post_id"](rng)}/comments', None, None)),
+    ('create_form', 'GET', lambda ctx, rng: ('/create', None, None)),
+    ('edit_form', 'GET', lambda ctx, rng: (f'/edit/{ctx["post_id"](rng)}', None, None)),
+    ('api_home', 'GET', lambda ctx, rng: ('/api', None, None)),
+    ('pool_stats', 'GET', lambda ctx, rng: ('/api/pool', None, None)),
+    ('cache_stats', 'GET', lambda ctx, rng: ('/api/cache', None, None)),
+    # Writes go last so they don't change what the reads above measure
+    ('add_comment', 'POST', lambda ctx, rng: (f'/post/{ctx["post_id"](rng)}/comment', {
+        'author': 'Load Tester', 'title': 'Benchmark', 'content': 'A benchmark comment.'}, None)),
+    ('create_comment', 'POST', lambda ctx, rng: (f'/posts/{ctx["post_id"](rng)}/comments', None, {
+        'author': 'Load Tester', 'title': 'Benchmark', 'content': 'A benchmark comment.'})),
+    ('edit_post', 'POST', lambda ctx, rng: (f'/edit/{ctx["post_id"](rng)}', {
+        'title': 'Edited by benchmark', 'content': 'Edited benchmark content.',
+        'tags': ', '.join(ctx['tag'](rng) for _ in range(3))}, None)),
+    ('create_post_form', 'POST', lambda ctx, rng: ('/create', {
+        'title': 'Benchmark post', 'content': 'Benchmark post content.',
+        'tags': ', '.join(ctx['tag'](rng) for _ in range(3))}, None)),
+    ('create_post', 'POST', lambda ctx, rng: ('/posts', None, {
+        'title': 'Benchmark post', 'content': 'Benchmark post content.'})),
+]
+
+# Metrics compared against a baseline, and whether higher is worse
+COMPARED = {'p95_ms': True, 'queries_per_request': True, 'throughput_rps': False}
+
+# The current request's statements; a context variable rather than a
+# thread-local so statements run on async_database's workers count too
+_statements = contextvars.ContextVar('statements', default=None)
+
+
+def traced_connect(original_connect):
+    """Wrap ConnectionPool._connect to count statements per request."""
+    def connect(pool):
+        conn = original_connect(pool)
+        conn.set_trace_callback(_count_statement)
+        return conn
+    return connect
+
+
+def _count_statement(sql):
+    # Statements run by triggers are reported too; count only top-level ones
+    statements = _statements.get()
+    if statements is not None and not sql.startswith('--'):
+        statements.append(sql)  # Atomic, so concurrent workers don't lose counts
+
+
+def count_queries(wsgi_app):
+    """WSGI middleware that reports the request's statement count in a header."""
+    def middleware(environ, start_response):
+        statements = []
+        token = _statements.set(statements)
+
+        def counting_start_response(status, headers, exc_info=None):
+            headers.append(('X-Query-Count', str(len(statements))))
+            return start_response(status, headers, exc_info)
+        try:
+            # Materialize the body so statements run while rendering are counted
+            body = b''.join(wsgi_app(environ, counting_start_response))
+        finally:
+            _statements.reset(token)
+        return [body]
+    return middleware
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, queries, errors, elapsed):
+    """Summarize one route's samples."""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+    }
+
+
+def run_client(flask_app, ctx, requests, seed):
+    """Drive every route sequentially through the Flask test client."""
+    rng = random.Random(seed)
+    results = {}
+    client = flask_app.test_client()
+    for name, method, build in ROUTES:
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            url, form, body = build(ctx, rng)
+            start = time.perf_counter()
+            response = client.open(url, method=method, data=form, json=body)
+            latencies.append(time.perf_counter() - start)
+            queries.append(int(response.headers.get('X-Query-Count', 0)))
+            errors += response.status_code >= 500
+        results[name] = summarize(latencies, queries, errors, time.perf_counter() - started)
+    return results
+
+
+def run_server(flask_app, ctx, requests, threads, seed):
+    """Drive every route from several client threads against a threaded WSGI server."""
+    server = make_server('127.0.0.1', 0, flask_app.wsgi_app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    opener = urllib.request.build_opener(NoRedirect)
+
+    results = {}
+    try:
+        for name, method, build in ROUTES:
+            latencies, queries, errors = [], [], []
+            lock = threading.Lock()
+
+            def worker(worker_seed, count):
+                rng = random.Random(worker_seed)
+                for _ in range(count):
+                    url, form, body = build(ctx, rng)
+                    data, headers = None, {}
+                    if form is not None:
+                        data = urllib.parse.urlencode(form).encode()
+                    elif body is not None:
+                        data = json.dumps(body).encode()
+                        headers['Content-Type'] = 'application/json'
+                    req = urllib.request.Request(base_url + url, data=data, headers=headers,
+                                                 method=method)
+                    start = time.perf_counter()
+                    try:
+                        with opener.open(req) as response:
+                            response.read()
+                            status, query_count = response.status, response.headers.get('X-Query-Count')
+                    except urllib.error.HTTPError as e:
+                        status, query_count = e.code, e.headers.get('X-Query-Count')
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        queries.append(int(query_count or 0))
+                        errors.append(status >= 500)
+
+            per_thread = [requests // threads + (i < requests % threads) for i in range(threads)]
+            workers = [threading.Thread(target=worker, args=(seed + i, count))
+                       for i, count in enumerate(per_thread)]
+            started = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            results[name] = summarize(latencies, queries, sum(errors),
+                                      time.perf_counter() - started)
+    finally:
+        server.shutdown()
+        server_thread.join()
+    return results
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Measure the POST itself rather than the page it redirects to."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def benchmark_scale(scale, args):
+    """Seed a fresh database of the given size and run both drivers against it."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database.DATABASE_NAME = path
+    database.init_db()
+    blog = None
+    try:
+        seed_start = time.perf_counter()
+        tags = add_sample_data.add_synthetic_data(scale, seed=args.seed)
+        seed_seconds = time.perf_counter() - seed_start
+
+        import app as blog
+        flask_app = blog.app
+        if not args.page_cache:
+            # A cache that can't hold anything, so every request does the real work
+            blog.page_cache.max_bytes = 0
+        blog.page_cache.clear()
+        # Every request comes from one address; measure the writes, not the rate limit
+        blog.comment_limiter.burst = 10 ** 9
+        blog.comment_limiter.reset()
+
+        tag_weights = add_sample_data.zipf_weights(len(tags))
+        second_page = database.get_all_posts(limit=blog.PAGE_SIZE)[-1]
+        ctx = {
+            'post_id': lambda rng: rng.randint(1, scale),
+            'tag': lambda rng: rng.choices(tags, tag_weights)[0],
+            'second_page_cursor': blog.encode_cursor(second_page),
+        }
+
+        original_wsgi_app = flask_app.wsgi_app
+        flask_app.wsgi_app = count_queries(original_wsgi_app)
+        try:
+            print(f'[{scale}] seeded in {seed_seconds:.1f}s, running test client...', file=sys.stderr)
+            client_results = run_client(flask_app, ctx, args.requests, args.seed)
+            print(f'[{scale}] running threaded server with {args.threads} threads...', file=sys.stderr)
+            server_results = run_server(flask_app, ctx, args.requests, args.threads, args.seed)
+        finally:
+            flask_app.wsgi_app = original_wsgi_app
+        return {'seed_seconds': round(seed_seconds, 2),
+                'client': client_results, 'server': server_results}
+    finally:
+        if blog is not None:
+            # Write buffered views before the database goes away
+            blog.view_counter.stop()
+        database.close_pool()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def compare(report, baseline, tolerance):
+    """Return a list of human-readable regressions against a baseline report."""
+    regressions = []
+    for scale, modes in report['results'].items():
+        for mode in ('client', 'server'):
+            for route, metrics in modes[mode].items():
+                base = baseline.get('results', {}).get(scale, {}).get(mode, {}).get(route)
+                if not base:
+                    continue
+                for metric, higher_is_worse in COMPARED.items():
+                    old, new = base.get(metric), metrics.get(metric)
+                    if not old or new is None:
+                        continue
+                    change = (new - old) / old
+                    if (change > tolerance) if higher_is_worse else (change < -tolerance):
+                        regressions.append(f'{scale}/{mode}/{route}: {metric} {old} -> {new} '
+                                           f'({change:+.0%})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', default='1000,10000',
+                        help='comma-separated post counts, e.g. 1000,10000,100000')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--threads', type=int, default=8, help='client threads for the server run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--page-cache', action='store_true',
+                        help='leave the rendered-page cache on (off by default)')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='flag regressions against this report')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative change before flagging a regression')
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    original_connect = database.ConnectionPool._connect
+    database.ConnectionPool._connect = traced_connect(original_connect)
+    try:
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'sqlite': database.sqlite3.sqlite_version,
+                'requests_per_route': args.requests,
+                'threads': args.threads,
+                'page_cache': args.page_cache,
+            },
+            'results': {scale: benchmark_scale(int(scale), args)
+                        for scale in args.scales.split(',')},
+        }
+    finally:
+        database.ConnectionPool._connect = original_connect
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against baseline.', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark template rendering time per request.
+
+Renders the home page with 100 posts (/?limit=100) with the post card
+fragments rendered every time and served from the fragment cache, and a
+post page whose body is rendered from Markdown on every request versus
+served from the HTML stored when the post was written. The page cache is
+off so every request renders its template.
+
+Run with: python -m benchmarks.render --posts 1000 --requests 200
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import add_sample_data
+import database
+import markup
+from benchmarks.harness import percentile
+
+MARKDOWN_SECTION = '''## Section {n}
+
+Some **bold** text, some *emphasis* and a [link](https://example.com/{n}) with `inline code`.
+A second line of the same paragraph, long enough to look like real prose.
+
+- First point
+- Second point with `code`
+- Third point
+
+> A quoted line
+> and its continuation.
+
+```
+def example_{n}():
+    return {n}
+```
+'''
+
+
+def measure(client, url, requests):
+    """GET url repeatedly and return sorted per-request times in seconds."""
+    client.get(url)  # Warm up
+    times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url)
+        times.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return sorted(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--sections', type=int, default=20, help='Markdown sections in the long post')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database.DATABASE_NAME = path
+    database.init_db()
+    blog = None
+    try:
+        add_sample_data.add_synthetic_data(args.posts, seed=args.seed)
+        long_post = database.create_post(
+            'Markdown post', '\n'.join(MARKDOWN_SECTION.format(n=n) for n in range(args.sections)))
+
+        import app as blog
+        blog.page_cache.max_bytes = 0
+        client = blog.app.test_client()
+        stored_body = blog.post_body
+
+        def markdown_per_request(post):
+            return blog.Markup(markup.render_markdown(post['content']))
+
+        cases = [
+            ('home, fragments rendered', '/?limit=100', 0, stored_body),
+            ('home, fragments cached', '/?limit=100', 8 * 1024 * 1024, stored_body),
+            ('post, Markdown per request', f'/post/{long_post}', 0, markdown_per_request),
+            ('post, stored HTML', f'/post/{long_post}', 0, stored_body),
+            ('post, stored HTML cached', f'/post/{long_post}', 8 * 1024 * 1024, stored_body),
+        ]
+        print(f'{args.posts} posts, {args.requests} requests per case, '
+              f'{args.sections} Markdown sections in the post')
+        print(f'{"case":<28} {"mean ms":>8} {"p50 ms":>8} {"p95 ms":>8}')
+        for name, url, fragment_bytes, body in cases:
+            blog.fragment_cache.clear()
+            blog.fragment_cache.max_bytes = fragment_bytes
+            blog.app.jinja_env.globals['post_body'] = body
+            times = measure(client, url, args.requests)
+            print(f'{name:<28} {sum(times) / len(times) * 1000:>8.2f} '
+                  f'{percentile(times, 50) * 1000:>8.2f} {percentile(times, 95) * 1000:>8.2f}')
+    finally:
+        if blog is not None:
+            # Write buffered views before the database goes away
+            blog.view_counter.stop()
+        database.close_pool()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
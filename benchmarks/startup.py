@@ -0,0 +1,94 @@
+"""
+Benchmark worker startup: importing the app through the first request served.
+
+Each run is a fresh Python process, the way a worker boots. It imports
+app (which builds it with create_app()), then serves / through the test
+client, and reports how long each step took. Runs are made against a
+new, empty database file and against one holding --posts posts.
+
+The eager runs also call database.init_db() right after the import, as
+app.py used to on every import: migrations are checked and every post is
+scanned for missing HTML before the app can serve anything.
+
+Run with: python -m benchmarks.startup --posts 10000 --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import add_sample_data
+import database
+from benchmarks.harness import percentile
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import database
+database.DATABASE_NAME = sys.argv[1]
+import app as blog
+imported = time.perf_counter()
+if sys.argv[2] == 'eager':
+    database.init_db()
+booted = time.perf_counter()
+response = blog.app.test_client().get('/')
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+database.close_pool()
+print(json.dumps({'import': imported - start, 'boot': booted - start, 'first_request': served - start}))
+'''
+
+
+def run_worker(path, mode):
+    """Start a worker process and return its step timings in seconds."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', CHILD, path, mode], cwd=root,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def remove(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fd, existing = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    fresh = existing + '.fresh'
+    database.DATABASE_NAME = existing
+    database.init_db()
+    try:
+        add_sample_data.add_synthetic_data(args.posts, seed=args.seed)
+        database.close_pool()
+
+        print(f'{args.runs} worker starts per case, {args.posts} posts in the existing database')
+        print(f'{"case":<22} {"import ms":>10} {"boot ms":>10} {"first request ms":>17}')
+        for mode in ('eager', 'lazy'):
+            for name, path in (('new', fresh), ('existing', existing)):
+                runs = []
+                for _ in range(args.runs):
+                    if path == fresh:
+                        remove(fresh)
+                    runs.append(run_worker(path, mode))
+                p50 = {step: percentile(sorted(run[step] for run in runs), 50) * 1000
+                       for step in runs[0]}
+                print(f'{mode + ", " + name + " db":<22} {p50["import"]:>10.1f} '
+                      f'{p50["boot"]:>10.1f} {p50["first_request"]:>17.1f}')
+    finally:
+        database.close_pool()
+        remove(existing)
+        remove(fresh)
+
+
+if __name__ == '__main__':
+    main()
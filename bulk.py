@@ -0,0 +1,272 @@
+"""
+Bulk import and export of posts with their tags and comments.
+
+Imports stream NDJSON or CSV input and insert it in large executemany
+batches, one transaction per batch. Exports stream NDJSON in the same
+format, so an export can be imported again.
+
+    python bulk.py import archive.ndjson
+    python bulk.py import posts.csv --format csv
+    python bulk.py export backup.ndjson
+
+NDJSON records look like:
+
+    {"title": "...", "content": "...", "created_at": "2024-01-31 12:00:00",
+     "tags": ["python", "flask"],
+     "comments": [{"author": "...", "title": "...", "content": "..."},
+                  {"author": "...", "title": "...", "content": "...", "reply_to": 0}]}
+
+reply_to makes a comment a reply to an earlier comment on the same post,
+given by its position in the list; comments with any other reply_to are
+skipped.
+
+CSV files need title and content columns, and may have created_at and a
+comma-separated tags column. created_at, tags and comments are optional;
+created_at is an ISO 8601 time, stored in UTC.
+"""
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+import database
+import markup
+
+BATCH_SIZE = 5000
+
+
+def read_ndjson(lines):
+    """Yield one record per non-blank NDJSON line."""
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(lines):
+    """Yield records from CSV rows, splitting the tags column on commas."""
+    for row in csv.DictReader(lines):
+        record = {'title': row.get('title'), 'content': row.get('content'),
+                  'created_at': row.get('created_at') or None}
+        record['tags'] = [tag.strip() for tag in (row.get('tags') or '').split(',') if tag.strip()]
+        yield record
+
+
+def normalize_timestamp(value):
+    """Return value as a UTC '%Y-%m-%d %H:%M:%S' string, or None if it isn't an ISO 8601 time."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def import_posts(records, batch_size=BATCH_SIZE, progress=None):
+    """Insert records in batches and return counts of what was imported.
+
+    Tags are resolved through an in-memory name -> id map, so each tag name
+    costs one lookup for the whole import. Records without a title or
+    content, or with a created_at that isn't an ISO 8601 time, are skipped.
+    So are comments without an author or content, with such a created_at,
+    or whose reply_to is not the position of an earlier comment that was
+    imported. progress(stats) is called after every batch.
+    """
+    stats = {'posts': 0, 'tags': 0, 'comments': 0, 'skipped': 0}
+    conn = database.get_db_connection()
+    try:
+        tag_ids = {row['name']: row['id'] for row in conn.execute('SELECT id, name FROM tags')}
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+            _import_batch(conn, batch, tag_ids, stats)
+            if progress is not None:
+                progress(stats)
+    finally:
+        conn.close()
+    return stats
+
+
+def _import_batch(conn, batch, tag_ids, stats):
+    """Insert one batch of records in a single transaction."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Ids are assigned here so tags, comments and replies can refer to them;
+        # the write lock keeps other writers from taking them meanwhile
+        next_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM posts').fetchone()[0]
+        next_comment_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM comments').fetchone()[0]
+        post_rows, tag_rows, comment_rows = [], [], []
+        new_tags = {}
+        for record in batch:
+            title, content = record.get('title'), record.get('content')
+            # Stored as given, a bad created_at would sort above every date and break parsing
+            given_at = record.get('created_at')
+            created_at = normalize_timestamp(given_at) if given_at is not None else None
+            if not title or not content or created_at is None and given_at is not None:
+                stats['skipped'] += 1
+                continue
+            post_id = next_id
+            next_id += 1
+            excerpt, word_count = database.summarize_content(content)
+            post_rows.append((post_id, title, content, markup.render_markdown(content),
+                              excerpt, word_count, created_at, created_at))
+            for name in dict.fromkeys(record.get('tags') or ()):
+                if name not in tag_ids:
+                    new_tags[name] = None
+                tag_rows.append((post_id, name))
+            comment_ids = []
+            for comment in record.get('comments') or ():
+                # reply_to is the index of an earlier comment on the same post
+                reply_to = comment.get('reply_to')
+                given_at = comment.get('created_at')
+                comment_at = normalize_timestamp(given_at) if given_at is not None else None
+                if (not comment.get('author') or not comment.get('content')
+                        or comment_at is None and given_at is not None
+                        or reply_to is not None and (
+                            type(reply_to) is not int or not 0 <= reply_to < len(comment_ids)
+                            or comment_ids[reply_to] is None)):
+                    # Keep the slot so later reply_to positions still line up
+                    comment_ids.append(None)
+                    stats['skipped'] += 1
+                    continue
+                parent_id = comment_ids[reply_to] if reply_to is not None else None
+                comment_ids.append(next_comment_id)
+                comment_rows.append((next_comment_id, post_id, parent_id, comment['author'],
+                                     comment.get('title', ''), comment['content'], comment_at))
+                next_comment_id += 1
+
+        if new_tags:
+            conn.executemany('INSERT OR IGNORE INTO tags (name) VALUES (?)',
+                             [(name,) for name in new_tags])
+            names = list(new_tags)
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                for row in conn.execute(f'SELECT id, name FROM tags WHERE name IN ({placeholders})',
+                                        chunk):
+                    tag_ids[row['name']] = row['id']
+        conn.executemany(f'''
+            INSERT INTO posts (id, title, content, content_html, excerpt, word_count,
+                               created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, {database.NOW}))
+        ''', post_rows)
+        conn.executemany('INSERT OR IGNORE INTO post_tags (post_id, tag_id) VALUES (?, ?)',
+                         [(post_id, tag_ids[name]) for post_id, name in tag_rows])
+        conn.executemany('''
+            INSERT INTO comments (id, post_id, parent_id, author, title, content, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', comment_rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        for name in new_tags:
+            tag_ids.pop(name, None)
+        raise
+    stats['posts'] += len(post_rows)
+    stats['tags'] += len(tag_rows)
+    stats['comments'] += len(comment_rows)
+
+
+def export_posts(out, batch_size=1000):
+    """Write every post with its tags and comments to out as NDJSON, oldest first.
+
+    Posts are read in id order one batch at a time, so no read transaction
+    is held for the whole export. Returns the number of posts written.
+    """
+    written = 0
+    last_id = 0
+    while True:
+        conn = database.get_db_connection()
+        try:
+            posts = conn.execute('''
+                SELECT id, title, content, created_at FROM posts
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, batch_size)).fetchall()
+            if not posts:
+                break
+            post_ids = [post['id'] for post in posts]
+            placeholders = ', '.join('?' * len(post_ids))
+            comments = {post_id: [] for post_id in post_ids}
+            positions = {}  # comment id -> index in its post's list, for replies
+            # Thread order puts every reply after the comment it answers
+            for comment in conn.execute(f'''
+                SELECT id, post_id, parent_id, author, title, content, created_at FROM comments
+                WHERE post_id IN ({placeholders}) ORDER BY post_id, path
+            ''', post_ids):
+                post_comments = comments[comment['post_id']]
+                positions[comment['id']] = len(post_comments)
+                record = {'author': comment['author'], 'title': comment['title'],
+                          'content': comment['content'], 'created_at': comment['created_at']}
+                if comment['parent_id'] is not None:
+                    record['reply_to'] = positions[comment['parent_id']]
+                post_comments.append(record)
+        finally:
+            conn.close()
+        tags = database.get_tags_for_posts(post_ids)
+
+        out.write(''.join(json.dumps({
+            'title': post['title'],
+            'content': post['content'],
+            'created_at': post['created_at'],
+            'tags': [tag['name'] for tag in tags[post['id']]],
+            'comments': comments[post['id']],
+        }) + '\n' for post in posts))
+        written += len(posts)
+        last_id = post_ids[-1]
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import and export blog posts.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help="import posts from NDJSON or CSV")
+    import_parser.add_argument('file', help="input file, or - for stdin")
+    import_parser.add_argument('--format', choices=['ndjson', 'csv'],
+                               help="defaults to csv for .csv files, ndjson otherwise")
+    import_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    export_parser = commands.add_parser('export', help="export posts as NDJSON")
+    export_parser.add_argument('file', nargs='?', default='-', help="output file, or - for stdout")
+    parser.add_argument('--database', default=database.DATABASE_NAME)
+    args = parser.parse_args()
+
+    database.DATABASE_NAME = args.database
+    database.init_db()
+
+    if args.command == 'import':
+        fmt = args.format or ('csv' if args.file.endswith('.csv') else 'ndjson')
+        f = sys.stdin if args.file == '-' else open(args.file, newline='', encoding='utf-8')
+        start = time.perf_counter()
+
+        def progress(stats):
+            elapsed = time.perf_counter() - start
+            print(f"\r{stats['posts']} posts, {stats['comments']} comments "
+                  f"({stats['posts'] / elapsed:,.0f} posts/s)", end='', file=sys.stderr)
+
+        try:
+            reader = read_csv if fmt == 'csv' else read_ndjson
+            stats = import_posts(reader(f), args.batch_size, progress)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+        print(f"\nImported {stats['posts']} posts, {stats['tags']} tag links and "
+              f"{stats['comments']} comments; skipped {stats['skipped']} invalid records "
+              f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    else:
+        out = sys.stdout if args.file == '-' else open(args.file, 'w', encoding='utf-8')
+        try:
+            written = export_posts(out)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"Exported {written} posts", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
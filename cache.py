@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class PageCache:
+    """A thread-safe LRU cache of rendered pages with a TTL and a size bound.
+
+    Keys are (group, variant) pairs. A group is everything that depends on
+    one piece of content (e.g. 'post:5' or 'home'), and a variant tells its
+    pages apart (e.g. the query string). invalidate() drops a whole group.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=60.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._groups = {}  # group -> set of keys
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0,
+                       'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value):
+        """Store a bytes value, evicting least recently used entries to fit."""
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._groups.setdefault(key[0], set()).add(key)
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, *groups):
+        """Drop every cached page in the given groups."""
+        with self._lock:
+            for group in groups:
+                for key in list(self._groups.get(group, ())):
+                    self._remove(key)
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        """Drop all cached pages."""
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+            self._size = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters and the current size."""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries),
+                        bytes=self._size, max_bytes=self.max_bytes)
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._size -= len(value)
+        group = self._groups[key[0]]
+        group.discard(key)
+        if not group:
+            del self._groups[key[0]]
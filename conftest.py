@@ -0,0 +1,32 @@
+import os
+import shutil
+
+import pytest
+
+import database
+
+TEST_DB = 'test_blog.db'
+
+@pytest.fixture(scope='session')
+def template_db(tmp_path_factory):
+    """A database with every migration applied, built once per test run."""
+    path = str(tmp_path_factory.mktemp('template') / 'blog.db')
+    database.DATABASE_NAME = path
+    database.init_db()
+    database.close_pool()
+    return path
+
+@pytest.fixture
+def test_db(template_db):
+    """Give each test its own copy of the template database."""
+    database.close_pool()
+    shutil.copyfile(template_db, TEST_DB)
+    database.DATABASE_NAME = TEST_DB
+    
+    yield
+    
+    # Clean up after test
+    database.close_pool()
+    for path in (TEST_DB, TEST_DB + '-wal', TEST_DB + '-shm', TEST_DB + database.SNAPSHOT_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
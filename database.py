@@ -1,77 +1,832 @@
+import logging
+import math
+import os
+import queue
+import re
 import sqlite3
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future
+
+import markup
+
+logger = logging.getLogger(__name__)
 
 DATABASE_NAME = 'blog.db'
 
+# Numbered schema migrations, e.g. 0002_hot_path_indexes.sql
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# SQL expression for the current time with millisecond precision
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Listings show a stored excerpt of this many characters instead of the body
+EXCERPT_LENGTH = 150
+
+# Post columns listings select; everything but the full content
+SUMMARY_COLUMNS = ('id', 'title', 'excerpt', 'word_count', 'comment_count', 'created_at', 'updated_at')
+POST_COLUMNS = SUMMARY_COLUMNS + ('content', 'content_html')
+
+# Digits per id in a comment's materialized path (printf('%010d') in 0007)
+COMMENT_PATH_WIDTH = 10
+
+# Connection pool settings
+POOL_SIZE = 5
+POOL_TIMEOUT = 10.0  # seconds to wait for a free connection
+
+# Pragmas applied to every new connection. Call close_pool() after changing
+# them so open connections are replaced.
+CONNECTION_PROFILE = {
+    'journal_mode': 'WAL',        # Readers don't block the writer and vice versa
+    'busy_timeout': 5000,         # ms to wait for a lock before "database is locked"
+    'synchronous': 'NORMAL',      # Safe with WAL; fsync at checkpoints, not every commit
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -16000,         # Negative values are KiB, so about 16 MB per connection
+}
+
+# Route create_post/create_comment through a single writer thread that
+# commits concurrent writes together
+WRITE_QUEUE_ENABLED = False
+
+# Read routing: read-only functions use a separate pool of mode=ro
+# connections, so reads don't compete with writes for pooled connections. With
+# READ_SNAPSHOT_INTERVAL set they read a copy of the database made with the
+# backup API and refreshed that often (seconds) instead of the live file. Only
+# the first copy is made by the request that needs it; later ones are made on
+# a background thread while requests keep reading the previous copy.
+READ_ROUTING_ENABLED = False
+READ_POOL_SIZE = 5
+READ_SNAPSHOT_INTERVAL = None
+SNAPSHOT_SUFFIX = '.snapshot'
+
+# Database files whose schema is known to be up to date (see ensure_schema)
+_schema_current = set()
+_schema_lock = threading.Lock()
+
+# Optional hook returning a connection to reuse for the current unit of work.
+# app.py binds this to flask.g so a whole request shares one connection.
+scoped_connection = None
+
+# Optional hook returning when the current session last wrote (a time.time()
+# value), for read-your-writes; app.py reads it from flask.g.
+session_last_write = None
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free in time."""
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """A cursor that records each statement's duration and row count."""
+
+    record = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._start_record(sql, start)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._start_record(sql, start)
+        return self
+
+    def _start_record(self, sql, start):
+        # DML reports affected rows up front; SELECT rows are counted as fetched
+        self.record = {'sql': sql, 'duration': time.perf_counter() - start,
+                       'rows': max(self.rowcount, 0)}
+        self.connection.queries.append(self.record)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add_rows(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add_rows(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add_rows(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add_rows(start, 0)
+            raise
+        self._add_rows(start, 1)
+        return row
+
+    def _add_rows(self, start, rows):
+        if self.record is not None:
+            self.record['duration'] += time.perf_counter() - start
+            self.record['rows'] += rows
+
+
+class PooledConnection(sqlite3.Connection):
+    """A connection that goes back to its pool when closed."""
+
+    pool = None
+    scoped = False
+    queries = None  # List to record statements into while profiling
+
+    def execute(self, sql, parameters=()):
+        if self.queries is None:
+            return super().execute(sql, parameters)
+        return self.cursor(ProfiledCursor).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.queries is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor(ProfiledCursor).executemany(sql, seq_of_parameters)
+
+    def close(self):
+        """Return the connection to its pool instead of closing it."""
+        if self.scoped:
+            return  # Released by whoever owns the scope
+        self.queries = None
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+
+class ConnectionPool:
+    """A thread-safe pool of SQLite connections to a single database."""
+
+    def __init__(self, database, size=POOL_SIZE, timeout=POOL_TIMEOUT, profile=None,
+                 read_only=False):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.profile = CONNECTION_PROFILE if profile is None else profile
+        self.read_only = read_only
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+        self._closed = False
+        self._lock = threading.Condition()
+        self._stats = {'checkouts': 0, 'waits': 0, 'timeouts': 0, 'peak_in_use': 0}
+
+    def _connect(self):
+        if self.read_only:
+            uri = f'file:{urllib.parse.quote(os.path.abspath(self.database))}?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, factory=PooledConnection,
+                                   check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.database, factory=PooledConnection,
+                                   check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.pool = self
+        for name, value in self.profile.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self):
+        """Check out a connection, waiting if the pool is exhausted."""
+        with self._lock:
+            if not self._idle and self._created >= self.size:
+                self._stats['waits'] += 1
+                available = lambda: self._idle or self._created < self.size
+                if not self._lock.wait_for(available, self.timeout):
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection free after {self.timeout}s")
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                conn = None
+                self._created += 1
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._lock.notify()
+                raise
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any open transaction."""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+            if self._closed:
+                self._created -= 1
+                sqlite3.Connection.close(conn)
+            else:
+                self._idle.append(conn)
+            self._lock.notify()
+
+    def close(self):
+        """Close idle connections; busy ones are closed when released."""
+        with self._lock:
+            self._closed = True
+            for conn in self._idle:
+                sqlite3.Connection.close(conn)
+            self._created -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        """Return counters useful for sizing the pool."""
+        with self._lock:
+            return dict(self._stats, size=self.size, open=self._created,
+                        idle=len(self._idle), in_use=self._in_use)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_bound = threading.local()
+_read_pool = None
+_snapshot_taken_at = None
+_snapshot_lock = threading.Lock()
+_snapshot_refreshing = False
+
+def get_pool():
+    """Return the pool for the current DATABASE_NAME, creating it if needed."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.database != DATABASE_NAME or _pool.size != POOL_SIZE:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DATABASE_NAME, POOL_SIZE, POOL_TIMEOUT)
+        return _pool
+
+def close_pool():
+    """Close the current pools so the next use opens fresh connections."""
+    global _pool, _read_pool, _snapshot_taken_at
+    with _pool_lock:
+        for pool in (_pool, _read_pool):
+            if pool is not None:
+                pool.close()
+        _pool = _read_pool = _snapshot_taken_at = None
+
+def _read_profile():
+    # journal_mode can't be changed through a read-only connection
+    return {name: value for name, value in CONNECTION_PROFILE.items() if name != 'journal_mode'}
+
+def get_read_pool():
+    """Return the pool of read-only connections, refreshing the snapshot if it's due."""
+    global _read_pool
+    if READ_SNAPSHOT_INTERVAL is not None:
+        taken_at = _snapshot_taken_at
+        if taken_at is None:
+            # Nothing to read until the first copy exists, so this caller makes it
+            refresh_snapshot()
+        elif time.time() - taken_at >= READ_SNAPSHOT_INTERVAL:
+            _start_snapshot_refresh()
+    path = DATABASE_NAME if READ_SNAPSHOT_INTERVAL is None else DATABASE_NAME + SNAPSHOT_SUFFIX
+    with _pool_lock:
+        if _read_pool is None or _read_pool.database != path or _read_pool.size != READ_POOL_SIZE:
+            if _read_pool is not None:
+                _read_pool.close()
+            _read_pool = ConnectionPool(path, READ_POOL_SIZE, POOL_TIMEOUT, _read_profile(),
+                                        read_only=True)
+        return _read_pool
+
+def _start_snapshot_refresh():
+    global _snapshot_refreshing
+    with _pool_lock:
+        if _snapshot_refreshing:
+            return
+        _snapshot_refreshing = True
+    threading.Thread(target=_refresh_snapshot_in_background, name='snapshot-refresh',
+                     daemon=True).start()
+
+def _refresh_snapshot_in_background():
+    global _snapshot_refreshing
+    try:
+        refresh_snapshot(wait=False)
+    except Exception:
+        logger.exception('Refreshing the read snapshot failed; reads stay on the old copy')
+    finally:
+        with _pool_lock:
+            _snapshot_refreshing = False
+
+def refresh_snapshot(wait=True):
+    """Copy the database to the snapshot file with the backup API and read from the copy.
+
+    With wait=False, returns straight away if another thread is already
+    refreshing it.
+    """
+    global _read_pool, _snapshot_taken_at
+    if not _snapshot_lock.acquire(blocking=wait):
+        return
+    try:
+        # Everything committed before this moment is in the copy
+        taken_at = time.time()
+        path = DATABASE_NAME + SNAPSHOT_SUFFIX
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                        suffix=SNAPSHOT_SUFFIX)
+        os.close(fd)
+        try:
+            source = get_db_connection()
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.backup(target)
+                # A rollback journal, so read-only connections need no -wal/-shm files
+                target.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                target.close()
+                source.close()
+            # Readers of the old copy keep their open file until they finish
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        with _pool_lock:
+            if _read_pool is not None:
+                _read_pool.close()
+            _read_pool = ConnectionPool(path, READ_POOL_SIZE, POOL_TIMEOUT, _read_profile(),
+                                        read_only=True)
+            _snapshot_taken_at = taken_at
+    finally:
+        _snapshot_lock.release()
+
+def reads_include(since):
+    """Whether read connections see every write committed by time.time() value since.
+
+    Live read-only connections always do; a snapshot only if it was taken
+    after since.
+    """
+    if not READ_ROUTING_ENABLED or READ_SNAPSHOT_INTERVAL is None or not since:
+        return True
+    return _snapshot_taken_at is not None and _snapshot_taken_at >= since
+
+def routes_reads():
+    """Whether reads made now should go to the read-only connections."""
+    if not READ_ROUTING_ENABLED:
+        return False
+    return reads_include(session_last_write() if session_last_write is not None else None)
+
+def bind_connection(conn):
+    """Make get_db_connection() return conn in this thread; pass None to unbind.
+
+    Mark conn as scoped so callers' close() leaves it checked out.
+    """
+    _bound.conn = conn
+
 def get_db_connection():
-    """Create and return a database connection."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Return a database connection; call close() to give it back."""
+    conn = getattr(_bound, 'conn', None)
+    if conn is not None:
+        return conn
+    if scoped_connection is not None:
+        conn = scoped_connection()
+        if conn is not None:
+            return conn
+    return get_pool().acquire()
+
+def get_read_connection():
+    """Return a connection for read-only work; call close() to give it back.
+
+    With READ_ROUTING_ENABLED this is a read-only connection, otherwise the
+    same as get_db_connection().
+    """
+    conn = getattr(_bound, 'conn', None)
+    if conn is not None or not READ_ROUTING_ENABLED:
+        return get_db_connection()
+    if scoped_connection is not None:
+        conn = scoped_connection(read=True)
+        if conn is not None:
+            return conn
+    return get_read_pool().acquire()
+
+def get_migrations():
+    """Return (version, path) for every migration file, oldest first."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r'(\d+)_\w+\.sql$', filename)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+def get_schema_version(conn):
+    """Return the last migration version applied to the database."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    """Apply pending migrations, each in its own transaction.
+
+    Returns the list of versions that were applied.
+    """
+    current = get_schema_version(conn)
+    applied = []
+    for version, path in get_migrations():
+        if version <= current:
+            continue
+        with open(path, 'r') as f:
+            script = f.read()
+        try:
+            conn.executescript(f'BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            if get_schema_version(conn) >= version:
+                continue  # Another process applied it first
+            raise
+        applied.append(version)
+    return applied
+
+class WriteQueue:
+    """Runs writes on a single thread, committing whatever queued up together.
+
+    While one group is being committed new writes pile up, and the next
+    group takes all of them in one transaction, so a burst of writers
+    shares fsyncs instead of queueing on the database lock. Each write runs
+    in its own savepoint, so a failing write doesn't undo its neighbours.
+    """
+
+    def __init__(self, max_batch=100):
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'writes': 0, 'batches': 0, 'largest_batch': 0, 'errors': 0}
+
+    def submit(self, fn):
+        """Run fn(conn) in the writer thread and return its result once committed."""
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+            self._queue.put((fn, future))
+        return future.result()
+
+    def stop(self):
+        """Finish queued writes and stop the writer thread."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            thread, self._thread = self._thread, None
+        thread.join()
+
+    def stats(self):
+        """Return counters showing how well writes are being grouped."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch):
+        results = []
+        try:
+            conn = get_pool().acquire()
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, future in batch:
+                conn.execute('SAVEPOINT queued_write')
+                try:
+                    results.append((future, fn(conn), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO queued_write')
+                    results.append((future, None, e))
+                conn.execute('RELEASE queued_write')
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            results = [(future, None, e) for _, future in batch]
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['writes'] += len(batch)
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+            self._stats['errors'] += sum(1 for _, _, error in results if error is not None)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+write_queue = WriteQueue()
+
+def _write(fn):
+    """Run fn(conn) in a transaction and return its result.
+
+    Goes through the write queue when WRITE_QUEUE_ENABLED is set.
+    """
+    if WRITE_QUEUE_ENABLED:
+        return write_queue.submit(fn)
+    conn = get_db_connection()
+    try:
+        with conn:
+            return fn(conn)
+    finally:
+        conn.close()
+
+def _upgrade(conn):
+    if migrate(conn):
+        render_missing_html(conn)
+    _schema_current.add(DATABASE_NAME)
 
 def init_db():
-    """Initialize the database with the schema."""
+    """Initialize the database, bringing its schema up to date."""
+    # The file may have been recreated, so drop connections to the old one
+    close_pool()
     conn = get_db_connection()
-    with open('schema.sql', 'r') as f:
-        conn.executescript(f.read())
-    conn.commit()
-    conn.close()
+    try:
+        _upgrade(conn)
+    finally:
+        conn.close()
+
+def ensure_schema():
+    """Bring DATABASE_NAME's schema up to date, once per process.
+
+    The first call compares the file's user_version with the migrations
+    and applies any that are missing. Later calls only check a set, so
+    this can run before every request.
+    """
+    if DATABASE_NAME in _schema_current:
+        return
+    with _schema_lock:
+        if DATABASE_NAME in _schema_current:
+            return
+        conn = get_pool().acquire()
+        try:
+            if get_schema_version(conn) < get_migrations()[-1][0]:
+                _upgrade(conn)
+            else:
+                _schema_current.add(DATABASE_NAME)
+        finally:
+            conn.close()
+
+def render_missing_html(conn, batch_size=500):
+    """Store rendered HTML for posts written before content_html existed.
+
+    Returns the number of posts rendered.
+    """
+    rendered = 0
+    while True:
+        rows = conn.execute('SELECT id, content FROM posts WHERE content_html IS NULL LIMIT ?',
+                            (batch_size,)).fetchall()
+        if not rows:
+            return rendered
+        with conn:
+            conn.executemany('UPDATE posts SET content_html = ? WHERE id = ?',
+                             [(markup.render_markdown(row['content']), row['id']) for row in rows])
+        rendered += len(rows)
 
 # Posts functions
+def summarize_content(content):
+    """Return the (excerpt, word_count) stored alongside a post's content."""
+    excerpt = content if len(content) <= EXCERPT_LENGTH else content[:EXCERPT_LENGTH] + '...'
+    return excerpt, len(content.split())
+
+def _insert_post(conn, title, content):
+    excerpt, word_count = summarize_content(content)
+    cursor = conn.execute(f'''
+        INSERT INTO posts (title, content, content_html, excerpt, word_count, updated_at)
+        VALUES (?, ?, ?, ?, ?, {NOW})
+    ''', (title, content, markup.render_markdown(content), excerpt, word_count))
+    return cursor.lastrowid
+
 def create_post(title, content):
-    """Create a new blog post."""
-    conn = get_db_connection()
-    conn.execute('INSERT INTO posts (title, content) VALUES (?, ?)', (title, content))
-    conn.commit()
-    conn.close()
+    """Create a new blog post and return its id."""
+    return _write(lambda conn: _insert_post(conn, title, content))
 
-def get_all_posts():
-    """Get all blog posts."""
-    conn = get_db_connection()
-    posts = conn.execute('SELECT * FROM posts ORDER BY created_at DESC').fetchall()
+def create_post_with_tags(title, content, tag_names):
+    """Create a post and attach its tags in a single transaction.
+
+    Returns the new post's id.
+    """
+    def insert(conn):
+        post_id = _insert_post(conn, title, content)
+        tag_ids = _upsert_tags(conn, tag_names)
+        conn.executemany('INSERT OR IGNORE INTO post_tags (post_id, tag_id) VALUES (?, ?)',
+                         [(post_id, tag_id) for tag_id in tag_ids.values()])
+        return post_id
+    return _write(insert)
+
+def _keyset_clause(before, prefix='', descending=True):
+    """Build the WHERE condition for keyset pagination on (created_at, id).
+
+    before is the (created_at, id) of the last row already seen, or None.
+    Pass descending=False for oldest-first listings.
+    """
+    if before is None:
+        return '1', ()
+    operator = '<' if descending else '>'
+    return f'({prefix}created_at, {prefix}id) {operator} (?, ?)', tuple(before)
+
+def _select_columns(columns, prefix=''):
+    """Build a SELECT list, rejecting anything that isn't a post column."""
+    unknown = set(columns) - set(POST_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown post columns: {', '.join(sorted(unknown))}")
+    return ', '.join(prefix + column for column in columns)
+
+def get_all_posts(limit=None, before=None, columns=SUMMARY_COLUMNS):
+    """Get blog post summaries, newest first.
+
+    Pass limit and the (created_at, id) of the last post seen as before
+    to fetch one page at a time. Listings only need SUMMARY_COLUMNS; ask
+    for 'content' in columns to get the full bodies too.
+    """
+    where, params = _keyset_clause(before)
+    conn = get_read_connection()
+    posts = conn.execute(f'''
+        SELECT {_select_columns(columns)} FROM posts WHERE {where}
+        ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', params + (-1 if limit is None else limit,)).fetchall()
     conn.close()
     return posts
 
+def iter_posts(before=None, columns=POST_COLUMNS):
+    """Yield posts newest first straight from the cursor, for streaming exports.
+
+    Rows are read as they are consumed, so memory stays flat however many
+    posts there are. The connection is held until the generator finishes.
+    """
+    where, params = _keyset_clause(before)
+    conn = get_read_connection()
+    try:
+        yield from conn.execute(f'''
+            SELECT {_select_columns(columns)} FROM posts WHERE {where}
+            ORDER BY created_at DESC, id DESC
+        ''', params)
+    finally:
+        conn.close()
+
 def get_post_by_id(post_id):
     """Get a single post by ID."""
-    conn = get_db_connection()
+    conn = get_read_connection()
     post = conn.execute('SELECT * FROM posts WHERE id = ?', (post_id,)).fetchone()
     conn.close()
     return post
 
 def update_post(post_id, title, content):
     """Update an existing blog post."""
+    excerpt, word_count = summarize_content(content)
     conn = get_db_connection()
-    conn.execute('UPDATE posts SET title = ?, content = ? WHERE id = ?',
-                (title, content, post_id))
+    conn.execute(f'''
+        UPDATE posts SET title = ?, content = ?, content_html = ?, excerpt = ?, word_count = ?,
+                         updated_at = {NOW}
+        WHERE id = ?
+    ''', (title, content, markup.render_markdown(content), excerpt, word_count, post_id))
     conn.commit()
     conn.close()
 
-# Comments functions
-def create_comment(post_id, author, title, content):
-    """Create a new comment for a post."""
-    conn = get_db_connection()
-    conn.execute('INSERT INTO comments (post_id, author, title, content) VALUES (?, ?, ?, ?)', 
-                 (post_id, author, title, content))
-    conn.commit()
+def _touch_post(conn, post_id):
+    """Bump a post's updated_at so cached copies of its pages go stale."""
+    conn.execute(f'UPDATE posts SET updated_at = {NOW} WHERE id = ?', (post_id,))
+
+def get_site_version():
+    """Get the latest post modification and comment, for validating listings.
+
+    Both come from index lookups, so this is cheap enough to run per request.
+    """
+    conn = get_read_connection()
+    version = conn.execute('''
+        SELECT (SELECT MAX(updated_at) FROM posts) AS updated_at,
+               (SELECT MAX(id) FROM comments) AS last_comment_id,
+               (SELECT created_at FROM comments ORDER BY id DESC LIMIT 1) AS last_comment_at
+    ''').fetchone()
+    conn.close()
+    return version
+
+def get_post_version(post_id):
+    """Get a post's modification time and latest comment, or None if it doesn't exist."""
+    conn = get_read_connection()
+    version = conn.execute('''
+        SELECT p.updated_at, c.id AS last_comment_id, c.created_at AS last_comment_at
+        FROM posts p
+        LEFT JOIN (SELECT id, created_at FROM comments WHERE post_id = ?
+                   ORDER BY created_at DESC, id DESC LIMIT 1) c
+        WHERE p.id = ?
+    ''', (post_id, post_id)).fetchone()
     conn.close()
+    return version
+
+# Comments functions
+def create_comment(post_id, author, title, content, parent_id=None):
+    """Create a new comment for a post, optionally as a reply, and return its id.
+
+    Raises ValueError if parent_id isn't a comment on the same post.
+    """
+    def insert(conn):
+        if parent_id is not None:
+            parent = conn.execute('SELECT post_id FROM comments WHERE id = ?', (parent_id,)).fetchone()
+            if parent is None or parent['post_id'] != post_id:
+                raise ValueError(f"Comment {parent_id} is not on post {post_id}")
+        return conn.execute(
+            'INSERT INTO comments (post_id, author, title, content, parent_id) VALUES (?, ?, ?, ?, ?)', 
+            (post_id, author, title, content, parent_id)).lastrowid
+    return _write(insert)
 
 def get_comments_by_post(post_id):
     """Get all comments for a specific post."""
-    conn = get_db_connection()
-    comments = conn.execute('SELECT * FROM comments WHERE post_id = ? ORDER BY created_at ASC', 
+    conn = get_read_connection()
+    comments = conn.execute('SELECT * FROM comments WHERE post_id = ? ORDER BY created_at ASC, id ASC', 
                            (post_id,)).fetchall()
     conn.close()
     return comments
 
+def get_comment_threads(post_id, limit=None, after=None):
+    """Get a page of top-level comments, oldest first, and every reply under them.
+
+    Pass limit and the (created_at, id) of the last top-level comment seen
+    as after to fetch one page at a time. Returns (roots, replies); the
+    replies come from one range scan over the path index, in thread order.
+    """
+    where, params = _keyset_clause(after, descending=False)
+    conn = get_read_connection()
+    try:
+        roots = conn.execute(f'''
+            SELECT * FROM comments
+            WHERE post_id = ? AND parent_id IS NULL AND {where}
+            ORDER BY created_at, id LIMIT ?
+        ''', (post_id,) + params + (-1 if limit is None else limit,)).fetchall()
+        if not roots:
+            return roots, []
+        # Every reply's path starts with its root's; '0' sorts just after '/'
+        paths = [root['path'] for root in roots]
+        placeholders = ', '.join('?' * len(paths))
+        replies = conn.execute(f'''
+            SELECT * FROM comments
+            WHERE post_id = ? AND path > ? AND path < ?
+              AND substr(path, 1, {COMMENT_PATH_WIDTH}) IN ({placeholders}) AND parent_id IS NOT NULL
+            ORDER BY path
+        ''', [post_id, min(paths), max(paths) + '0'] + paths).fetchall()
+    finally:
+        conn.close()
+    return roots, replies
+
+def get_thread(comment_id):
+    """Get a comment and every reply under it, in thread order, with one range scan."""
+    conn = get_read_connection()
+    try:
+        comment = conn.execute('SELECT post_id, path FROM comments WHERE id = ?',
+                               (comment_id,)).fetchone()
+        if comment is None:
+            return []
+        return conn.execute('''
+            SELECT * FROM comments WHERE post_id = ? AND path >= ? AND path < ?
+            ORDER BY path
+        ''', (comment['post_id'], comment['path'], comment['path'] + '0')).fetchall()
+    finally:
+        conn.close()
+
+def iter_comments_by_post(post_id):
+    """Yield a post's comments in order straight from the cursor."""
+    conn = get_read_connection()
+    try:
+        yield from conn.execute('SELECT * FROM comments WHERE post_id = ? ORDER BY created_at ASC, id ASC',
+                                (post_id,))
+    finally:
+        conn.close()
+
 # Tags functions
 def create_tag(name):
-    """Create a new tag."""
+    """Create a new tag unless it already exists."""
     conn = get_db_connection()
-    try:
-        conn.execute('INSERT INTO tags (name) VALUES (?)', (name,))
-        conn.commit()
-    except:
-        pass  # Tag already exists
+    conn.execute('INSERT OR IGNORE INTO tags (name) VALUES (?)', (name,))
+    conn.commit()
     conn.close()
 
 def get_or_create_tag(name):
@@ -79,27 +834,66 @@ def get_or_create_tag(name):
     conn = get_db_connection()
     tag = conn.execute('SELECT * FROM tags WHERE name = ?', (name,)).fetchone()
     if tag is None:
-        conn.execute('INSERT INTO tags (name) VALUES (?)', (name,))
+        # Another writer may create the same tag first, so don't fail on it
+        conn.execute('INSERT OR IGNORE INTO tags (name) VALUES (?)', (name,))
         conn.commit()
         tag = conn.execute('SELECT * FROM tags WHERE name = ?', (name,)).fetchone()
     conn.close()
     return tag
 
 def add_tag_to_post(post_id, tag_name):
-    """Add a tag to a post."""
+    """Add a tag to a post, doing nothing if it's already there."""
     tag = get_or_create_tag(tag_name)
     conn = get_db_connection()
-    try:
-        conn.execute('INSERT INTO post_tags (post_id, tag_id) VALUES (?, ?)', 
-                     (post_id, tag['id']))
-        conn.commit()
-    except:
-        pass  # Tag already associated with post
+    cursor = conn.execute('INSERT OR IGNORE INTO post_tags (post_id, tag_id) VALUES (?, ?)', 
+                          (post_id, tag['id']))
+    if cursor.rowcount:
+        _touch_post(conn, post_id)
+    conn.commit()
     conn.close()
 
+def _upsert_tags(conn, tag_names):
+    """Create any missing tags and return a name -> id map for all of them."""
+    names = list(dict.fromkeys(tag_names))  # Dedupe, keeping order
+    if not names:
+        return {}
+    conn.executemany('INSERT OR IGNORE INTO tags (name) VALUES (?)', [(name,) for name in names])
+    placeholders = ', '.join('?' * len(names))
+    rows = conn.execute(f'SELECT id, name FROM tags WHERE name IN ({placeholders})', names)
+    return {row['name']: row['id'] for row in rows}
+
+def replace_post_tags(post_id, tag_names):
+    """Set a post's tags, only touching associations that actually change.
+
+    Returns the names of the tags the post had before.
+    """
+    conn = get_db_connection()
+    try:
+        with conn:
+            old_tags = {row['name']: row['id'] for row in conn.execute('''
+                SELECT t.id, t.name FROM tags t
+                JOIN post_tags pt ON t.id = pt.tag_id
+                WHERE pt.post_id = ?
+            ''', (post_id,))}
+            new_names = set(tag_names)
+            removed = [tag_id for name, tag_id in old_tags.items() if name not in new_names]
+            added = [name for name in dict.fromkeys(tag_names) if name not in old_tags]
+            if removed:
+                conn.executemany('DELETE FROM post_tags WHERE post_id = ? AND tag_id = ?',
+                                 [(post_id, tag_id) for tag_id in removed])
+            if added:
+                tag_ids = _upsert_tags(conn, added)
+                conn.executemany('INSERT OR IGNORE INTO post_tags (post_id, tag_id) VALUES (?, ?)',
+                                 [(post_id, tag_id) for tag_id in tag_ids.values()])
+            if removed or added:
+                _touch_post(conn, post_id)
+    finally:
+        conn.close()
+    return list(old_tags)
+
 def get_tags_for_post(post_id):
     """Get all tags for a specific post."""
-    conn = get_db_connection()
+    conn = get_read_connection()
     tags = conn.execute('''
         SELECT t.* FROM tags t
         JOIN post_tags pt ON t.id = pt.tag_id
@@ -108,29 +902,194 @@ def get_tags_for_post(post_id):
     conn.close()
     return tags
 
-def get_posts_by_tag(tag_name):
-    """Get all posts for a specific tag."""
-    conn = get_db_connection()
-    posts = conn.execute('''
-        SELECT p.* FROM posts p
+def get_tags_for_posts(post_ids):
+    """Get tags for several posts in one query, grouped by post id."""
+    tags_by_post = {post_id: [] for post_id in post_ids}
+    if not tags_by_post:
+        return tags_by_post
+    placeholders = ', '.join('?' * len(tags_by_post))
+    conn = get_read_connection()
+    rows = conn.execute(f'''
+        SELECT pt.post_id, t.* FROM tags t
+        JOIN post_tags pt ON t.id = pt.tag_id
+        WHERE pt.post_id IN ({placeholders})
+    ''', list(tags_by_post)).fetchall()
+    conn.close()
+    for row in rows:
+        tags_by_post[row['post_id']].append(row)
+    return tags_by_post
+
+def get_posts_by_tag(tag_name, limit=None, before=None, columns=SUMMARY_COLUMNS):
+    """Get post summaries for a specific tag, newest first, optionally one page at a time."""
+    where, params = _keyset_clause(before, prefix='p.')
+    conn = get_read_connection()
+    posts = conn.execute(f'''
+        SELECT {_select_columns(columns, prefix='p.')} FROM posts p
         JOIN post_tags pt ON p.id = pt.post_id
         JOIN tags t ON pt.tag_id = t.id
-        WHERE t.name = ?
-        ORDER BY p.created_at DESC
-    ''', (tag_name,)).fetchall()
+        WHERE t.name = ? AND {where}
+        ORDER BY p.created_at DESC, p.id DESC LIMIT ?
+    ''', (tag_name,) + params + (-1 if limit is None else limit,)).fetchall()
     conn.close()
     return posts
 
+def get_posts_by_ids(post_ids, columns=SUMMARY_COLUMNS):
+    """Get post summaries for the given ids, in the order of the ids."""
+    if not post_ids:
+        return []
+    placeholders = ', '.join('?' * len(post_ids))
+    query_columns = list(dict.fromkeys(list(columns) + ['id']))
+    conn = get_read_connection()
+    rows = conn.execute(f'''
+        SELECT {_select_columns(query_columns)} FROM posts WHERE id IN ({placeholders})
+    ''', list(post_ids)).fetchall()
+    conn.close()
+    by_id = {row['id']: row for row in rows}
+    return [by_id[post_id] for post_id in post_ids if post_id in by_id]
+
+def get_post_summary(post_id):
+    """Get a post's summary columns from the primary, so it reflects writes just made."""
+    conn = get_db_connection()
+    post = conn.execute(f'SELECT {_select_columns(SUMMARY_COLUMNS)} FROM posts WHERE id = ?',
+                        (post_id,)).fetchone()
+    conn.close()
+    return post
+
+# Post stats functions
+def _logaddexp(a, b):
+    """log(e^a + e^b) without overflowing."""
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+def record_views(counts, log_weight, path=None):
+    """Add view counts to post_stats in one transaction.
+
+    counts maps post id to new views. A post's score is the log of the sum
+    of e^(rate * t) over its views; log_weight is rate * t for now, so the
+    new views add views * e^log_weight to that sum.
+
+    path writes to that database file instead of DATABASE_NAME, through a
+    connection of its own that never creates the file: FileNotFoundError
+    if it is gone.
+    """
+    def record(conn):
+        conn.create_function('logaddexp', 2, _logaddexp, deterministic=True)
+        conn.executemany('''
+            INSERT INTO post_stats (post_id, views, score) VALUES (?, ?, ?)
+            ON CONFLICT (post_id) DO UPDATE SET
+                views = views + excluded.views,
+                score = logaddexp(score, excluded.score)
+        ''', [(post_id, views, math.log(views) + log_weight) for post_id, views in counts.items()])
+    if path is None:
+        return _write(record)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    # mode=rw, so a file removed since the check isn't recreated empty
+    uri = f'file:{urllib.parse.quote(os.path.abspath(path))}?mode=rw'
+    conn = sqlite3.connect(uri, uri=True, timeout=CONNECTION_PROFILE['busy_timeout'] / 1000)
+    try:
+        with conn:
+            record(conn)
+    finally:
+        conn.close()
+
+def get_popular_posts(limit=None, before=None, columns=SUMMARY_COLUMNS):
+    """Get post summaries with views and score, most popular first.
+
+    Pass limit and the (score, post id) of the last post seen as before to
+    fetch one page at a time.
+    """
+    where, params = '1', []
+    if before is not None:
+        where, params = '(s.score, s.post_id) < (?, ?)', list(before)
+    conn = get_read_connection()
+    posts = conn.execute(f'''
+        SELECT {_select_columns(columns, prefix='p.')}, s.views, s.score
+        FROM post_stats s
+        JOIN posts p ON p.id = s.post_id
+        WHERE {where}
+        ORDER BY s.score DESC, s.post_id DESC
+        LIMIT ?
+    ''', params + [-1 if limit is None else limit]).fetchall()
+    conn.close()
+    return posts
+
+def iter_tag_postings():
+    """Yield (tag_name, post_id) for every tag on every post."""
+    conn = get_db_connection()
+    try:
+        yield from conn.execute('''
+            SELECT t.name, pt.post_id FROM post_tags pt
+            JOIN tags t ON t.id = pt.tag_id
+        ''')
+    finally:
+        conn.close()
+
 def get_all_tags():
     """Get all tags."""
-    conn = get_db_connection()
+    conn = get_read_connection()
     tags = conn.execute('SELECT * FROM tags ORDER BY name').fetchall()
     conn.close()
     return tags
 
+def get_tag_stats():
+    """Get tags in use with their post counts and last-used time, by name."""
+    conn = get_read_connection()
+    tags = conn.execute('''
+        SELECT t.id, t.name, s.post_count, s.last_used_at FROM tag_stats s
+        JOIN tags t ON t.id = s.tag_id
+        WHERE s.post_count > 0
+        ORDER BY t.name
+    ''').fetchall()
+    conn.close()
+    return tags
+
 def remove_post_tags(post_id):
     """Remove all tags from a post."""
     conn = get_db_connection()
     conn.execute('DELETE FROM post_tags WHERE post_id = ?', (post_id,))
+    _touch_post(conn, post_id)
     conn.commit()
     conn.close()
+
+# Search functions
+
+# Markers placed around matched terms in search snippets. They can't occur
+# in form input, so callers can escape the text and then swap them for markup.
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+def _fts_query(text):
+    """Turn free text into an FTS5 query matching all of its words."""
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return None
+    # Quote every term so FTS5 operators in user input are taken literally,
+    # and let the last one match as a prefix for search-as-you-type
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+def search(text, limit=20):
+    """Search posts and comments, best bm25 matches first (titles weigh more).
+
+    Each result has the post id and title, the kind of match ('post' or
+    'comment') and a snippet with matches wrapped in HIGHLIGHT_START/END.
+    """
+    query = _fts_query(text)
+    if query is None:
+        return []
+    conn = get_read_connection()
+    results = conn.execute('''
+        SELECT s.post_id,
+               p.title AS post_title,
+               CASE WHEN s.rowid > 0 THEN 'post' ELSE 'comment' END AS kind,
+               highlight(search_index, 0, ?, ?) AS title,
+               snippet(search_index, 1, ?, ?, '…', 24) AS snippet,
+               s.rank
+        FROM search_index s
+        JOIN posts p ON p.id = s.post_id
+        WHERE search_index MATCH ? AND s.rank MATCH 'bm25(5.0, 1.0)'
+        ORDER BY s.rank
+        LIMIT ?
+    ''', (HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END, query, limit)).fetchall()
+    conn.close()
+    return results
@@ -0,0 +1,175 @@
+"""
+Atom feeds and the sitemap, kept as pre-serialized bytes.
+
+Each document is built from the newest rows of a summary-only query the
+first time it is asked for. After that the write routes report changed
+posts to post_changed(), which re-renders just those posts' entries and
+joins the cached entries back together, so serving a feed never touches
+the database. Documents are rebuilt after max_age seconds to pick up
+writes made by other processes.
+"""
+import bisect
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from markupsafe import escape
+
+import database
+
+FEED_SIZE = 20
+SITEMAP_SIZE = 50000  # The most URLs one sitemap file may list
+SITEMAP_COLUMNS = ('id', 'created_at', 'updated_at')
+
+Document = namedtuple('Document', 'body etag last_modified')
+
+
+def _timestamp(value):
+    """Parse a SQLite timestamp, which is stored in UTC."""
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def _w3c(value):
+    return _timestamp(value).isoformat(timespec='seconds')
+
+
+class _Entries:
+    """One document's rendered entries and its serialized form.
+
+    Entries are kept oldest first by (created_at, id), which never changes
+    for a post, so a write finds and replaces its entry by bisection.
+    """
+
+    def __init__(self, kind, tag, base_url, size, rows):
+        self.kind = kind
+        self.tag = tag
+        self.base_url = base_url
+        self.size = size
+        self.built_at = time.monotonic()
+        self._entries = sorted(self._entry(row) for row in rows)
+        self.document = self._serialize()
+
+    def _entry(self, row):
+        if self.kind == 'sitemap':
+            xml = (f'<url><loc>{escape(self.base_url)}/post/{row["id"]}</loc>'
+                   f'<lastmod>{_w3c(row["updated_at"])}</lastmod></url>\n')
+        else:
+            url = f'{escape(self.base_url)}/post/{row["id"]}'
+            xml = (f'<entry>\n'
+                   f'  <title>{escape(row["title"])}</title>\n'
+                   f'  <link href="{url}"/>\n'
+                   f'  <id>{url}</id>\n'
+                   f'  <published>{_w3c(row["created_at"])}</published>\n'
+                   f'  <updated>{_w3c(row["updated_at"])}</updated>\n'
+                   f'  <summary>{escape(row["excerpt"] or "")}</summary>\n'
+                   f'</entry>\n')
+        return (row['created_at'], row['id']), row['updated_at'], xml
+
+    def upsert(self, row):
+        """Add or re-render a post's entry, keeping only the newest size entries."""
+        entry = self._entry(row)
+        index = bisect.bisect_left(self._entries, (entry[0],))
+        if index < len(self._entries) and self._entries[index][0] == entry[0]:
+            self._entries[index] = entry
+        elif len(self._entries) < self.size or index > 0:
+            self._entries.insert(index, entry)
+            del self._entries[:-self.size]
+        else:
+            return  # Older than everything in a full document
+        self.document = self._serialize()
+
+    def discard(self, post_id):
+        """Drop a post's entry, if it has one."""
+        entries = [entry for entry in self._entries if entry[0][1] != post_id]
+        if len(entries) != len(self._entries):
+            self._entries = entries
+            self.document = self._serialize()
+
+    def _serialize(self):
+        updated = max((entry[1] for entry in self._entries), default='1970-01-01 00:00:00')
+        body = ''.join(entry[2] for entry in reversed(self._entries))
+        base = escape(self.base_url)
+        if self.kind == 'sitemap':
+            text = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+                    f'<url><loc>{base}/</loc><lastmod>{_w3c(updated)}</lastmod></url>\n'
+                    f'{body}</urlset>\n')
+        else:
+            if self.tag is None:
+                title, page, path = 'Personal Blog', '/', '/feed.xml'
+            else:
+                title = f'Personal Blog: posts tagged {self.tag}'
+                page = f'/tag/{quote(self.tag, safe="")}'
+                path = page + '/feed.xml'
+            text = ('<?xml version="1.0" encoding="utf-8"?>\n'
+                    '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+                    f'<title>{escape(title)}</title>\n'
+                    f'<link href="{base}{escape(page)}"/>\n'
+                    f'<link rel="self" href="{base}{escape(path)}"/>\n'
+                    f'<id>{base}{escape(path)}</id>\n'
+                    f'<updated>{_w3c(updated)}</updated>\n'
+                    '<author><name>Personal Blog</name></author>\n'
+                    f'{body}</feed>\n')
+        data = text.encode('utf-8')
+        return Document(data, hashlib.sha1(data).hexdigest(), _timestamp(updated))
+
+
+class FeedStore:
+    """The site's Atom feeds and sitemap, updated as posts are written."""
+
+    def __init__(self, size=FEED_SIZE, sitemap_size=SITEMAP_SIZE, max_age=300.0):
+        self.size = size
+        self.sitemap_size = sitemap_size
+        self.max_age = max_age
+        self._documents = {}  # (kind, tag) -> _Entries
+        self._lock = threading.Lock()
+
+    def _get(self, kind, tag, base_url):
+        base_url = base_url.rstrip('/')
+        with self._lock:
+            entries = self._documents.get((kind, tag))
+            if (entries is None or entries.base_url != base_url
+                    or time.monotonic() - entries.built_at > self.max_age):
+                if kind == 'sitemap':
+                    rows = database.get_all_posts(limit=self.sitemap_size, columns=SITEMAP_COLUMNS)
+                    size = self.sitemap_size
+                elif tag is None:
+                    rows, size = database.get_all_posts(limit=self.size), self.size
+                else:
+                    rows, size = database.get_posts_by_tag(tag, limit=self.size), self.size
+                    if not rows:
+                        self._documents.pop((kind, tag), None)
+                        return None
+                entries = self._documents[(kind, tag)] = _Entries(kind, tag, base_url, size, rows)
+            return entries.document
+
+    def atom(self, base_url, tag=None):
+        """The Atom feed of the newest posts, or of a tag's; None for a tag without posts."""
+        return self._get('atom', tag, base_url)
+
+    def sitemap(self, base_url):
+        """The sitemap listing the home page and the newest posts."""
+        return self._get('sitemap', None, base_url)
+
+    def post_changed(self, post_id, tag_names=(), removed_tags=()):
+        """Re-render a created or edited post in the documents that list it."""
+        with self._lock:
+            if not self._documents:
+                return
+            post = database.get_post_summary(post_id)
+            for (kind, tag), entries in list(self._documents.items()):
+                if post is None:
+                    entries.discard(post_id)
+                elif tag is None or tag in tag_names:
+                    entries.upsert(post)
+                elif tag in removed_tags:
+                    # Rebuilt on the next request, so the feed is refilled to size
+                    del self._documents[(kind, tag)]
+
+    def clear(self):
+        """Drop every document; they are rebuilt on the next request."""
+        with self._lock:
+            self._documents.clear()
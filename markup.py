@@ -0,0 +1,117 @@
+"""
+A small Markdown renderer for post content.
+
+Supports paragraphs, headings, lists, blockquotes, fenced code blocks,
+horizontal rules, **bold**, *italic*, `code` and [links](https://...).
+The text is HTML-escaped before any Markdown is applied, and links only
+keep http(s), mailto and relative URLs, so the output is safe to insert
+into a page without further sanitizing.
+"""
+import re
+
+from markupsafe import escape
+
+SAFE_URL = re.compile(r'(https?:|mailto:|/|#)', re.IGNORECASE)
+
+_heading = re.compile(r'(#{1,6})\s+(.*?)\s*#*$')
+_bullet = re.compile(r'[-*+]\s+(.*)')
+_numbered = re.compile(r'\d+[.)]\s+(.*)')
+_rule = re.compile(r'(?:-\s*){3,}$|(?:\*\s*){3,}$')
+_code_span = re.compile(r'`([^`]+)`')
+_link = re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)')
+_bold = re.compile(r'\*\*(.+?)\*\*|__(.+?)__')
+_italic = re.compile(r'\*(.+?)\*|\b_(.+?)_\b')
+_placeholder = re.compile('\x00(\\d+)\x00')
+
+
+def render_markdown(text):
+    """Render Markdown text to sanitized HTML."""
+    # NUL marks placeholders in _inline, so it can't come from the text
+    lines = str(escape(text.replace('\x00', ''))).replace('\r\n', '\n').split('\n')
+    blocks = []
+    paragraph = []
+    index = 0
+
+    def flush():
+        if paragraph:
+            blocks.append(f'<p>{_inline(" ".join(paragraph))}</p>')
+            paragraph.clear()
+
+    while index < len(lines):
+        line = lines[index]
+        stripped = line.strip()
+        if stripped.startswith('```'):
+            flush()
+            code = []
+            index += 1
+            while index < len(lines) and not lines[index].strip().startswith('```'):
+                code.append(lines[index])
+                index += 1
+            blocks.append(f'<pre><code>{chr(10).join(code)}</code></pre>')
+        elif not stripped:
+            flush()
+        elif _heading.match(stripped):
+            flush()
+            match = _heading.match(stripped)
+            level = len(match.group(1))
+            blocks.append(f'<h{level}>{_inline(match.group(2))}</h{level}>')
+        elif _rule.match(stripped):
+            flush()
+            blocks.append('<hr>')
+        elif stripped.startswith('&gt;'):
+            flush()
+            quoted = []
+            while index < len(lines) and lines[index].strip().startswith('&gt;'):
+                quoted.append(lines[index].strip()[4:].strip())
+                index += 1
+            blocks.append(f'<blockquote>{_render_quoted(quoted)}</blockquote>')
+            continue
+        elif _bullet.match(stripped) or _numbered.match(stripped):
+            flush()
+            pattern, tag = (_bullet, 'ul') if _bullet.match(stripped) else (_numbered, 'ol')
+            items = []
+            while index < len(lines) and pattern.match(lines[index].strip()):
+                items.append(f'<li>{_inline(pattern.match(lines[index].strip()).group(1))}</li>')
+                index += 1
+            blocks.append(f'<{tag}>{"".join(items)}</{tag}>')
+            continue
+        else:
+            paragraph.append(stripped)
+        index += 1
+    flush()
+    return '\n'.join(blocks)
+
+
+def _render_quoted(lines):
+    """Render the already escaped lines of a blockquote as paragraphs."""
+    paragraphs, current = [], []
+    for line in lines + ['']:
+        if line:
+            current.append(line)
+        elif current:
+            paragraphs.append(f'<p>{_inline(" ".join(current))}</p>')
+            current = []
+    return ''.join(paragraphs)
+
+
+def _inline(text):
+    """Apply inline Markdown to already escaped text."""
+    # Code spans are set aside first so nothing inside them is formatted
+    spans = []
+
+    def keep(html):
+        spans.append(html)
+        return f'\x00{len(spans) - 1}\x00'
+
+    text = _code_span.sub(lambda m: keep(f'<code>{m.group(1)}</code>'), text)
+
+    def link(match):
+        label, url = match.group(1), match.group(2)
+        if not SAFE_URL.match(url):
+            return label
+        return keep(f'<a href="{url}" rel="nofollow">') + label + keep('</a>')
+
+    text = _link.sub(link, text)
+    text = _bold.sub(lambda m: f'<strong>{m.group(1) or m.group(2)}</strong>', text)
+    text = _italic.sub(lambda m: f'<em>{m.group(1) or m.group(2)}</em>', text)
+    return _placeholder.sub(lambda m: spans[int(m.group(1))], text)
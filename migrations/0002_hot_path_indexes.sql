@@ -0,0 +1,8 @@
+-- Comments for a post in display order
+CREATE INDEX IF NOT EXISTS idx_comments_post_created ON comments (post_id, created_at, id);
+
+-- Newest-first post listings and keyset pagination
+CREATE INDEX IF NOT EXISTS idx_posts_created ON posts (created_at, id);
+
+-- Reverse lookup from a tag to its posts
+CREATE INDEX IF NOT EXISTS idx_post_tags_tag ON post_tags (tag_id, post_id);
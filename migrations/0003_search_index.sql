@@ -0,0 +1,40 @@
+-- Full-text index over post titles/content and comment titles/text.
+-- Posts are stored under their own id as rowid and comments under the
+-- negated comment id, so triggers can update a single row by rowid.
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    title,
+    body,
+    post_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+INSERT INTO search_index (rowid, title, body, post_id)
+    SELECT id, title, content, id FROM posts;
+INSERT INTO search_index (rowid, title, body, post_id)
+    SELECT -id, title, content, post_id FROM comments;
+
+CREATE TRIGGER IF NOT EXISTS posts_search_insert AFTER INSERT ON posts BEGIN
+    INSERT INTO search_index (rowid, title, body, post_id)
+        VALUES (new.id, new.title, new.content, new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS posts_search_update AFTER UPDATE OF title, content ON posts BEGIN
+    UPDATE search_index SET title = new.title, body = new.content WHERE rowid = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS posts_search_delete AFTER DELETE ON posts BEGIN
+    DELETE FROM search_index WHERE rowid = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_search_insert AFTER INSERT ON comments BEGIN
+    INSERT INTO search_index (rowid, title, body, post_id)
+        VALUES (-new.id, new.title, new.content, new.post_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_search_update AFTER UPDATE OF title, content ON comments BEGIN
+    UPDATE search_index SET title = new.title, body = new.content WHERE rowid = -new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_search_delete AFTER DELETE ON comments BEGIN
+    DELETE FROM search_index WHERE rowid = -old.id;
+END;
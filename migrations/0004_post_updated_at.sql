@@ -0,0 +1,7 @@
+-- Millisecond-precision modification time, bumped on edits and tag changes.
+-- Read routes derive their ETag/Last-Modified from it.
+ALTER TABLE posts ADD COLUMN updated_at TIMESTAMP;
+
+UPDATE posts SET updated_at = created_at;
+
+CREATE INDEX IF NOT EXISTS idx_posts_updated ON posts (updated_at);
@@ -0,0 +1,22 @@
+-- Listing summaries, so listings don't read full post bodies.
+-- excerpt and word_count are written by create_post/update_post;
+-- comment_count is kept up to date by the triggers below.
+ALTER TABLE posts ADD COLUMN excerpt TEXT;
+ALTER TABLE posts ADD COLUMN word_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE posts ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill; SQL can only count space-separated words, which is close enough
+-- until the post is next edited
+UPDATE posts SET
+    excerpt = CASE WHEN length(content) > 150 THEN substr(content, 1, 150) || '...' ELSE content END,
+    word_count = CASE WHEN trim(content) = '' THEN 0
+                      ELSE length(trim(content)) - length(replace(trim(content), ' ', '')) + 1 END,
+    comment_count = (SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.id);
+
+CREATE TRIGGER IF NOT EXISTS comments_count_insert AFTER INSERT ON comments BEGIN
+    UPDATE posts SET comment_count = comment_count + 1 WHERE id = new.post_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_count_delete AFTER DELETE ON comments BEGIN
+    UPDATE posts SET comment_count = comment_count - 1 WHERE id = old.post_id;
+END;
@@ -0,0 +1,25 @@
+-- Per-tag post counts for the tag cloud, so it doesn't have to GROUP BY
+-- over post_tags. Kept up to date by the triggers below.
+CREATE TABLE IF NOT EXISTS tag_stats (
+    tag_id INTEGER PRIMARY KEY,
+    post_count INTEGER NOT NULL DEFAULT 0,
+    last_used_at TIMESTAMP,
+    FOREIGN KEY (tag_id) REFERENCES tags (id)
+);
+
+-- Backfill, using the newest tagged post as the last use
+INSERT OR REPLACE INTO tag_stats (tag_id, post_count, last_used_at)
+SELECT pt.tag_id, COUNT(*), MAX(p.created_at)
+FROM post_tags pt JOIN posts p ON p.id = pt.post_id
+GROUP BY pt.tag_id;
+
+CREATE TRIGGER IF NOT EXISTS post_tags_stats_insert AFTER INSERT ON post_tags BEGIN
+    INSERT INTO tag_stats (tag_id, post_count, last_used_at)
+    VALUES (new.tag_id, 1, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+    ON CONFLICT (tag_id) DO UPDATE SET
+        post_count = post_count + 1, last_used_at = excluded.last_used_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_tags_stats_delete AFTER DELETE ON post_tags BEGIN
+    UPDATE tag_stats SET post_count = post_count - 1 WHERE tag_id = old.tag_id;
+END;
@@ -0,0 +1,20 @@
+-- Threaded replies. path is the zero-padded ids from the top-level comment
+-- down to this one, e.g. 0000000012/0000000045, so a whole thread sorts
+-- together and can be read with one range scan on (post_id, path).
+ALTER TABLE comments ADD COLUMN parent_id INTEGER REFERENCES comments (id);
+ALTER TABLE comments ADD COLUMN path TEXT;
+
+UPDATE comments SET path = printf('%010d', id);
+
+CREATE INDEX IF NOT EXISTS idx_comments_post_path ON comments (post_id, path);
+
+-- Top-level comments in display order, for paging through threads
+CREATE INDEX IF NOT EXISTS idx_comments_post_roots ON comments (post_id, created_at, id)
+    WHERE parent_id IS NULL;
+
+-- Fill in the path for every new comment, however it was inserted
+CREATE TRIGGER IF NOT EXISTS comments_path_insert AFTER INSERT ON comments BEGIN
+    UPDATE comments SET path = COALESCE(
+        (SELECT path || '/' FROM comments WHERE id = new.parent_id), '') || printf('%010d', new.id)
+    WHERE id = new.id;
+END;
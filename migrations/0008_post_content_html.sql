@@ -0,0 +1,4 @@
+-- Post bodies rendered from Markdown when they're written, so pages don't
+-- render them on every view. Written by create_post/update_post; rows from
+-- before this migration are rendered by database.render_missing_html().
+ALTER TABLE posts ADD COLUMN content_html TEXT;
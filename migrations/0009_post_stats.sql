@@ -0,0 +1,12 @@
+-- Per-post view counts and popularity, written in batches by views.ViewCounter.
+-- score is log(sum of e^(rate * view time)) over the post's views, so ordering
+-- by it orders posts by their exponentially decayed view counts at any time
+-- without ever rescoring old rows.
+CREATE TABLE IF NOT EXISTS post_stats (
+    post_id INTEGER PRIMARY KEY,
+    views INTEGER NOT NULL DEFAULT 0,
+    score REAL NOT NULL,
+    FOREIGN KEY (post_id) REFERENCES posts (id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_post_stats_score ON post_stats (score DESC, post_id DESC);
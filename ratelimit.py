@@ -0,0 +1,195 @@
+"""
+Rate limiting and admission control for write endpoints.
+
+RateLimiter is a token bucket per key: each key may burst up to `burst`
+requests, then gets `rate` more per second. Buckets live in a backend;
+MemoryBackend keeps them in this process, SQLiteBackend keeps them in a
+small SQLite file of their own so every worker process on a host shares
+them without touching the blog database's write lock.
+
+AdmissionQueue bounds how many writes run at once and how many may wait
+for a turn. Anything beyond that is refused straight away, so a burst is
+shed with 429 instead of piling up on the database lock.
+"""
+import itertools
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend:
+    """Token buckets in this process's memory.
+
+    At most max_keys buckets are kept; past that the least recently used
+    are dropped, which at worst hands an idle key a fresh, full bucket.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at), oldest first
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        """Take a token from key's bucket; return seconds until one is free, 0 if taken."""
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = (1 - tokens) / rate if tokens < 1 else 0
+            self._buckets[key] = (tokens if wait else tokens - 1, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        """Forget every bucket."""
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBackend:
+    """Token buckets in a SQLite file, shared by the processes that open it.
+
+    Every prune_every calls to take(), buckets that have refilled
+    completely are deleted, so the table only holds recently seen keys.
+    """
+
+    def __init__(self, path, timeout=1.0, prune_every=1000):
+        self.path = path
+        self.timeout = timeout
+        self.prune_every = prune_every
+        self._calls = itertools.count(1)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')  # Losing buckets in a crash is harmless
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, now):
+        """Take a token from key's bucket; return seconds until one is free, 0 if taken."""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE key = ?',
+                               (key,)).fetchone()
+            tokens, updated_at = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0, now - updated_at) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) '
+                         'VALUES (?, ?, ?)', (key, tokens - 1 if wait == 0 else tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if next(self._calls) % self.prune_every == 0:
+            self.prune(rate, burst, now)
+        return wait
+
+    def prune(self, rate, burst, now=None):
+        """Delete buckets that have refilled completely."""
+        now = time.time() if now is None else now
+        conn = self._connection()
+        conn.execute('DELETE FROM rate_buckets WHERE updated_at <= ?', (now - burst / rate,))
+
+    def clear(self):
+        """Forget every bucket."""
+        self._connection().execute('DELETE FROM rate_buckets')
+
+
+class RateLimiter:
+    """A token bucket per key, refilled at rate tokens per second up to burst."""
+
+    def __init__(self, rate, burst, backend=None):
+        self.rate = rate
+        self.burst = burst
+        self.backend = MemoryBackend() if backend is None else backend
+        self._lock = threading.Lock()
+        self._stats = {'allowed': 0, 'limited': 0}
+
+    def hit(self, key):
+        """Count a request for key; return 0 if allowed, else seconds to wait."""
+        wait = self.backend.take(key, self.rate, self.burst, time.time())
+        with self._lock:
+            self._stats['allowed' if wait == 0 else 'limited'] += 1
+        return wait
+
+    def reset(self):
+        """Refill every bucket."""
+        self.backend.clear()
+
+    def stats(self):
+        """Return allowed/limited counters and the limits."""
+        with self._lock:
+            return dict(self._stats, rate=self.rate, burst=self.burst,
+                        backend=type(self.backend).__name__)
+
+
+class AdmissionQueue:
+    """Lets max_active callers in at once, with at most max_waiting queued.
+
+    acquire() returns False, without waiting, when the queue is full, and
+    after waiting timeout seconds for a turn.
+    """
+
+    def __init__(self, max_active=4, max_waiting=32, timeout=2.0):
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._active = 0
+        self._waiting = 0
+        self._lock = threading.Condition()
+        self._stats = {'admitted': 0, 'rejected': 0, 'timeouts': 0,
+                       'peak_active': 0, 'peak_waiting': 0}
+
+    def acquire(self):
+        """Take a turn; return False if the caller should be turned away."""
+        with self._lock:
+            if self._active >= self.max_active:
+                if self._waiting >= self.max_waiting:
+                    self._stats['rejected'] += 1
+                    return False
+                self._waiting += 1
+                self._stats['peak_waiting'] = max(self._stats['peak_waiting'], self._waiting)
+                try:
+                    admitted = self._lock.wait_for(lambda: self._active < self.max_active,
+                                                   self.timeout)
+                finally:
+                    self._waiting -= 1
+                if not admitted:
+                    self._stats['timeouts'] += 1
+                    return False
+            self._active += 1
+            self._stats['admitted'] += 1
+            self._stats['peak_active'] = max(self._stats['peak_active'], self._active)
+            return True
+
+    def release(self):
+        """Give back a turn taken by acquire()."""
+        with self._lock:
+            self._active -= 1
+            self._lock.notify()
+
+    def retry_after(self):
+        """Seconds a turned away caller should wait before trying again."""
+        return max(1, math.ceil(self.timeout))
+
+    def stats(self):
+        """Return admission counters and the current queue state."""
+        with self._lock:
+            return dict(self._stats, active=self._active, waiting=self._waiting,
+                        max_active=self.max_active, max_waiting=self.max_waiting)
@@ -0,0 +1,201 @@
+"""
+Related posts ranked by the Jaccard similarity of their tag sets.
+
+The index keeps a bitmap of posts per tag and per tag count, stored as
+Python ints like tag_index.TagIndex. Ranking a tag set sums its tags'
+bitmaps into bit-sliced counters, so one pass of big-int operations gives
+every post's overlap with the set. Jaccard then depends only on the
+overlap and the other post's tag count, so the best candidates are read
+off a few (overlap, tag count) bitmaps in score order.
+
+Rankings are memoized per tag set, which makes a lookup a pair of dict
+reads. add() and remove() keep the bitmaps current and drop only the
+rankings of tag sets sharing a tag with the changed post.
+
+Each tag has a generation, bumped whenever a post carrying it changes.
+version() sums them over a post's tags, so pages showing its related
+posts can be validated and cached against it. The index is rebuilt every
+max_age seconds, outside the lock: lookups keep using the old index, and
+writes made meanwhile are replayed onto the new one.
+"""
+import threading
+import time
+from fractions import Fraction
+
+from tag_index import page_ids, to_bitmaps
+
+RELATED_LIMIT = 5
+
+
+class RelatedIndex:
+    """Related posts by tag overlap, built from (tag_name, post_id) pairs."""
+
+    def __init__(self, load, limit=RELATED_LIMIT, max_age=300.0):
+        self._load = load
+        self.limit = limit
+        self.max_age = max_age
+        self._post_tags = None  # post id -> frozenset of tag names
+        self._bitmaps = {}  # tag name -> posts
+        self._by_count = {}  # number of tags -> posts
+        self._rankings = {}  # frozenset of tag names -> [(post id, score)]
+        self._generations = {}  # tag name -> times a post with the tag changed
+        self._builds = 0  # Times the index was built from nothing
+        self._pending = None  # Writes made during a rebuild, to replay onto it
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._post_tags is not None and time.monotonic() - self._loaded_at <= self.max_age:
+            return
+        # Only the first build makes callers wait; later ones serve the old index
+        if not self._build_lock.acquire(blocking=self._post_tags is None):
+            return
+        try:
+            if self._post_tags is None or time.monotonic() - self._loaded_at > self.max_age:
+                self._build()
+        finally:
+            self._build_lock.release()
+
+    def _build(self):
+        with self._lock:
+            self._pending = []
+        try:
+            postings = {}
+            for name, post_id in self._load():
+                postings.setdefault(post_id, set()).add(name)
+            post_tags = {post_id: frozenset(names) for post_id, names in postings.items()}
+            tag_ids, count_ids = {}, {}
+            for post_id, names in post_tags.items():
+                for name in names:
+                    tag_ids.setdefault(name, []).append(post_id)
+                count_ids.setdefault(len(names), []).append(post_id)
+            bitmaps, by_count = to_bitmaps(tag_ids), to_bitmaps(count_ids)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            old, pending = self._post_tags, self._pending
+            self._post_tags, self._bitmaps, self._by_count = post_tags, bitmaps, by_count
+            self._rankings = {}
+            self._pending = None
+            self._loaded_at = time.monotonic()
+            if old is None:
+                self._builds += 1
+            else:
+                # Posts changed by other processes since the last build
+                changed = set()
+                for post_id in old.keys() | post_tags.keys():
+                    if old.get(post_id) != post_tags.get(post_id):
+                        changed |= old.get(post_id, frozenset()) | post_tags.get(post_id, frozenset())
+                self._bump(changed)
+            for post_id, added, removed in pending:
+                self._apply(post_id, added, removed)
+
+    def _bump(self, names):
+        for name in names:
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+    def version(self, post_id):
+        """A value that changes whenever the post's related posts may have."""
+        self._ensure_loaded()
+        with self._lock:
+            names = (self._post_tags or {}).get(post_id, frozenset())
+            return self._builds, sum(self._generations.get(name, 0) for name in names)
+
+    def related(self, post_id):
+        """Return up to limit (post_id, score) pairs for a post, most similar first."""
+        self._ensure_loaded()
+        with self._lock:
+            names = (self._post_tags or {}).get(post_id)
+            if not names:
+                return []
+            ranking = self._rankings.get(names)
+            if ranking is None:
+                # One extra, since the post itself is in its own ranking
+                ranking = self._rankings[names] = self._rank(names, self.limit + 1)
+        return [(other, score) for other, score in ranking if other != post_id][:self.limit]
+
+    def _rank(self, names, limit):
+        # Bit-sliced counters: bit i of each post's overlap is in planes[i]
+        planes = []
+        for name in names:
+            carry = self._bitmaps.get(name, 0)
+            for i, plane in enumerate(planes):
+                planes[i], carry = plane ^ carry, plane & carry
+                if not carry:
+                    break
+            if carry:
+                planes.append(carry)
+        candidates = 0
+        for plane in planes:
+            candidates |= plane
+
+        size = len(names)
+        pairs = sorted(((Fraction(overlap, size + count - overlap), overlap, count)
+                        for overlap in range(1, size + 1)
+                        for count in self._by_count if count >= overlap), reverse=True)
+        levels = {}
+        ranking = []
+        for score, overlap, count in pairs:
+            if overlap not in levels:
+                level = candidates
+                for i, plane in enumerate(planes):
+                    level &= plane if overlap >> i & 1 else ~plane
+                levels[overlap] = level
+            bits = levels[overlap] & self._by_count[count]
+            ranking.extend((other, round(float(score), 4))
+                           for other in page_ids(bits, limit - len(ranking)))
+            if len(ranking) >= limit:
+                break
+        return ranking
+
+    def add(self, post_id, names):
+        """Record that a post now carries the given tags."""
+        self._update(post_id, set(names), set())
+
+    def remove(self, post_id, names):
+        """Record that a post no longer carries the given tags."""
+        self._update(post_id, set(), set(names))
+
+    def touch(self, post_id):
+        """Record that a post's title or content changed, but not its tags."""
+        with self._lock:
+            if self._post_tags is not None:
+                self._bump(self._post_tags.get(post_id, ()))
+
+    def _update(self, post_id, added, removed):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((post_id, added, removed))
+            if self._post_tags is not None:  # Else picked up when the index is first built
+                self._apply(post_id, added, removed)
+
+    def _apply(self, post_id, added, removed):
+        old = self._post_tags.get(post_id, frozenset())
+        new = (old | added) - removed
+        if new == old:
+            return
+        bit = 1 << post_id
+        for name in old - new:
+            self._bitmaps[name] &= ~bit
+        for name in new - old:
+            self._bitmaps[name] = self._bitmaps.get(name, 0) | bit
+        if old:
+            self._by_count[len(old)] &= ~bit
+        if new:
+            self._by_count[len(new)] = self._by_count.get(len(new), 0) | bit
+            self._post_tags[post_id] = frozenset(new)
+        else:
+            self._post_tags.pop(post_id, None)
+        # The post's score against any set sharing one of its tags changed
+        affected = old | new
+        for key in [key for key in self._rankings if key & affected]:
+            del self._rankings[key]
+        self._bump(affected)
+
+    def clear(self):
+        """Drop the index so it is rebuilt on next use."""
+        with self._lock:
+            self._post_tags = None
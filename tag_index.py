@@ -0,0 +1,138 @@
+import threading
+import time
+
+
+class TagIndex:
+    """An in-memory inverted index from tag name to the posts carrying it.
+
+    Each tag maps to a bitmap of post ids stored as a Python int, so AND and
+    OR across tags are single big-int operations. The index is built from
+    load() on first use, which yields (tag_name, post_id) pairs. After that
+    it is kept current with add()/remove(), and rebuilt after max_age
+    seconds to pick up writes made by other processes. Rebuilds run outside
+    the lock: lookups keep using the old bitmaps, and writes made meanwhile
+    are replayed onto the new ones.
+    """
+
+    def __init__(self, load, max_age=300.0):
+        self._load = load
+        self.max_age = max_age
+        self._bitmaps = None
+        self._pending = None  # Writes made during a rebuild, to replay onto it
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def _get_bitmaps(self):
+        bitmaps = self._bitmaps
+        if bitmaps is not None and time.monotonic() - self._loaded_at <= self.max_age:
+            return bitmaps
+        # Only the first build makes callers wait; later ones serve the old bitmaps
+        if self._build_lock.acquire(blocking=bitmaps is None):
+            try:
+                if self._bitmaps is None or time.monotonic() - self._loaded_at > self.max_age:
+                    self._rebuild()
+            finally:
+                self._build_lock.release()
+        return self._bitmaps if self._bitmaps is not None else bitmaps
+
+    def _rebuild(self):
+        with self._lock:
+            self._pending = []
+        try:
+            bitmaps = self._build()
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._bitmaps = bitmaps
+            self._loaded_at = time.monotonic()
+            for apply, post_id, names in pending:
+                apply(post_id, names)
+
+    def _build(self):
+        postings = {}
+        for name, post_id in self._load():
+            postings.setdefault(name, []).append(post_id)
+        return to_bitmaps(postings)
+
+    def has_tag(self, name):
+        """Whether any post carries the tag."""
+        return bool(self._get_bitmaps().get(name))
+
+    def match_all(self, names):
+        """Bitmap of the posts carrying every one of the tags."""
+        bitmaps = self._get_bitmaps()
+        result = None
+        for name in names:
+            bits = bitmaps.get(name, 0)
+            result = bits if result is None else result & bits
+        return result or 0
+
+    def match_any(self, names):
+        """Bitmap of the posts carrying at least one of the tags."""
+        bitmaps = self._get_bitmaps()
+        result = 0
+        for name in names:
+            result |= bitmaps.get(name, 0)
+        return result
+
+    def add(self, post_id, names):
+        """Record that a post now carries the given tags."""
+        self._update(self._add, post_id, names)
+
+    def remove(self, post_id, names):
+        """Record that a post no longer carries the given tags."""
+        self._update(self._remove, post_id, names)
+
+    def _update(self, apply, post_id, names):
+        names = list(names)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((apply, post_id, names))
+            if self._bitmaps is not None:  # Else picked up when the index is first built
+                apply(post_id, names)
+
+    def _add(self, post_id, names):
+        for name in names:
+            self._bitmaps[name] = self._bitmaps.get(name, 0) | (1 << post_id)
+
+    def _remove(self, post_id, names):
+        for name in names:
+            bits = self._bitmaps.get(name, 0) & ~(1 << post_id)
+            if bits:
+                self._bitmaps[name] = bits
+            else:
+                self._bitmaps.pop(name, None)
+
+    def clear(self):
+        """Drop the index so it is rebuilt on next use."""
+        with self._lock:
+            self._bitmaps = None
+
+
+def to_bitmaps(post_ids_by_key):
+    """Return a bitmap of post ids for each key of a dict of post id lists."""
+    # Setting bits one at a time would copy the whole int per post,
+    # so set them in a bytearray and convert each key's bytes in one go
+    bitmaps = {}
+    for key, post_ids in post_ids_by_key.items():
+        bits = bytearray(max(post_ids) // 8 + 1)
+        for post_id in post_ids:
+            bits[post_id >> 3] |= 1 << (post_id & 7)
+        bitmaps[key] = int.from_bytes(bits, 'little')
+    return bitmaps
+
+
+def page_ids(bits, limit, before_id=None):
+    """Return up to limit post ids from a bitmap, highest first, below before_id."""
+    if before_id is not None:
+        bits &= (1 << before_id) - 1
+    post_ids = []
+    while bits and len(post_ids) < limit:
+        post_id = bits.bit_length() - 1
+        post_ids.append(post_id)
+        bits ^= 1 << post_id
+    return post_ids
@@ -1,35 +1,29 @@
 import pytest
 import os
-from app import app
+import time
+from app import app, COMMENT_BURST, comment_admission, comment_limiter, feeds, fragment_cache, page_cache, related_index, tag_index, view_counter
 import database
 
-TEST_DB = 'test_blog.db'
+from conftest import TEST_DB
 
 @pytest.fixture
-def client():
-    """Create a test client for the Flask app."""
-    # Use test database
-    database.DATABASE_NAME = TEST_DB
-    
+def client(test_db):
+    """Create a test client for the Flask app on a fresh copy of the test database."""
     # Configure app for testing
     app.config['TESTING'] = True
     
-    # Initialize test database
-    database.init_db()
+    page_cache.clear()
+    fragment_cache.clear()
+    tag_index.clear()
+    related_index.clear()
+    comment_limiter.reset()
+    feeds.clear()
     
     with app.test_client() as client:
         yield client
     
-    # Clean up after test
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
-
+    view_counter.clear()
 
-# ============================================================================
-# INTEGRATION TESTS
-# These tests use the Flask test client AND database functions for setup
-# They verify that routes work correctly with the database layer
-# ============================================================================
 
 def test_integration_home_page(client):
     """Test that the home page loads."""
@@ -58,7 +52,8 @@ def test_integration_create_post_via_form(client):
     posts = database.get_all_posts()
     assert len(posts) == 1
     assert posts[0]['title'] == 'Test Post Title'
-    assert posts[0]['content'] == 'This is test content for the post.'
+    post = database.get_post_by_id(posts[0]['id'])
+    assert post['content'] == 'This is test content for the post.'
 
 def test_integration_view_post_detail(client):
     """Test viewing a specific post detail page."""
@@ -163,3 +158,637 @@ def test_e2e_full_post_workflow(client):
     assert b'E2E Comment' in response.data
     assert b'E2E Tester' in response.data
     assert b'This comment was added via E2E test.' in response.data
+
+def test_integration_request_reuses_one_connection(client):
+    """Test that a request checks out a single pooled connection."""
+    for i in range(5):
+        database.create_post(f'Post {i}', 'Some content here.')
+    pool = database.get_pool()
+    checkouts = pool.stats()['checkouts']
+    
+    response = client.get('/')
+    assert response.status_code == 200
+    assert pool.stats()['checkouts'] == checkouts + 1
+
+def test_integration_pool_stats(client):
+    """Test the pool stats endpoint."""
+    response = client.get('/api/pool')
+    assert response.status_code == 200
+    data = response.get_json()
+    for key in ('checkouts', 'waits', 'peak_in_use', 'size', 'in_use'):
+        assert key in data
+
+def count_queries(client, url, monkeypatch):
+    """Return the number of SQL statements run while serving a GET request."""
+    statements = []
+    original_connect = database.ConnectionPool._connect
+    
+    def traced_connect(pool):
+        conn = original_connect(pool)
+        conn.set_trace_callback(statements.append)
+        return conn
+    
+    # Start from a fresh pool so every connection is traced
+    monkeypatch.setattr(database.ConnectionPool, '_connect', traced_connect)
+    database.close_pool()
+    page_cache.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    database.close_pool()
+    return len(statements)
+
+def test_integration_listing_query_count_is_constant(client, monkeypatch):
+    """Test that listing pages don't run a tag query per post."""
+    def add_tagged_posts(count):
+        for i in range(count):
+            database.create_post(f'Post {i}', 'Some content here.')
+        for post in database.get_all_posts():
+            database.add_tag_to_post(post['id'], 'python')
+    
+    add_tagged_posts(2)
+    home_small = count_queries(client, '/', monkeypatch)
+    tag_small = count_queries(client, '/tag/python', monkeypatch)
+    
+    add_tagged_posts(10)
+    assert count_queries(client, '/', monkeypatch) == home_small
+    assert count_queries(client, '/tag/python', monkeypatch) == tag_small
+
+def test_integration_home_pagination(client):
+    """Test that the home page links to the next page of posts."""
+    for i in range(3):
+        database.create_post(f'Paged Post {i}', 'Some content here.')
+    
+    response = client.get('/?limit=2')
+    assert b'Paged Post 2' in response.data
+    assert b'Paged Post 0' not in response.data
+    
+    import re
+    match = re.search(r'href="(/\?cursor=[^"]+)"', response.data.decode('utf-8'))
+    assert match is not None, "Could not find next page link"
+    response = client.get(match.group(1).replace('&amp;', '&'))
+    assert b'Paged Post 0' in response.data
+    assert b'Paged Post 2' not in response.data
+    assert b'Older posts' not in response.data
+
+def test_integration_posts_api_pagination(client):
+    """Test paging through the posts JSON API with next_cursor."""
+    for i in range(3):
+        database.create_post(f'Post {i}', 'Some content here.')
+    
+    data = client.get('/posts?limit=2').get_json()
+    assert [post['title'] for post in data['posts']] == ['Post 2', 'Post 1']
+    assert data['next_cursor']
+    
+    data = client.get(f"/posts?limit=2&cursor={data['next_cursor']}").get_json()
+    assert [post['title'] for post in data['posts']] == ['Post 0']
+    assert data['next_cursor'] is None
+
+def test_integration_invalid_cursor(client):
+    """Test that a malformed cursor is rejected."""
+    response = client.get('/posts?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+def test_integration_search(client):
+    """Test the search page and JSON endpoint."""
+    database.create_post('Searchable Post', 'Content with <b>markup</b> and keyword.')
+    
+    response = client.get('/search?q=keyword')
+    assert response.status_code == 200
+    assert b'Searchable Post' in response.data
+    assert b'<mark>keyword</mark>' in response.data
+    # User content is escaped; only the highlight markup is raw HTML
+    assert b'<b>markup</b>' not in response.data
+    
+    data = client.get('/api/search?q=keyword').get_json()
+    assert data['results'][0]['post_title'] == 'Searchable Post'
+    assert '<mark>keyword</mark>' in data['results'][0]['snippet']
+    
+    response = client.get('/search?q=missing')
+    assert b'No results found' in response.data
+
+def test_integration_page_cache_invalidation(client):
+    """Test that pages are cached and writes drop the affected pages."""
+    database.create_post('Cached Post', 'Some content here.')
+    post_id = database.get_all_posts()[0]['id']
+    database.add_tag_to_post(post_id, 'cached')
+    
+    client.get(f'/post/{post_id}')
+    client.get('/tag/cached')
+    client.get('/')
+    hits = page_cache.stats()['hits']
+    client.get(f'/post/{post_id}')
+    assert page_cache.stats()['hits'] == hits + 1
+    
+    # A comment only changes the post page
+    client.post(f'/post/{post_id}/comment', data={
+        'author': 'Reader',
+        'title': 'Fresh Comment',
+        'content': 'Shows up right away.'
+    })
+    assert b'Fresh Comment' in client.get(f'/post/{post_id}').data
+    
+    # An edit changes the post page, its tag pages and the home page
+    client.post(f'/edit/{post_id}', data={
+        'title': 'Edited Post',
+        'content': 'Some edited content.',
+        'tags': 'cached'
+    })
+    assert b'Edited Post' in client.get(f'/post/{post_id}').data
+    assert b'Edited Post' in client.get('/tag/cached').data
+    assert b'Edited Post' in client.get('/').data
+
+def test_integration_cache_stats(client):
+    """Test the page cache stats endpoint."""
+    before = page_cache.stats()
+    client.get('/')
+    client.get('/')
+    data = client.get('/api/cache').get_json()
+    assert data['hits'] == before['hits'] + 1
+    assert data['misses'] == before['misses'] + 1
+    assert data['entries'] == 1
+
+def test_integration_conditional_get(client):
+    """Test that unchanged pages are answered with 304 Not Modified."""
+    database.create_post('Conditional Post', 'Some content here.')
+    post_id = database.get_all_posts()[0]['id']
+    
+    for url in ('/', f'/post/{post_id}', '/posts', f'/posts/{post_id}/comments'):
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert response.headers['Last-Modified']
+        
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+
+def test_integration_conditional_get_after_change(client):
+    """Test that a comment changes the post page's ETag."""
+    database.create_post('Conditional Post', 'Some content here.')
+    post_id = database.get_all_posts()[0]['id']
+    response = client.get(f'/post/{post_id}')
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    
+    response = client.get(f'/post/{post_id}', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+    
+    client.post(f'/post/{post_id}/comment', data={
+        'author': 'Reader',
+        'title': 'New Comment',
+        'content': 'Changes the page.'
+    })
+    response = client.get(f'/post/{post_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'New Comment' in response.data
+    assert response.headers['ETag'] != etag
+
+def test_integration_cached_page_follows_version(client):
+    """Test that a write the page cache didn't see (e.g. another worker's) isn't served stale."""
+    import sqlite3
+    post_id = database.create_post('Old Title', 'Some content here.')
+    assert b'Old Title' in client.get(f'/post/{post_id}').data
+    
+    conn = sqlite3.connect(TEST_DB)
+    conn.execute("UPDATE posts SET title = 'New Title', updated_at = '2099-01-01 00:00:00' "
+                 "WHERE id = ?", (post_id,))
+    conn.commit()
+    conn.close()
+    
+    response = client.get(f'/post/{post_id}')
+    assert b'New Title' in response.data
+    etag = response.headers['ETag']
+    response = client.get(f'/post/{post_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+def test_integration_create_comment_api(client):
+    """Test creating a comment through the JSON API."""
+    post_id = database.create_post('Post', 'Some content here.')
+    response = client.post(f'/posts/{post_id}/comments', json={
+        'author': 'API Reader',
+        'content': 'Posted as JSON.'
+    })
+    assert response.status_code == 201
+    
+    comments = client.get(f'/posts/{post_id}/comments').get_json()
+    assert [comment['author'] for comment in comments] == ['API Reader']
+
+def test_integration_query_profiling(client, monkeypatch, caplog):
+    """Test Server-Timing, the slow query log, the debug footer and /metrics."""
+    monkeypatch.setitem(app.config, 'QUERY_PROFILING', True)
+    monkeypatch.setitem(app.config, 'SLOW_QUERY_MS', 0)
+    monkeypatch.setitem(app.config, 'QUERY_DEBUG_FOOTER', True)
+    database.create_post('Profiled Post', 'Some content here.')
+    
+    response = client.get('/')
+    server_timing = response.headers.get_all('Server-Timing')
+    assert server_timing[0].startswith('db;dur=')
+    assert 'queries"' in server_timing[0]
+    assert b'FROM posts' in response.data
+    assert 'Slow query' in caplog.text
+    
+    metrics_text = client.get('/metrics').data.decode('utf-8')
+    assert 'blog_request_queries_count{route="/"}' in metrics_text
+    assert 'blog_slow_queries_total{route="/"}' in metrics_text
+
+def test_integration_async_view_profiling(client, monkeypatch):
+    """Test that the post page's queries are profiled, on the async workers too."""
+    monkeypatch.setitem(app.config, 'QUERY_PROFILING', True)
+    post_id = database.create_post_with_tags('Async Post', 'Some content here.', ['async'])
+    database.create_comment(post_id, 'Reader', 'Hi', 'A comment.')
+    related_index.related(post_id)  # Load the index, which happens once per process
+    
+    for async_page in (False, True):
+        monkeypatch.setitem(app.config, 'ASYNC_POST_PAGE', async_page)
+        page_cache.clear()
+        response = client.get(f'/post/{post_id}')
+        assert b'Async Post' in response.data and b'A comment.' in response.data
+        # The version check plus the post, tags, top-level comments and replies queries
+        assert '5 queries' in response.headers.get_all('Server-Timing')[0]
+        assert client.get('/post/999').status_code == 404
+
+def test_integration_query_profiling_off(client):
+    """Test that nothing is recorded when profiling is off."""
+    response = client.get('/')
+    assert 'Server-Timing' not in response.headers
+
+def test_integration_posts_api_fields(client):
+    """Test projecting the posts JSON API onto a few fields."""
+    database.create_post('Post', 'Some content here.')
+    
+    data = client.get('/posts').get_json()
+    assert data['posts'][0]['content'] == 'Some content here.'
+    
+    data = client.get('/posts?fields=title,excerpt').get_json()
+    assert data['posts'] == [{'title': 'Post', 'excerpt': 'Some content here.'}]
+    
+    response = client.get('/posts?fields=title,password')
+    assert response.status_code == 400
+
+def test_integration_comment_count_on_home(client):
+    """Test that the home page shows the maintained comment count."""
+    post_id = database.create_post('Post', 'Some content here.')
+    assert b'0 comments' in client.get('/').data
+    
+    client.post(f'/post/{post_id}/comment', data={
+        'author': 'Reader',
+        'title': 'Comment',
+        'content': 'Counts on the home page.'
+    })
+    assert b'1 comment' in client.get('/').data
+
+def test_integration_stream_posts(client):
+    """Test streaming all posts as a JSON array and as NDJSON."""
+    import json
+    for i in range(5):
+        database.create_post(f'Post {i}', 'Some content here.')
+    
+    response = client.get('/posts?stream=1&fields=id,title')
+    assert response.is_streamed
+    data = json.loads(response.data)
+    assert [post['title'] for post in data['posts']] == [f'Post {i}' for i in range(4, -1, -1)]
+    assert data['next_cursor'] is None
+    
+    response = client.get('/posts', headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.data.decode('utf-8').splitlines()
+    assert [json.loads(line)['title'] for line in lines] == [f'Post {i}' for i in range(4, -1, -1)]
+
+def test_integration_stream_comments(client, monkeypatch):
+    """Test streaming comments in chunks."""
+    import json
+    import app as blog
+    monkeypatch.setattr(blog, 'STREAM_CHUNK_ROWS', 2)
+    post_id = database.create_post('Post', 'Some content here.')
+    for i in range(5):
+        database.create_comment(post_id, f'Reader {i}', 'Hi', 'Nice post')
+    
+    response = client.get(f'/posts/{post_id}/comments?stream=1')
+    comments = json.loads(response.data)
+    assert [comment['author'] for comment in comments] == [f'Reader {i}' for i in range(5)]
+    
+    response = client.get(f'/posts/{post_id}/comments', headers={'Accept': 'application/x-ndjson'})
+    assert len(response.data.decode('utf-8').splitlines()) == 5
+    
+    empty = client.get(f'/posts/{post_id + 1}/comments?stream=1')
+    assert json.loads(empty.data) == []
+
+def test_integration_tags(client):
+    """Test the tag cloud page and API, and that tag changes show up."""
+    database.create_post_with_tags('Tagged Post', 'Some content here.', ['python', 'flask'])
+    database.create_post_with_tags('Other Post', 'More content here.', ['python'])
+    
+    data = client.get('/api/tags').get_json()
+    assert [(tag['name'], tag['post_count']) for tag in data['tags']] == [('flask', 1), ('python', 2)]
+    assert all(tag['last_used_at'] for tag in data['tags'])
+    response = client.get('/tags')
+    assert b'python (2)' in response.data
+    
+    # Served from the cache until the tags change
+    hits = page_cache.stats()['hits']
+    client.get('/api/tags')
+    assert page_cache.stats()['hits'] == hits + 1
+    
+    client.post('/create', data={
+        'title': 'Third Post',
+        'content': 'Even more content here.',
+        'tags': 'python, sqlite'
+    })
+    data = client.get('/api/tags').get_json()
+    assert [(tag['name'], tag['post_count']) for tag in data['tags']] == [
+        ('flask', 1), ('python', 3), ('sqlite', 1)]
+    assert b'sqlite (1)' in client.get('/tags').data
+
+def test_integration_multi_tag_pages(client):
+    """Test AND (a+b) and OR (a,b) tag pages and that tag edits show up."""
+    database.create_post_with_tags('Both Tags', 'Some content here.', ['python', 'flask'])
+    database.create_post_with_tags('Python Only', 'Some content here.', ['python'])
+    database.create_post_with_tags('Flask Only', 'Some content here.', ['flask'])
+    database.create_post_with_tags('Plus Plus', 'Some content here.', ['c++'])
+    
+    response = client.get('/tag/python+flask')
+    assert b'Both Tags' in response.data
+    assert b'Python Only' not in response.data and b'Flask Only' not in response.data
+    
+    response = client.get('/tag/python,flask')
+    assert b'Both Tags' in response.data and b'Python Only' in response.data
+    assert b'Flask Only' in response.data and b'Plus Plus' not in response.data
+    
+    # A tag name containing a separator is still a single tag
+    assert b'Plus Plus' in client.get('/tag/c++').data
+    
+    # Posts are paged newest id first
+    response = client.get('/tag/python,flask?limit=2')
+    assert response.data.index(b'Flask Only') < response.data.index(b'Python Only')
+    assert b'Both Tags' not in response.data
+    cursor = response.data.split(b'cursor=')[1].split(b'&')[0].split(b'"')[0].decode()
+    assert b'Both Tags' in client.get(f'/tag/python,flask?limit=2&cursor={cursor}').data
+    
+    client.post('/create', data={
+        'title': 'New Both',
+        'content': 'Created after the index was built.',
+        'tags': 'python, flask'
+    })
+    assert b'New Both' in client.get('/tag/python+flask').data
+
+def test_integration_read_your_writes(client, monkeypatch):
+    """Test that a session sees its own writes while others read a stale snapshot."""
+    monkeypatch.setattr(database, 'READ_ROUTING_ENABLED', True)
+    monkeypatch.setattr(database, 'READ_SNAPSHOT_INTERVAL', 3600)
+    client.get('/')
+    
+    response = client.post('/create', data={
+        'title': 'Fresh Post',
+        'content': 'Written after the snapshot.',
+        'tags': ''
+    })
+    assert 'last_write=' in response.headers['Set-Cookie']
+    assert b'Fresh Post' in client.get('/').data
+    
+    # Another session reads the snapshot until it is refreshed
+    other = app.test_client()
+    assert b'Fresh Post' not in other.get('/').data
+    assert b'Fresh Post' in client.get('/').data
+
+def test_integration_comment_threads(client):
+    """Test paged comment threads on the post page and the JSON endpoints."""
+    post_id = database.create_post('Threaded Post', 'Some content here.')
+    roots = [database.create_comment(post_id, 'Reader', f'Root {i}', f'Root comment {i}')
+             for i in range(3)]
+    
+    response = client.post(f'/posts/{post_id}/comments', json={
+        'author': 'Replier', 'content': 'A JSON reply', 'parent_id': roots[0]})
+    assert response.status_code == 201
+    reply_id = response.get_json()['id']
+    client.post(f'/post/{post_id}/comment', data={
+        'author': 'Replier', 'title': 'Nested', 'content': 'A form reply', 'parent_id': reply_id})
+    response = client.post(f'/posts/{post_id}/comments', json={
+        'author': 'Replier', 'content': 'Bad parent', 'parent_id': 9999})
+    assert response.status_code == 400
+    for bad_parent in ([roots[0]], str(roots[0]), True, 1.5):
+        comment_limiter.reset()
+        response = client.post(f'/posts/{post_id}/comments', json={
+            'author': 'Replier', 'content': 'Bad parent', 'parent_id': bad_parent})
+        assert response.status_code == 400
+    
+    response = client.get(f'/post/{post_id}?limit=2')
+    assert b'Comments (5)' in response.data
+    assert b'Root comment 1' in response.data and b'Root comment 2' not in response.data
+    assert response.data.index(b'A JSON reply') < response.data.index(b'A form reply') \
+        < response.data.index(b'Root comment 1')
+    assert b'More comments' in response.data
+    
+    data = client.get(f'/posts/{post_id}/threads?limit=2').get_json()
+    assert [thread['content'] for thread in data['comments']] == ['Root comment 0', 'Root comment 1']
+    assert [(r['content'], r['depth']) for r in data['comments'][0]['replies']] == [
+        ('A JSON reply', 1), ('A form reply', 2)]
+    data = client.get(f'/posts/{post_id}/threads?limit=2&cursor={data["next_cursor"]}').get_json()
+    assert [thread['content'] for thread in data['comments']] == ['Root comment 2']
+    assert data['next_cursor'] is None
+    
+    thread = client.get(f'/comments/{reply_id}/thread').get_json()
+    assert [comment['content'] for comment in thread] == ['A JSON reply', 'A form reply']
+    assert client.get('/comments/9999/thread').status_code == 404
+
+def test_integration_post_fragments(client):
+    """Test that post cards and bodies are cached until the post changes."""
+    post_id = database.create_post('Post', 'Some *Markdown* here.')
+    
+    response = client.get(f'/post/{post_id}')
+    assert b'<p>Some <em>Markdown</em> here.</p>' in response.data
+    
+    assert b'Some *Markdown* here.' in client.get('/').data
+    page_cache.clear()
+    hits = fragment_cache.stats()['hits']
+    assert b'Some *Markdown* here.' in client.get('/').data
+    assert fragment_cache.stats()['hits'] == hits + 1
+    
+    client.post(f'/edit/{post_id}', data={'title': 'Edited', 'content': 'New **body**.', 'tags': ''})
+    assert b'Edited' in client.get('/').data
+    assert b'<p>New <strong>body</strong>.</p>' in client.get(f'/post/{post_id}').data
+
+def test_integration_comment_rate_limit(client):
+    """Test that a client commenting too fast on one post gets 429 with Retry-After."""
+    post_id = database.create_post('Post', 'Some content here.')
+    other_id = database.create_post('Other post', 'Some content here.')
+    comment = {'author': 'Reader', 'title': 'Comment', 'content': 'Comment text.'}
+    limited = comment_limiter.stats()['limited']
+    admitted = comment_admission.stats()['admitted']
+    
+    for _ in range(COMMENT_BURST):
+        assert client.post(f'/posts/{post_id}/comments', json=comment).status_code == 201
+    response = client.post(f'/posts/{post_id}/comments', json=comment)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert client.post(f'/post/{post_id}/comment', data=comment).status_code == 429
+    
+    # Other posts have their own buckets
+    assert client.post(f'/posts/{other_id}/comments', json=comment).status_code == 201
+    
+    stats = client.get('/api/ratelimit').get_json()
+    assert stats['limiter']['limited'] == limited + 2
+    assert stats['admission']['admitted'] == admitted + COMMENT_BURST + 1
+    assert 'blog_shed_writes_total' in client.get('/metrics').get_data(as_text=True)
+
+def test_integration_comment_admission(client, monkeypatch):
+    """Test that comment writes are shed when the admission queue is full."""
+    post_id = database.create_post('Post', 'Some content here.')
+    monkeypatch.setattr(comment_admission, 'acquire', lambda: False)
+    
+    response = client.post(f'/posts/{post_id}/comments',
+                           json={'author': 'Reader', 'content': 'Comment text.'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    assert database.get_comments_by_post(post_id) == []
+
+def test_integration_feeds(client, monkeypatch):
+    """Test the Atom feeds and the sitemap, and that writes update them."""
+    monkeypatch.setitem(app.config, 'SITE_URL', 'http://blog.example')
+    client.post('/create', data={'title': 'First post', 'content': 'Content of the first post.',
+                                 'tags': 'python'})
+    
+    response = client.get('/feed.xml')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/atom+xml'
+    assert b'<title>First post</title>' in response.data
+    assert b'<link href="http://blog.example/post/1"/>' in response.data
+    assert b'First post' in client.get('/tag/python/feed.xml').data
+    assert b'<loc>http://blog.example/post/1</loc>' in client.get('/sitemap.xml').data
+    # The Host header doesn't change the links, or rebuild the document
+    sitemap = client.get('/sitemap.xml', headers={'Host': 'evil.example'})
+    assert b'evil.example' not in sitemap.data
+    assert client.get('/tag/missing/feed.xml').status_code == 404
+    
+    # Served from memory until a write changes it
+    etag = response.headers['ETag']
+    assert client.get('/feed.xml', headers={'If-None-Match': etag}).status_code == 304
+    
+    client.post('/create', data={'title': 'Second <post>', 'content': 'Content of the second post.',
+                                 'tags': 'flask'})
+    response = client.get('/feed.xml', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.data.index(b'Second &lt;post&gt;') < response.data.index(b'First post')
+    assert b'/post/2' in client.get('/sitemap.xml').data
+    
+    client.post('/edit/1', data={'title': 'Edited post', 'content': 'Content of the first post.',
+                                 'tags': 'flask'})
+    assert b'Edited post' in client.get('/feed.xml').data
+    assert b'Edited post' in client.get('/tag/flask/feed.xml').data
+    assert client.get('/tag/python/feed.xml').status_code == 404
+
+def test_integration_feeds_need_site_url(client, monkeypatch):
+    """Test that feeds are off until the site's URL is configured."""
+    assert client.get('/feed.xml').status_code == 404
+    assert client.get('/sitemap.xml').status_code == 404
+    assert b'/feed.xml' not in client.get('/').data
+    
+    monkeypatch.setitem(app.config, 'SERVER_NAME', 'blog.example')
+    response = client.get('/sitemap.xml')
+    assert b'<loc>http://blog.example/</loc>' in response.data
+
+def test_integration_related_posts(client):
+    """Test related posts on the post page and in JSON, and that tag edits update them."""
+    for title, tags in (('Flask intro', 'python, flask'), ('Flask tips', 'python, flask'),
+                        ('Python basics', 'python'), ('Cooking', 'food')):
+        client.post('/create', data={'title': title, 'content': 'Some content here.', 'tags': tags})
+    
+    data = client.get('/posts/1/related').get_json()
+    assert [(post['title'], post['score']) for post in data['related']] == [
+        ('Flask tips', 1.0), ('Python basics', 0.5)]
+    assert b'Related Posts' in client.get('/post/1').data
+    assert b'Related Posts' not in client.get('/post/4').data
+    assert client.get('/posts/999/related').status_code == 404
+    
+    client.post('/edit/3', data={'title': 'Python basics', 'content': 'Some content here.',
+                                 'tags': 'python, flask, web'})
+    data = client.get('/posts/1/related').get_json()
+    assert [post['title'] for post in data['related']] == ['Flask tips', 'Python basics']
+    assert data['related'][1]['score'] == round(2 / 3, 4)
+
+def test_integration_related_posts_revalidate(client):
+    """Test that the post page's ETag and cached body change with its related posts."""
+    client.post('/create', data={'title': 'Flask intro', 'content': 'Some content here.',
+                                 'tags': 'flask'})
+    response = client.get('/post/1')
+    assert b'Related Posts' not in response.data
+    etag = response.headers['ETag']
+    
+    client.post('/create', data={'title': 'Flask tips', 'content': 'Some content here.',
+                                 'tags': 'flask'})
+    response = client.get('/post/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Flask tips' in response.data
+    
+    # Editing a related post's title reaches the pages listing it
+    etag = response.headers['ETag']
+    client.post('/edit/2', data={'title': 'Flask tricks', 'content': 'Some content here.',
+                                 'tags': 'flask'})
+    response = client.get('/post/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Flask tricks' in response.data
+
+def test_integration_popular_posts(client):
+    """Test that views are counted in memory and rank posts once flushed."""
+    first = database.create_post('First post', 'Some content here.')
+    second = database.create_post('Second post', 'Some content here.')
+    
+    for _ in range(3):
+        client.get(f'/post/{first}')
+    etag = client.get(f'/post/{second}').headers['ETag']
+    client.get(f'/post/{second}', headers={'If-None-Match': etag})
+    client.get('/post/999')
+    assert view_counter.pending() == {first: 3, second: 2}
+    assert b'No views counted yet' in client.get('/popular').data
+    
+    view_counter.flush()
+    assert view_counter.pending() == {}
+    data = client.get('/posts?sort=popular&limit=1&fields=title').get_json()
+    assert data['posts'][0]['title'] == 'First post'
+    assert data['posts'][0]['views'] == 3
+    assert 2.9 < data['posts'][0]['popularity'] <= 3
+    data = client.get(f'/posts?sort=popular&limit=1&fields=title&cursor={data["next_cursor"]}').get_json()
+    assert [post['title'] for post in data['posts']] == ['Second post']
+    assert data['next_cursor'] is None
+    
+    html = client.get('/popular').data
+    assert html.index(b'First post') < html.index(b'Second post')
+    assert b'3 views' in html
+    assert client.get('/posts?sort=oldest').status_code == 400
+    assert client.get('/api/views').get_json()['views'] == 5
+
+def test_create_app_defers_schema_to_first_request(tmp_path):
+    """Test that creating the app leaves the database alone until a request needs it."""
+    from app import create_app
+    
+    path = str(tmp_path / 'lazy.db')
+    try:
+        lazy_app = create_app({'DATABASE': path, 'TESTING': True})
+        assert not os.path.exists(path)
+        
+        with lazy_app.test_client() as lazy_client:
+            assert lazy_client.get('/').status_code == 200
+            assert path in database._schema_current
+            conn = database.get_db_connection()
+            assert database.get_schema_version(conn) == database.get_migrations()[-1][0]
+            conn.close()
+            assert lazy_client.get('/').status_code == 200
+    finally:
+        database._schema_current.discard(path)
+        database.close_pool()
+
+def test_integration_async_post_page_reads_snapshot(client, monkeypatch):
+    """Test that the async post page reads through the same routing as sync reads."""
+    monkeypatch.setattr(database, 'READ_ROUTING_ENABLED', True)
+    monkeypatch.setattr(database, 'READ_SNAPSHOT_INTERVAL', 3600)
+    monkeypatch.setitem(app.config, 'ASYNC_POST_PAGE', True)
+    post_id = database.create_post('Original', 'Some content here.')
+    client.get('/')
+    database.update_post(post_id, 'Edited', 'Some content here.')
+    
+    assert client.get(f'/posts/{post_id}').get_json()['title'] == 'Original'
+    assert b'Original' in client.get(f'/post/{post_id}').data
+    
+    # A session that wrote after the snapshot reads the primary
+    client.set_cookie('last_write', str(time.time()))
+    assert b'Edited' in client.get(f'/post/{post_id}').data
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+import async_database
+import database
+
+@pytest.fixture
+def test_db(test_db):
+    """Use a fresh database, and stop the workers after each test."""
+    yield
+    async_database.shutdown()
+
+def test_matches_sync_api(test_db):
+    """Test that the async functions return what the sync ones do."""
+    async def scenario():
+        post_id = await async_database.create_post_with_tags('Post', 'Content', ['a', 'b'])
+        await async_database.create_comment(post_id, 'Ann', 'Hi', 'Comment')
+        return post_id, await asyncio.gather(
+            async_database.get_post_by_id(post_id),
+            async_database.get_tags_for_post(post_id),
+            async_database.get_comments_by_post(post_id),
+            async_database.get_all_posts())
+
+    post_id, (post, tags, comments, posts) = asyncio.run(scenario())
+    assert dict(post) == dict(database.get_post_by_id(post_id))
+    assert sorted(tag['name'] for tag in tags) == ['a', 'b']
+    assert [comment['content'] for comment in comments] == ['Comment']
+    assert [dict(row) for row in posts] == [dict(row) for row in database.get_all_posts()]
+
+def test_workers_have_their_own_connections(test_db):
+    """Test that async calls don't wait on connections held elsewhere."""
+    database.create_post('Post', 'Content')
+    held = [database.get_pool().acquire() for _ in range(database.POOL_SIZE)]
+    try:
+        async def scenario():
+            return await asyncio.gather(*[async_database.get_all_posts() for _ in range(20)])
+        results = asyncio.run(scenario())
+    finally:
+        for conn in held:
+            conn.close()
+    assert all(len(posts) == 1 for posts in results)
+    assert async_database.get_pool().stats()['peak_in_use'] <= async_database.MAX_WORKERS
+
+def test_calls_see_context_variables(test_db):
+    """Test that the caller's context variables are visible on the workers."""
+    import contextvars
+    request_id = contextvars.ContextVar('request_id', default=None)
+    
+    def read_request_id():
+        return request_id.get()
+    
+    async def scenario():
+        request_id.set('abc')
+        return await async_database.run(read_request_id)
+    assert asyncio.run(scenario()) == 'abc'
@@ -0,0 +1,100 @@
+import io
+import json
+import os
+
+import bulk
+import database
+
+from conftest import TEST_DB
+
+def test_import_ndjson(test_db):
+    """NDJSON records are imported with their tags and comments."""
+    database.create_tag('python')
+    lines = [
+        json.dumps({'title': 'First', 'content': 'One two three', 'created_at': '2024-01-01 10:00:00',
+                    'tags': ['python', 'flask'],
+                    'comments': [{'author': 'Ann', 'title': 'Hi', 'content': 'Nice'}]}),
+        '',
+        json.dumps({'title': 'Second', 'content': 'Four five', 'tags': ['flask']}),
+        json.dumps({'title': '', 'content': 'No title'}),
+    ]
+    stats = bulk.import_posts(bulk.read_ndjson(lines), batch_size=2)
+    assert stats == {'posts': 2, 'tags': 3, 'comments': 1, 'skipped': 1}
+
+    posts = database.get_all_posts()
+    assert [post['title'] for post in posts] == ['Second', 'First']
+    first = posts[1]
+    assert first['created_at'] == '2024-01-01 10:00:00'
+    assert first['word_count'] == 3
+    assert first['comment_count'] == 1
+    assert sorted(tag['name'] for tag in database.get_tags_for_post(first['id'])) == ['flask', 'python']
+    assert len(database.get_posts_by_tag('flask')) == 2
+    assert len(database.get_all_tags()) == 2
+
+def test_import_csv(test_db):
+    """CSV rows are imported with a comma-separated tags column."""
+    data = io.StringIO('title,content,tags\nHello,"Body, with comma","python, sqlite"\n')
+    stats = bulk.import_posts(bulk.read_csv(data))
+    assert stats['posts'] == 1
+    post = database.get_all_posts()[0]
+    assert database.get_post_by_id(post['id'])['content'] == 'Body, with comma'
+    assert sorted(tag['name'] for tag in database.get_tags_for_post(post['id'])) == ['python', 'sqlite']
+
+def test_import_skips_invalid_comments(test_db):
+    """Invalid comments, or replies to anything but an earlier comment, are skipped."""
+    comment = {'author': 'Ann', 'title': 'Hi', 'content': 'Nice'}
+    record = {'title': 'Post', 'content': 'Body', 'comments': [
+        comment,
+        dict(comment, reply_to=5),
+        dict(comment, reply_to=-1),
+        dict(comment, reply_to='0'),
+        dict(comment, reply_to=1),
+        dict(comment, reply_to=0),
+        dict(comment, author=None),
+        dict(comment, content=''),
+        dict(comment, created_at='yesterday'),
+        dict(comment, reply_to=6),
+    ]}
+    stats = bulk.import_posts([record])
+    assert stats == {'posts': 1, 'tags': 0, 'comments': 2, 'skipped': 8}
+
+    comments = database.get_comments_by_post(database.get_all_posts()[0]['id'])
+    assert len(comments) == 2
+    assert comments[1]['parent_id'] == comments[0]['id']
+
+def test_import_normalizes_created_at(test_db):
+    """created_at is stored in SQLite's format, and records where it doesn't parse are skipped."""
+    stats = bulk.import_posts([
+        {'title': 'Offset', 'content': 'Body', 'created_at': '2024-01-31T14:00:00+02:00'},
+        {'title': 'Bad date', 'content': 'Body', 'created_at': '31/01/2024 12:00'},
+        {'title': 'Not a string', 'content': 'Body', 'created_at': 20240131},
+    ])
+    assert stats == {'posts': 1, 'tags': 0, 'comments': 0, 'skipped': 2}
+    post = database.get_all_posts()[0]
+    assert post['created_at'] == post['updated_at'] == '2024-01-31 12:00:00'
+
+def test_export_round_trip(test_db):
+    """An export can be imported again without losing anything."""
+    post_id = database.create_post_with_tags('Post', 'Content here', ['a', 'b'])
+    comment_id = database.create_comment(post_id, 'Ann', 'Title', 'Comment')
+    database.create_comment(post_id, 'Bob', 'Other', 'Second thread')
+    database.create_comment(post_id, 'Cy', 'Re', 'Reply', parent_id=comment_id)
+    database.create_post('Untagged', 'Other content')
+
+    out = io.StringIO()
+    assert bulk.export_posts(out, batch_size=1) == 2
+    exported = out.getvalue()
+    records = [json.loads(line) for line in exported.splitlines()]
+    assert [record['title'] for record in records] == ['Post', 'Untagged']
+    assert records[0]['tags'] == ['a', 'b']
+    assert [comment['content'] for comment in records[0]['comments']] == [
+        'Comment', 'Reply', 'Second thread']
+    assert records[0]['comments'][1]['reply_to'] == 0
+
+    database.close_pool()
+    os.remove(TEST_DB)
+    database.init_db()
+    bulk.import_posts(bulk.read_ndjson(exported.splitlines()))
+    again = io.StringIO()
+    bulk.export_posts(again)
+    assert again.getvalue() == exported
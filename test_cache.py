@@ -0,0 +1,57 @@
+import time
+from cache import PageCache
+
+
+def test_get_and_set():
+    """Test storing and reading back a page."""
+    cache = PageCache()
+    assert cache.get(('home', b'')) is None
+    cache.set(('home', b''), b'<html>')
+    assert cache.get(('home', b'')) == b'<html>'
+    
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['bytes'] == 6
+
+def test_lru_eviction_by_size():
+    """Test that the least recently used pages are evicted to stay in budget."""
+    cache = PageCache(max_bytes=10)
+    cache.set(('a', b''), b'aaaa')
+    cache.set(('b', b''), b'bbbb')
+    cache.get(('a', b''))  # 'b' is now least recently used
+    cache.set(('c', b''), b'cccc')
+    
+    assert cache.get(('b', b'')) is None
+    assert cache.get(('a', b'')) == b'aaaa'
+    assert cache.get(('c', b'')) == b'cccc'
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] == 8
+
+def test_oversized_values_are_not_cached():
+    """Test that a page larger than the whole cache is skipped."""
+    cache = PageCache(max_bytes=4)
+    cache.set(('a', b''), b'too large')
+    assert cache.get(('a', b'')) is None
+    assert cache.stats()['bytes'] == 0
+
+def test_ttl_expiry():
+    """Test that pages expire after the TTL."""
+    cache = PageCache(ttl=0.05)
+    cache.set(('a', b''), b'page')
+    time.sleep(0.1)
+    assert cache.get(('a', b'')) is None
+    assert cache.stats()['expirations'] == 1
+
+def test_invalidate_group():
+    """Test that invalidating a group drops all of its variants only."""
+    cache = PageCache()
+    cache.set(('home', b''), b'page 1')
+    cache.set(('home', b'cursor=x'), b'page 2')
+    cache.set(('post:1', b''), b'post')
+    
+    cache.invalidate('home', 'tag:unused')
+    assert cache.get(('home', b'')) is None
+    assert cache.get(('home', b'cursor=x')) is None
+    assert cache.get(('post:1', b'')) == b'post'
+    assert cache.stats()['invalidations'] == 2
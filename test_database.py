@@ -1,23 +1,11 @@
 import pytest
 import os
+import sqlite3
+import threading
+import time
 import database
 
-TEST_DB = 'test_blog.db'
-
-@pytest.fixture
-def test_db():
-    """Create a test database for each test."""
-    # Use test database
-    database.DATABASE_NAME = TEST_DB
-    
-    # Initialize test database
-    database.init_db()
-    
-    yield
-    
-    # Clean up after test
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
+from conftest import TEST_DB
 
 def test_create_and_get_post(test_db):
     """Test creating and retrieving a post."""
@@ -28,7 +16,8 @@ def test_create_and_get_post(test_db):
     posts = database.get_all_posts()
     assert len(posts) == 1
     assert posts[0]['title'] == "Test Post"
-    assert posts[0]['content'] == "This is test content"
+    assert posts[0]['excerpt'] == "This is test content"
+    assert database.get_post_by_id(posts[0]['id'])['content'] == "This is test content"
 
 def test_get_post_by_id(test_db):
     """Test retrieving a post by ID."""
@@ -93,6 +82,22 @@ def test_create_and_get_tags(test_db):
     assert "python" in tag_names
     assert "flask" in tag_names
 
+def test_get_tags_for_posts(test_db):
+    """Test fetching tags for several posts at once."""
+    database.create_post("Post 1", "Content 1")
+    database.create_post("Post 2", "Content 2")
+    database.create_post("Post 3", "Content 3")
+    posts = database.get_all_posts()
+    database.add_tag_to_post(posts[0]['id'], "python")
+    database.add_tag_to_post(posts[0]['id'], "flask")
+    database.add_tag_to_post(posts[1]['id'], "python")
+    
+    tags = database.get_tags_for_posts([post['id'] for post in posts])
+    assert sorted(tag['name'] for tag in tags[posts[0]['id']]) == ["flask", "python"]
+    assert [tag['name'] for tag in tags[posts[1]['id']]] == ["python"]
+    assert tags[posts[2]['id']] == []
+    assert database.get_tags_for_posts([]) == {}
+
 def test_get_posts_by_tag(test_db):
     """Test retrieving posts by tag."""
     # Create posts with tags
@@ -154,3 +159,465 @@ def test_post_ordering(test_db):
     # Since all created quickly, we check IDs are descending
     assert posts[0]['id'] > posts[1]['id']
     assert posts[1]['id'] > posts[2]['id']
+
+def test_pool_reuses_connections(test_db):
+    """Test that closing a pooled connection returns it for reuse."""
+    pool = database.get_pool()
+    checkouts = pool.stats()['checkouts']
+    conn = database.get_db_connection()
+    conn.close()
+    assert database.get_db_connection() is conn
+    conn.close()
+    
+    stats = pool.stats()
+    assert stats['checkouts'] == checkouts + 2
+    assert stats['open'] == 1
+    assert stats['in_use'] == 0
+
+def test_pool_waits_for_free_connection(test_db):
+    """Test that an exhausted pool blocks until a connection is released."""
+    import threading
+    
+    pool = database.ConnectionPool(TEST_DB, size=1, timeout=5)
+    conn = pool.acquire()
+    threading.Timer(0.1, conn.close).start()
+    
+    # Blocks until the timer releases the only connection
+    assert pool.acquire() is conn
+    stats = pool.stats()
+    assert stats['waits'] == 1
+    assert stats['peak_in_use'] == 1
+    pool.close()
+
+def test_pool_timeout(test_db):
+    """Test that an exhausted pool raises after the timeout."""
+    pool = database.ConnectionPool(TEST_DB, size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(database.PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    conn.close()
+    pool.close()
+
+def test_get_all_posts_keyset_pages(test_db):
+    """Test paging through posts with a (created_at, id) keyset."""
+    for i in range(5):
+        database.create_post(f"Post {i}", "Content")
+    
+    first_page = database.get_all_posts(limit=2)
+    assert [post['title'] for post in first_page] == ["Post 4", "Post 3"]
+    
+    last = first_page[-1]
+    second_page = database.get_all_posts(limit=2, before=(last['created_at'], last['id']))
+    assert [post['title'] for post in second_page] == ["Post 2", "Post 1"]
+    
+    last = second_page[-1]
+    final_page = database.get_all_posts(limit=2, before=(last['created_at'], last['id']))
+    assert [post['title'] for post in final_page] == ["Post 0"]
+
+def test_get_posts_by_tag_keyset_pages(test_db):
+    """Test paging through a tag's posts."""
+    for i in range(3):
+        database.create_post(f"Post {i}", "Content")
+    for post in database.get_all_posts():
+        database.add_tag_to_post(post['id'], "python")
+    
+    first_page = database.get_posts_by_tag("python", limit=2)
+    assert [post['title'] for post in first_page] == ["Post 2", "Post 1"]
+    last = first_page[-1]
+    second_page = database.get_posts_by_tag("python", limit=2, before=(last['created_at'], last['id']))
+    assert [post['title'] for post in second_page] == ["Post 0"]
+
+def test_migrations_are_versioned(test_db):
+    """Test that init_db records the schema version and is idempotent."""
+    latest = database.get_migrations()[-1][0]
+    conn = database.get_db_connection()
+    assert database.get_schema_version(conn) == latest
+    assert database.migrate(conn) == []
+    conn.close()
+    
+    database.init_db()
+    conn = database.get_db_connection()
+    assert database.get_schema_version(conn) == latest
+    conn.close()
+
+def test_migrate_existing_database(test_db):
+    """Test upgrading a database created from the original schema."""
+    import sqlite3
+    
+    legacy_db = 'test_legacy_blog.db'
+    conn = sqlite3.connect(legacy_db)
+    with open(database.get_migrations()[0][1]) as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO posts (title, content) VALUES ('Old Post', 'Old content')")
+    conn.commit()
+    conn.close()
+    
+    try:
+        database.DATABASE_NAME = legacy_db
+        database.init_db()
+        posts = database.get_all_posts()
+        assert [post['title'] for post in posts] == ['Old Post']
+        
+        conn = database.get_db_connection()
+        indexes = {row['name'] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        conn.close()
+        assert 'idx_posts_created' in indexes
+    finally:
+        database.close_pool()
+        os.remove(legacy_db)
+
+def test_hot_queries_use_indexes(test_db):
+    """Test that the hot query paths are served by indexes."""
+    conn = database.get_db_connection()
+    
+    def plan(sql, params):
+        return ' '.join(row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+    
+    comments_plan = plan('SELECT * FROM comments WHERE post_id = ? ORDER BY created_at ASC, id ASC', (1,))
+    assert 'USING INDEX idx_comments_post_created' in comments_plan
+    assert 'TEMP B-TREE' not in comments_plan
+    
+    posts_plan = plan('SELECT * FROM posts ORDER BY created_at DESC, id DESC LIMIT ?', (20,))
+    assert 'USING INDEX idx_posts_created' in posts_plan
+    assert 'TEMP B-TREE' not in posts_plan
+    
+    page_plan = plan('SELECT * FROM posts WHERE (created_at, id) < (?, ?) '
+                     'ORDER BY created_at DESC, id DESC LIMIT ?', ('2025-01-01', 1, 20))
+    assert 'SEARCH posts USING INDEX idx_posts_created' in page_plan
+    
+    tag_plan = plan('''
+        SELECT p.* FROM posts p
+        JOIN post_tags pt ON p.id = pt.post_id
+        JOIN tags t ON pt.tag_id = t.id
+        WHERE t.name = ?
+    ''', ('python',))
+    assert 'USING COVERING INDEX idx_post_tags_tag' in tag_plan
+    conn.close()
+
+def test_search_posts_and_comments(test_db):
+    """Test that search finds posts and comments, ranking title matches first."""
+    database.create_post("Learning Flask", "A short intro to web apps")
+    database.create_post("Databases", "Flask works well with SQLite")
+    posts = database.get_all_posts()
+    database.create_comment(posts[0]['id'], "Alice", "Question", "Does flask scale?")
+    
+    results = database.search("flask")
+    assert len(results) == 3
+    assert results[0]['post_title'] == "Learning Flask"
+    assert results[0]['kind'] == 'post'
+    assert {result['kind'] for result in results} == {'post', 'comment'}
+    
+    marked = f"{database.HIGHLIGHT_START}Flask{database.HIGHLIGHT_END}"
+    assert marked in results[0]['title']
+
+def test_search_index_follows_updates(test_db):
+    """Test that triggers keep the search index in sync with edits."""
+    database.create_post("Original Title", "Talking about python")
+    post_id = database.get_all_posts()[0]['id']
+    
+    database.update_post(post_id, "Updated Title", "Talking about rust")
+    assert database.search("python") == []
+    assert [result['post_id'] for result in database.search("rust")] == [post_id]
+
+def test_search_treats_operators_literally(test_db):
+    """Test that FTS5 syntax in user input doesn't raise errors."""
+    database.create_post("Quotes", "Some \"quoted\" text OR NOT")
+    assert len(database.search('"quoted" OR (NOT')) == 1
+    assert database.search('   ') == []
+
+def test_updated_at_tracks_changes(test_db):
+    """Test that edits and tag changes bump a post's updated_at."""
+    database.create_post("Post", "Content")
+    post_id = database.get_all_posts()[0]['id']
+    
+    versions = [database.get_post_version(post_id)['updated_at']]
+    for change in (lambda: database.update_post(post_id, "Edited", "Content"),
+                   lambda: database.add_tag_to_post(post_id, "python"),
+                   lambda: database.remove_post_tags(post_id)):
+        time.sleep(0.002)
+        change()
+        versions.append(database.get_post_version(post_id)['updated_at'])
+    assert versions == sorted(set(versions))
+    assert database.get_site_version()['updated_at'] == versions[-1]
+
+def test_post_version_tracks_comments(test_db):
+    """Test that a post's version includes its latest comment."""
+    database.create_post("Post", "Content")
+    post_id = database.get_all_posts()[0]['id']
+    assert database.get_post_version(post_id)['last_comment_id'] is None
+    
+    database.create_comment(post_id, "Alice", "Hi", "Hello there")
+    comment_id = database.get_comments_by_post(post_id)[0]['id']
+    assert database.get_post_version(post_id)['last_comment_id'] == comment_id
+    assert database.get_site_version()['last_comment_id'] == comment_id
+    assert database.get_post_version(post_id + 1) is None
+
+def test_create_post_returns_id(test_db):
+    """Test that create_post returns the new post's id."""
+    post_id = database.create_post("New Post", "Content")
+    assert database.get_post_by_id(post_id)['title'] == "New Post"
+
+def test_create_post_with_tags(test_db):
+    """Test creating a post and its tags together."""
+    database.create_tag("python")
+    post_id = database.create_post_with_tags("Tagged", "Content", ["python", "flask", "python"])
+    
+    tag_names = sorted(tag['name'] for tag in database.get_tags_for_post(post_id))
+    assert tag_names == ["flask", "python"]
+    assert len(database.get_all_tags()) == 2
+
+def test_create_post_with_tags_is_atomic(test_db):
+    """Test that a failure while tagging leaves no half-created post."""
+    import sqlite3
+    
+    # A value SQLite can't bind fails after the post row was inserted
+    with pytest.raises(sqlite3.Error):
+        database.create_post_with_tags("Broken", "Content", ["python", object()])
+    assert database.get_all_posts() == []
+    assert database.get_all_tags() == []
+
+def test_replace_post_tags(test_db):
+    """Test replacing a post's tags with a diff."""
+    post_id = database.create_post_with_tags("Post", "Content", ["python", "flask"])
+    
+    old_tags = database.replace_post_tags(post_id, ["python", "sqlite"])
+    assert sorted(old_tags) == ["flask", "python"]
+    tag_names = sorted(tag['name'] for tag in database.get_tags_for_post(post_id))
+    assert tag_names == ["python", "sqlite"]
+    
+    assert sorted(database.replace_post_tags(post_id, [])) == ["python", "sqlite"]
+    assert database.get_tags_for_post(post_id) == []
+
+def test_connection_profile_pragmas(test_db):
+    """Test that new connections get the configured pragmas."""
+    conn = database.get_db_connection()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    conn.close()
+
+def test_add_tag_to_post_twice(test_db):
+    """Test that adding the same tag twice keeps a single association."""
+    post_id = database.create_post("Post", "Content")
+    database.add_tag_to_post(post_id, "python")
+    database.add_tag_to_post(post_id, "python")
+    database.create_tag("python")
+    assert [tag['name'] for tag in database.get_tags_for_post(post_id)] == ["python"]
+
+def test_write_queue_groups_concurrent_writes(test_db, monkeypatch):
+    """Test that concurrent writers are committed together in fewer transactions."""
+    import threading
+    
+    monkeypatch.setattr(database, 'WRITE_QUEUE_ENABLED', True)
+    writes = database.WriteQueue()
+    monkeypatch.setattr(database, 'write_queue', writes)
+    post_id = database.create_post("Busy Post", "Content")
+    
+    start = threading.Barrier(20)
+    def comment(i):
+        start.wait()
+        database.create_comment(post_id, f"Reader {i}", "Hi", "Nice post")
+    threads = [threading.Thread(target=comment, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writes.stop()
+    
+    assert len(database.get_comments_by_post(post_id)) == 20
+    stats = writes.stats()
+    assert stats['writes'] == 21
+    assert stats['batches'] < stats['writes']
+
+def test_write_queue_isolates_failures(test_db):
+    """Test that a failing write doesn't roll back the rest of its group."""
+    writes = database.WriteQueue()
+    post_id = writes.submit(lambda conn: database._insert_post(conn, "Kept", "Content"))
+    
+    def failing(conn):
+        database._insert_post(conn, "Dropped", "Content")
+        raise ValueError("boom")
+    with pytest.raises(ValueError):
+        writes.submit(failing)
+    writes.stop()
+    
+    assert [post['id'] for post in database.get_all_posts()] == [post_id]
+    assert writes.stats()['errors'] == 1
+
+def test_query_recording(test_db):
+    """Test that a connection with a query list records statements and rows."""
+    database.create_post("Post 1", "Content")
+    database.create_post("Post 2", "Content")
+    
+    conn = database.get_db_connection()
+    conn.queries = []
+    conn.execute('SELECT * FROM posts').fetchall()
+    conn.execute('SELECT * FROM posts WHERE id = ?', (1,)).fetchone()
+    list(conn.execute('SELECT id FROM posts'))
+    conn.execute("UPDATE posts SET title = 'Edited'")
+    queries = conn.queries
+    conn.close()
+    
+    assert [query['rows'] for query in queries] == [2, 1, 2, 2]
+    assert queries[1]['sql'] == 'SELECT * FROM posts WHERE id = ?'
+    assert all(query['duration'] >= 0 for query in queries)
+    
+    # Returning the connection to the pool stops the recording
+    conn = database.get_db_connection()
+    assert conn.queries is None
+    conn.close()
+
+def test_post_summary_columns(test_db):
+    """Test that listings return stored summaries instead of full content."""
+    long_content = "word " * 100
+    post_id = database.create_post("Long Post", long_content)
+    database.create_comment(post_id, "Alice", "Hi", "Hello there")
+    database.create_comment(post_id, "Bob", "Hey", "Nice post")
+    
+    post = database.get_all_posts()[0]
+    assert 'content' not in post.keys()
+    assert post['excerpt'] == long_content[:database.EXCERPT_LENGTH] + '...'
+    assert post['word_count'] == 100
+    assert post['comment_count'] == 2
+    
+    database.update_post(post_id, "Short Post", "Just three words")
+    post = database.get_all_posts(columns=('id', 'excerpt', 'word_count', 'content'))[0]
+    assert post['excerpt'] == "Just three words"
+    assert post['word_count'] == 3
+    assert post['content'] == "Just three words"
+
+def test_get_all_posts_rejects_unknown_columns(test_db):
+    """Test that only known post columns can be selected."""
+    with pytest.raises(ValueError):
+        database.get_all_posts(columns=('id', 'title; DROP TABLE posts'))
+
+def test_tag_stats(test_db):
+    """Test that tag post counts follow every way of changing a post's tags."""
+    first = database.create_post_with_tags("First", "Content", ["python", "flask"])
+    second = database.create_post("Second", "Content")
+    database.add_tag_to_post(second, "python")
+    database.add_tag_to_post(second, "python")
+    
+    stats = {tag['name']: tag for tag in database.get_tag_stats()}
+    assert {name: tag['post_count'] for name, tag in stats.items()} == {'flask': 1, 'python': 2}
+    assert stats['python']['last_used_at']
+    
+    database.replace_post_tags(first, ["python", "sqlite"])
+    database.remove_post_tags(second)
+    counts = {tag['name']: tag['post_count'] for tag in database.get_tag_stats()}
+    assert counts == {'python': 1, 'sqlite': 1}
+
+def test_read_routing(test_db, monkeypatch):
+    """Test that reads go to read-only connections that see committed writes."""
+    monkeypatch.setattr(database, 'READ_ROUTING_ENABLED', True)
+    database.create_post("Routed Post", "Content")
+    assert [post['title'] for post in database.get_all_posts()] == ["Routed Post"]
+    assert database.get_read_pool().stats()['checkouts'] > 0
+    
+    conn = database.get_read_connection()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM posts")
+    finally:
+        conn.close()
+
+def test_read_snapshot(test_db, monkeypatch):
+    """Test that snapshot reads lag until the snapshot is refreshed."""
+    monkeypatch.setattr(database, 'READ_ROUTING_ENABLED', True)
+    monkeypatch.setattr(database, 'READ_SNAPSHOT_INTERVAL', 3600)
+    database.create_post("First", "Content")
+    assert len(database.get_all_posts()) == 1
+    
+    database.create_post("Second", "Content")
+    written_at = time.time()
+    assert len(database.get_all_posts()) == 1
+    assert not database.reads_include(written_at)
+    
+    database.refresh_snapshot()
+    assert len(database.get_all_posts()) == 2
+    assert database.reads_include(written_at)
+
+def test_stale_snapshot_refreshed_in_background(test_db, monkeypatch):
+    """Test that a stale snapshot is replaced off the request path."""
+    monkeypatch.setattr(database, 'READ_ROUTING_ENABLED', True)
+    monkeypatch.setattr(database, 'READ_SNAPSHOT_INTERVAL', 3600)
+    database.create_post("First", "Content")
+    assert len(database.get_all_posts()) == 1
+    database.create_post("Second", "Content")
+    
+    started, release = threading.Event(), threading.Event()
+    refresh_snapshot = database.refresh_snapshot
+    def slow_refresh(wait=True):
+        started.set()
+        release.wait(5)
+        refresh_snapshot(wait)
+    monkeypatch.setattr(database, 'refresh_snapshot', slow_refresh)
+    monkeypatch.setattr(database, '_snapshot_taken_at', time.time() - 7200)
+    
+    # The copy is being made, but reads are served from the old one meanwhile
+    assert len(database.get_all_posts()) == 1
+    assert started.wait(5)
+    assert len(database.get_all_posts()) == 1
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == 'snapshot-refresh':
+            thread.join(5)
+    assert len(database.get_all_posts()) == 2
+
+def test_comment_threads(test_db):
+    """Test paging through top-level comments with their replies nested in order."""
+    post_id = database.create_post("Post", "Content")
+    other_post = database.create_post("Other", "Content")
+    first = database.create_comment(post_id, "Ann", "First", "Root one")
+    second = database.create_comment(post_id, "Bob", "Second", "Root two")
+    reply = database.create_comment(post_id, "Cy", "Re", "Reply to one", parent_id=first)
+    database.create_comment(post_id, "Di", "Re re", "Reply to reply", parent_id=reply)
+    database.create_comment(post_id, "Ed", "Re", "Reply to two", parent_id=second)
+    
+    roots, replies = database.get_comment_threads(post_id, limit=1)
+    assert [root['content'] for root in roots] == ["Root one"]
+    assert [r['content'] for r in replies] == ["Reply to one", "Reply to reply"]
+    
+    after = (roots[0]['created_at'], roots[0]['id'])
+    roots, replies = database.get_comment_threads(post_id, after=after)
+    assert [root['content'] for root in roots] == ["Root two"]
+    assert [r['content'] for r in replies] == ["Reply to two"]
+    
+    thread = database.get_thread(reply)
+    assert [comment['content'] for comment in thread] == ["Reply to one", "Reply to reply"]
+    assert database.get_post_by_id(post_id)['comment_count'] == 5
+    
+    with pytest.raises(ValueError):
+        database.create_comment(other_post, "Fay", "Re", "Wrong post", parent_id=first)
+
+def test_post_content_html(test_db):
+    """Test that post bodies are rendered to HTML when written and backfilled."""
+    post_id = database.create_post('Post', 'Some **bold** <b>text</b>.')
+    post = database.get_post_by_id(post_id)
+    assert post['content_html'] == '<p>Some <strong>bold</strong> &lt;b&gt;text&lt;/b&gt;.</p>'
+    
+    database.update_post(post_id, 'Post', '# Heading')
+    assert database.get_post_by_id(post_id)['content_html'] == '<h1>Heading</h1>'
+    
+    conn = database.get_db_connection()
+    conn.execute('UPDATE posts SET content_html = NULL')
+    conn.commit()
+    assert database.render_missing_html(conn, batch_size=1) == 1
+    conn.close()
+    assert database.get_post_by_id(post_id)['content_html'] == '<h1>Heading</h1>'
+
+def test_ensure_schema_migrates_once(test_db, monkeypatch):
+    """Test that ensure_schema upgrades an old database, then only checks a set."""
+    conn = database.get_db_connection()
+    conn.execute('PRAGMA user_version = 8')
+    conn.execute('DROP TABLE post_stats')
+    conn.close()
+    database._schema_current.discard(database.DATABASE_NAME)
+    
+    database.ensure_schema()
+    assert database.get_popular_posts() == []
+    
+    monkeypatch.setattr(database, 'get_pool', None)  # Any database access would fail
+    database.ensure_schema()
@@ -0,0 +1,43 @@
+import database
+from feeds import FeedStore
+
+def test_feed_keeps_newest_entries(test_db):
+    """A feed holds the newest size posts, updated without reloading."""
+    for i in range(3):
+        database.create_post(f'Post {i}', 'Some content.')
+    feeds = FeedStore(size=2)
+    body = feeds.atom('https://blog.example/').body
+    assert b'Post 2' in body and b'Post 1' in body and b'Post 0' not in body
+    assert b'<id>https://blog.example/feed.xml</id>' in body
+
+    post_id = database.create_post('Post 3', 'Some content.')
+    feeds.post_changed(post_id)
+    body = feeds.atom('https://blog.example/').body
+    assert body.index(b'Post 3') < body.index(b'Post 2')
+    assert b'Post 1' not in body
+
+    # Editing a post that fell off the feed leaves it off
+    database.update_post(1, 'Edited', 'Some content.')
+    feeds.post_changed(1)
+    assert b'Edited' not in feeds.atom('https://blog.example/').body
+    assert b'/post/1</loc>' in feeds.sitemap('https://blog.example/').body
+
+def test_feed_etag_changes_with_content(test_db):
+    """The ETag and Last-Modified follow the feed's content."""
+    post_id = database.create_post('Post', 'Some content.')
+    feeds = FeedStore()
+    document = feeds.atom('http://localhost/')
+    assert feeds.atom('http://localhost/').etag == document.etag
+
+    database.update_post(post_id, 'Edited', 'Some content.')
+    feeds.post_changed(post_id)
+    updated = feeds.atom('http://localhost/')
+    assert updated.etag != document.etag
+    assert updated.last_modified >= document.last_modified
+
+def test_feeds_rebuilt_when_stale(test_db):
+    """Writes from elsewhere show up once a feed is older than max_age."""
+    feeds = FeedStore(max_age=0)
+    assert b'<entry>' not in feeds.atom('http://localhost/').body
+    database.create_post('Post', 'Some content.')
+    assert b'<entry>' in feeds.atom('http://localhost/').body
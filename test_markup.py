@@ -0,0 +1,30 @@
+from markup import render_markdown
+
+
+def test_paragraphs_and_inline():
+    """Test paragraphs and inline formatting."""
+    html = render_markdown("Some **bold** and *italic* text\nwith `co*de*`.\n\nSecond paragraph.")
+    assert html == ('<p>Some <strong>bold</strong> and <em>italic</em> text with <code>co*de*</code>.</p>\n'
+                    '<p>Second paragraph.</p>')
+
+def test_blocks():
+    """Test headings, lists, quotes, rules and code blocks."""
+    html = render_markdown("# Title\n- one\n- two\n\n1. first\n2. second\n\n> quoted\n\n---\n"
+                           "```\n<b>code</b>\n```")
+    assert html == ('<h1>Title</h1>\n<ul><li>one</li><li>two</li></ul>\n'
+                    '<ol><li>first</li><li>second</li></ol>\n'
+                    '<blockquote><p>quoted</p></blockquote>\n<hr>\n'
+                    '<pre><code>&lt;b&gt;code&lt;/b&gt;</code></pre>')
+
+def test_links():
+    """Test that only safe link targets become links."""
+    assert render_markdown("[site](https://example.com/?a=1&b=2)") == (
+        '<p><a href="https://example.com/?a=1&amp;b=2" rel="nofollow">site</a></p>')
+    assert render_markdown("[bad](javascript:alert%281%29)") == '<p>bad</p>'
+    assert render_markdown("[home](/post/1)") == '<p><a href="/post/1" rel="nofollow">home</a></p>'
+
+def test_html_is_escaped():
+    """Test that raw HTML in the text can't get through."""
+    html = render_markdown('<script>alert("x")</script> <img src=x onerror=alert(1)>\x000\x00')
+    assert '<script>' not in html and '<img' not in html
+    assert '&lt;script&gt;' in html
@@ -0,0 +1,31 @@
+import metrics
+
+
+def test_counter_render():
+    """Test rendering a labelled counter."""
+    counter = metrics.Counter('hits_total', 'Hits.')
+    counter.inc(route='/')
+    counter.inc(2, route='/')
+    assert metrics.render(counter) == (
+        '# HELP hits_total Hits.\n'
+        '# TYPE hits_total counter\n'
+        'hits_total{route="/"} 3\n'
+    )
+
+def test_histogram_buckets_are_cumulative():
+    """Test that histogram buckets, sum and count are rendered."""
+    histogram = metrics.Histogram('latency_seconds', 'Latency.', [0.1, 1])
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, route='/')
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{route="/",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{route="/"} 5.55' in lines
+    assert 'latency_seconds_count{route="/"} 3' in lines
+
+def test_label_values_are_escaped():
+    """Test that quotes in label values can't break the format."""
+    counter = metrics.Counter('hits_total', 'Hits.')
+    counter.inc(route='/tag/"quoted"')
+    assert 'hits_total{route="/tag/\\"quoted\\""} 1' in counter.render()
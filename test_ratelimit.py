@@ -0,0 +1,77 @@
+import threading
+
+from ratelimit import AdmissionQueue, MemoryBackend, RateLimiter, SQLiteBackend
+
+
+def test_token_bucket_refills():
+    """Test that a bucket allows a burst, then refills at the rate."""
+    backend = MemoryBackend()
+    assert backend.take('a', 1.0, 2, now=0) == 0
+    assert backend.take('a', 1.0, 2, now=0) == 0
+    assert backend.take('a', 1.0, 2, now=0) == 1.0
+    assert backend.take('b', 1.0, 2, now=0) == 0
+    assert backend.take('a', 1.0, 2, now=1.0) == 0
+    assert backend.take('a', 1.0, 2, now=1.5) == 0.5
+
+def test_memory_backend_evicts_least_recently_used():
+    """Test that the oldest buckets are dropped once there are too many keys."""
+    backend = MemoryBackend(max_keys=2)
+    backend.take('a', 1.0, 2, now=0)
+    backend.take('b', 1.0, 2, now=0)
+    backend.take('a', 1.0, 2, now=0)
+    backend.take('c', 1.0, 2, now=0)
+    assert list(backend._buckets) == ['a', 'c']
+    assert backend.take('a', 1.0, 2, now=0) > 0
+    assert backend.take('b', 1.0, 2, now=0) == 0
+
+def test_sqlite_backend_is_shared(tmp_path):
+    """Test that limiters on the same file share their buckets."""
+    path = str(tmp_path / 'ratelimit.db')
+    first = RateLimiter(1 / 60, 2, SQLiteBackend(path))
+    second = RateLimiter(1 / 60, 2, SQLiteBackend(path))
+    assert first.hit('client:1') == 0
+    assert second.hit('client:1') == 0
+    assert first.hit('client:1') > 0
+    assert second.stats()['limited'] == 0
+    assert first.stats()['limited'] == 1
+    
+    first.reset()
+    assert second.hit('client:1') == 0
+
+def test_sqlite_backend_prunes_full_buckets(tmp_path):
+    """Test that take() periodically deletes buckets that have refilled."""
+    backend = SQLiteBackend(str(tmp_path / 'buckets.db'), prune_every=3)
+    assert backend.take('a', 1.0, 2, now=0) == 0
+    assert backend.take('b', 1.0, 2, now=0) == 0
+    assert backend.take('c', 1.0, 2, now=5) == 0  # Third call: a and b are full again
+    keys = [row[0] for row in backend._connection().execute('SELECT key FROM rate_buckets')]
+    assert keys == ['c']
+    assert backend.take('c', 1.0, 2, now=5) == 0
+    assert backend.take('c', 1.0, 2, now=5) == 1.0
+
+def test_admission_queue_sheds_load():
+    """Test that callers beyond the active and waiting bounds are turned away."""
+    admission = AdmissionQueue(max_active=1, max_waiting=1, timeout=5.0)
+    assert admission.acquire()
+    
+    waiter_admitted = []
+    waiter = threading.Thread(target=lambda: waiter_admitted.append(admission.acquire()))
+    waiter.start()
+    while admission.stats()['waiting'] == 0:
+        pass
+    assert not admission.acquire()  # Queue full
+    
+    admission.release()
+    waiter.join()
+    assert waiter_admitted == [True]
+    stats = admission.stats()
+    assert stats['admitted'] == 2
+    assert stats['rejected'] == 1
+    assert stats['active'] == 1
+
+def test_admission_queue_timeout():
+    """Test that a caller gives up after waiting timeout seconds."""
+    admission = AdmissionQueue(max_active=1, max_waiting=1, timeout=0.01)
+    assert admission.acquire()
+    assert not admission.acquire()
+    assert admission.stats()['timeouts'] == 1
@@ -0,0 +1,84 @@
+import random
+import threading
+
+from related import RelatedIndex
+
+
+def brute_force(post_tags, post_id, limit):
+    """Jaccard scores computed pairwise, for comparison."""
+    names = post_tags[post_id]
+    scores = []
+    for other, other_names in post_tags.items():
+        overlap = len(names & other_names)
+        if other != post_id and overlap:
+            scores.append(round(overlap / len(names | other_names), 4))
+    return sorted(scores, reverse=True)[:limit]
+
+def test_related_by_jaccard():
+    """Test ranking by tag overlap, most similar and then newest first."""
+    index = RelatedIndex(lambda: [('a', 1), ('b', 1), ('a', 2), ('b', 2), ('a', 3),
+                                  ('a', 4), ('b', 4), ('c', 4), ('z', 5)])
+    assert index.related(1) == [(2, 1.0), (4, 0.6667), (3, 0.5)]
+    assert index.related(5) == []
+    assert index.related(99) == []
+
+def test_matches_pairwise_scores():
+    """Test the bitmap ranking against pairwise Jaccard on random tags."""
+    rng = random.Random(0)
+    post_tags = {post_id: set(rng.sample('abcdefgh', rng.randint(1, 4))) for post_id in range(1, 300)}
+    index = RelatedIndex(lambda: [(name, post_id) for post_id, names in post_tags.items()
+                                  for name in names], limit=10)
+    for post_id in (1, 50, 299):
+        assert [score for _, score in index.related(post_id)] == brute_force(post_tags, post_id, 10)
+
+def test_add_and_remove_update_rankings():
+    """Test that tag writes change the rankings they affect."""
+    index = RelatedIndex(lambda: [('a', 1), ('b', 1), ('a', 2), ('c', 3)])
+    assert index.related(1) == [(2, 0.5)]
+    index.add(3, ['a', 'b'])
+    assert index.related(1) == [(3, 0.6667), (2, 0.5)]
+    index.remove(3, ['c'])
+    assert index.related(1) == [(3, 1.0), (2, 0.5)]
+    index.remove(2, ['a'])
+    assert index.related(1) == [(3, 1.0)]
+    assert index.related(2) == []
+
+def test_limit():
+    """Test that only the top limit posts are returned."""
+    index = RelatedIndex(lambda: [('a', post_id) for post_id in range(1, 10)], limit=3)
+    assert index.related(9) == [(8, 1.0), (7, 1.0), (6, 1.0)]
+
+def test_version_changes_with_rankings():
+    """Test that a post's version changes only when posts sharing its tags change."""
+    index = RelatedIndex(lambda: [('a', 1), ('a', 2), ('b', 3)])
+    first, other = index.version(1), index.version(3)
+    index.add(4, ['a'])
+    assert index.version(1) != first
+    assert index.version(3) == other
+    first = index.version(1)
+    index.touch(2)
+    assert index.version(1) != first
+
+def test_rebuild_serves_old_index_and_keeps_writes():
+    """Test that a rebuild doesn't block lookups and replays writes made meanwhile."""
+    postings = [('a', 1), ('a', 2)]
+    loading, release = threading.Event(), threading.Event()
+
+    def load():
+        if index._post_tags is not None:
+            loading.set()
+            release.wait(5)
+        return list(postings)
+
+    index = RelatedIndex(load, max_age=0)
+    assert index.related(1) == [(2, 1.0)]
+    builder = threading.Thread(target=index.related, args=(1,))
+    builder.start()
+    assert loading.wait(5)
+    # The stale index still answers, and a write lands on it and on the new one
+    assert index.related(1) == [(2, 1.0)]
+    index.add(3, ['a'])
+    release.set()
+    builder.join()
+    index.max_age = 300
+    assert index.related(1) == [(3, 1.0), (2, 1.0)]
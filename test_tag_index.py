@@ -0,0 +1,78 @@
+import threading
+
+from tag_index import TagIndex, page_ids, to_bitmaps
+
+
+def test_match_all_and_any():
+    """Test AND and OR across tags."""
+    index = TagIndex(lambda: [('a', 1), ('a', 2), ('b', 2), ('b', 3), ('c', 9)])
+    assert page_ids(index.match_all(['a', 'b']), 10) == [2]
+    assert page_ids(index.match_any(['a', 'b']), 10) == [3, 2, 1]
+    assert index.match_all(['a', 'missing']) == 0
+    assert index.match_all([]) == 0
+    assert index.has_tag('c')
+    assert not index.has_tag('missing')
+
+def test_add_and_remove():
+    """Test that tag writes update a loaded index."""
+    index = TagIndex(lambda: [('a', 1)])
+    assert index.has_tag('a')
+    index.add(5, ['a', 'b'])
+    assert page_ids(index.match_any(['a']), 10) == [5, 1]
+    assert page_ids(index.match_all(['a', 'b']), 10) == [5]
+
+    index.remove(5, ['a', 'b'])
+    index.remove(1, ['a'])
+    assert not index.has_tag('a')
+    assert not index.has_tag('b')
+
+def test_updates_before_load_come_from_load():
+    """Test that writes before the first load aren't applied twice."""
+    postings = [('a', 1)]
+    index = TagIndex(lambda: postings)
+    postings.append(('a', 2))
+    index.add(2, ['a'])
+    assert page_ids(index.match_all(['a']), 10) == [2, 1]
+
+def test_rebuilt_when_stale():
+    """Test that the index is rebuilt after max_age."""
+    postings = [('a', 1)]
+    index = TagIndex(lambda: postings, max_age=0)
+    assert index.has_tag('a')
+    postings[:] = [('b', 1)]
+    assert not index.has_tag('a')
+
+def test_rebuild_serves_old_index_and_keeps_writes():
+    """Test that a rebuild doesn't block lookups and replays writes made meanwhile."""
+    loading, release = threading.Event(), threading.Event()
+
+    def load():
+        if index._bitmaps is not None:
+            loading.set()
+            release.wait(5)
+        return [('a', 1)]
+
+    index = TagIndex(load, max_age=0)
+    assert index.has_tag('a')
+    builder = threading.Thread(target=index.has_tag, args=('a',))
+    builder.start()
+    assert loading.wait(5)
+    # The stale bitmaps still answer, and a write lands on them and on the new ones
+    assert index.has_tag('a')
+    index.add(2, ['b'])
+    release.set()
+    builder.join()
+    index.max_age = 300
+    assert page_ids(index.match_any(['a', 'b']), 10) == [2, 1]
+
+def test_page_ids():
+    """Test paging through a bitmap, highest id first."""
+    bits = sum(1 << post_id for post_id in (3, 7, 8, 100))
+    assert page_ids(bits, 2) == [100, 8]
+    assert page_ids(bits, 10, before_id=8) == [7, 3]
+    assert page_ids(0, 10) == []
+
+def test_to_bitmaps():
+    """Test building one bitmap per key from lists of post ids."""
+    bitmaps = to_bitmaps({'a': [3, 100], 'b': [0, 7, 8]})
+    assert bitmaps == {'a': (1 << 3) | (1 << 100), 'b': 1 | (1 << 7) | (1 << 8)}
@@ -0,0 +1,76 @@
+import math
+import os
+import threading
+
+import pytest
+
+import database
+import views
+from views import ViewCounter
+
+from conftest import TEST_DB
+
+def test_counts_across_threads(test_db):
+    """Views from many threads are buffered, then written in one flush."""
+    post_id = database.create_post('Post', 'Some content.')
+    counter = ViewCounter(shards=4, flush_interval=60)
+    threads = [threading.Thread(target=lambda: [counter.hit(post_id) for _ in range(100)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.pending() == {post_id: 800}
+    
+    assert counter.flush() == 1
+    counter.hit(post_id)
+    counter.stop()
+    assert database.get_popular_posts()[0]['views'] == 801
+    assert counter.stats()['flushes'] == 2
+
+def test_failed_flush_keeps_views(test_db, monkeypatch):
+    """Views are kept for the next flush when writing them fails."""
+    counter = ViewCounter(flush_interval=60)
+    counter.hit(1)
+    def fail(counts, log_weight, path=None):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(database, 'record_views', fail)
+    with pytest.raises(RuntimeError):
+        counter.flush()
+    assert counter.pending() == {1: 1}
+    assert counter.stats()['errors'] == 1
+
+def test_popularity_decays(test_db):
+    """Older views count for less, halving every HALF_LIFE."""
+    old = database.create_post('Old favourite', 'Some content.')
+    new = database.create_post('New hit', 'Some content.')
+    now = 1_700_000_000
+    database.record_views({old: 10}, views.log_weight(now - 2 * views.HALF_LIFE))
+    database.record_views({new: 3}, views.log_weight(now))
+    database.record_views({old: 2}, views.log_weight(now))
+    
+    posts = database.get_popular_posts()
+    assert [post['title'] for post in posts] == ['Old favourite', 'New hit']
+    assert posts[0]['views'] == 12
+    assert math.isclose(views.decayed_views(posts[0]['score'], now), 10 / 4 + 2)
+    assert math.isclose(views.decayed_views(posts[1]['score'], now), 3)
+
+def test_views_flush_to_the_database_they_were_counted_in(test_db, tmp_path):
+    """Views are written to the file they were counted against, never a new one."""
+    post_id = database.create_post('Post', 'Some content.')
+    counter = ViewCounter(flush_interval=60)
+    counter.hit(post_id)
+    
+    database.DATABASE_NAME = str(tmp_path / 'other.db')
+    assert counter.flush() == 1
+    database.DATABASE_NAME = TEST_DB
+    assert database.get_popular_posts()[0]['views'] == 1
+    
+    # A database removed since is neither written nor recreated
+    database.DATABASE_NAME = missing = str(tmp_path / 'missing.db')
+    counter.hit(post_id)
+    counter.stop()
+    assert not os.path.exists(missing)
+    assert counter.stats()['dropped'] == 1
+    assert counter.pending() == {}
+    database.DATABASE_NAME = TEST_DB
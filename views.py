@@ -0,0 +1,156 @@
+"""
+Buffered post view counting.
+
+ViewCounter.hit() only bumps a number in memory. The counts are spread
+over shards by thread, each with its own lock, so request threads rarely
+wait on one another. A background thread swaps the shards out every
+flush_interval seconds and writes them to post_stats in one transaction,
+so a page view never writes to SQLite. Views are kept with the database
+file they were counted against, so a flush writes them there even if
+database.DATABASE_NAME has moved on; views for a file that is gone are
+dropped.
+
+Popularity decays exponentially with a half-life of HALF_LIFE seconds. It
+is kept in log space (see migration 0009), so a flush only adds the new
+views' weight and the stored scores stay comparable forever.
+"""
+import itertools
+import logging
+import math
+import threading
+import time
+
+import database
+
+logger = logging.getLogger(__name__)
+
+HALF_LIFE = 24 * 60 * 60
+DECAY_RATE = math.log(2) / HALF_LIFE
+
+
+def log_weight(now=None):
+    """The log-space weight of a view at time now (seconds since the epoch)."""
+    return DECAY_RATE * (time.time() if now is None else now)
+
+
+def decayed_views(score, now=None):
+    """Convert a stored score to views decayed to time now."""
+    return math.exp(score - log_weight(now))
+
+
+class ViewCounter:
+    """Counts views in memory and flushes them to post_stats in batches."""
+
+    def __init__(self, shards=16, flush_interval=5.0, on_flush=None):
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self._shards = [[{}, threading.Lock()] for _ in range(shards)]  # [counts, lock]
+        self._local = threading.local()
+        self._next_shard = itertools.count()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'views': 0, 'flushes': 0, 'rows_written': 0, 'errors': 0, 'dropped': 0}
+
+    def hit(self, post_id):
+        """Count one view of a post in the current database."""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            # Thread idents are aligned addresses, so hand out shards in turn instead
+            shard = self._local.shard = self._shards[next(self._next_shard) % len(self._shards)]
+        key = (database.DATABASE_NAME, post_id)
+        with shard[1]:
+            counts = shard[0]
+            counts[key] = counts.get(key, 0) + 1
+        if self._thread is None:
+            self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='view-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Writing view counts failed; retrying at the next flush')
+
+    def pending(self):
+        """Views counted but not yet written, by post id."""
+        merged = {}
+        for shard in self._shards:
+            with shard[1]:
+                for (_, post_id), views in shard[0].items():
+                    merged[post_id] = merged.get(post_id, 0) + views
+        return merged
+
+    def flush(self):
+        """Write buffered views to the database now; return the number of posts written."""
+        by_path = {}
+        for shard in self._shards:
+            with shard[1]:
+                counts, shard[0] = shard[0], {}
+            for (path, post_id), views in counts.items():
+                merged = by_path.setdefault(path, {})
+                merged[post_id] = merged.get(post_id, 0) + views
+        pending = list(by_path.items())
+        weight = log_weight()
+        rows = 0
+        for i, (path, merged) in enumerate(pending):
+            try:
+                database.record_views(merged, weight, path)
+            except FileNotFoundError:
+                logger.warning('Dropping %d views counted against missing database %s',
+                               sum(merged.values()), path)
+                with self._lock:
+                    self._stats['dropped'] += sum(merged.values())
+                continue
+            except Exception:
+                # Put the views back so the next flush writes them
+                self._restore(pending[i:])
+                with self._lock:
+                    self._stats['errors'] += 1
+                raise
+            rows += len(merged)
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['views'] += sum(merged.values())
+                self._stats['rows_written'] += len(merged)
+            if self.on_flush is not None:
+                self.on_flush(merged)
+        return rows
+
+    def _restore(self, pending):
+        shard = self._shards[0]
+        with shard[1]:
+            counts = shard[0]
+            for path, merged in pending:
+                for post_id, views in merged.items():
+                    key = (path, post_id)
+                    counts[key] = counts.get(key, 0) + views
+
+    def stop(self):
+        """Stop the flusher thread and write what is still buffered."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        self.flush()
+
+    def clear(self):
+        """Drop buffered views without writing them."""
+        for shard in self._shards:
+            with shard[1]:
+                shard[0] = {}
+
+    def stats(self):
+        """Return flush counters and the number of buffered views."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pending'] = sum(self.pending().values())
+        return stats